@@ -0,0 +1,59 @@
+"""Account access resolution.
+
+Each user's set of accessible account ids is cached in-process, keyed on the
+user's access_version. Every membership change bumps access_version on the users
+it affects, and the current user's row is loaded on every request anyway, so a
+stale entry is never used - in this worker or any other - without an extra query.
+Membership tests for other users and last-member checks are EXISTS / COUNT queries
+on user_accounts rather than loads of Account.users.
+"""
+import os
+from typing import FrozenSet, Iterable
+
+from fastapi import HTTPException
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import Session
+
+from api.cache import VersionedLRUCache
+from api.models import User, user_accounts
+
+ACCESS_CACHE_SIZE = int(os.getenv("ACCESS_CACHE_SIZE", "10000"))
+
+# user_id -> account ids, versioned by users.access_version
+_cache = VersionedLRUCache(ACCESS_CACHE_SIZE)
+
+def accessible_account_ids(db: Session, user: User) -> FrozenSet[int]:
+    """Ids of the accounts the user is a member of"""
+    # Resolve through the session the user was loaded from (the primary), never a lagging
+    # replica, so the cached set always matches access_version
+    db = Session.object_session(user) or db
+    version = user.access_version or 0
+    account_ids = _cache.get(user.id, version)
+    if account_ids is None:
+        account_ids = frozenset(db.execute(
+            select(user_accounts.c.account_id).where(user_accounts.c.user_id == user.id)
+        ).scalars())
+        _cache.put(user.id, version, account_ids)
+    return account_ids
+
+def require_account_access(db: Session, user: User, account_id: int) -> None:
+    """Raise 404 unless the user can access the account"""
+    if account_id not in accessible_account_ids(db, user):
+        raise HTTPException(status_code=404, detail="Account not found or not accessible")
+
+def is_account_member(db: Session, account_id: int, user_id: int) -> bool:
+    return db.query(exists().where(
+        user_accounts.c.account_id == account_id,
+        user_accounts.c.user_id == user_id
+    )).scalar()
+
+def account_member_count(db: Session, account_id: int) -> int:
+    return db.query(func.count()).select_from(user_accounts).filter(
+        user_accounts.c.account_id == account_id
+    ).scalar()
+
+def invalidate_account_access(db: Session, user_ids: Iterable[int]) -> None:
+    """Bump access_version for users whose memberships changed; the caller commits"""
+    db.query(User).filter(User.id.in_(list(user_ids))).update(
+        {User.access_version: User.access_version + 1}, synchronize_session="fetch"
+    )
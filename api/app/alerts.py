@@ -0,0 +1,64 @@
+"""Budget alerts: notice overspending as transactions come in.
+
+Database triggers on transactions (migration 0013) keep budget_spend, a running
+expense total per user, month, effective category and subcategory, by adding each
+statement's net change instead of re-summing the month. In the same statement they
+check only the budget entries the change touched in the current (UTC) month against
+the user's alert_thresholds (default 80% and 100% of budgeted_amount) and record any
+threshold crossed in budget_alerts. The unique constraint dedupes: an entry alerts at
+most once per threshold and month, whatever the ingest rate.
+
+Alerts are written undelivered; deliver_budget_alerts pushes them to the user's event
+streams as budget.threshold events after the write that fired them commits.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from api.events import publish_event
+from api.models import BudgetAlert
+from api.schemas import BudgetAlertResponse
+from api.serialization import response_dict
+
+DEFAULT_ALERT_THRESHOLDS = [80, 100]
+MAX_ALERT_THRESHOLD = 1000
+
+def normalize_thresholds(thresholds: List[int]) -> List[int]:
+    """Sorted, de-duplicated alert thresholds, or a 400 for values out of range"""
+    if not thresholds:
+        raise HTTPException(status_code=400, detail="alert_thresholds must not be empty")
+    if any(threshold < 1 or threshold > MAX_ALERT_THRESHOLD for threshold in thresholds):
+        raise HTTPException(status_code=400, detail=f"Alert thresholds must be between 1 and {MAX_ALERT_THRESHOLD} percent")
+    return sorted(set(thresholds))
+
+def deliver_budget_alerts(db: Session, user_id: int) -> List[Dict[str, Any]]:
+    """Mark the user's undelivered alerts delivered and publish them. Call after committing
+    a transaction write; commits. Returns the alerts published."""
+    alerts = db.query(BudgetAlert).filter(
+        BudgetAlert.user_id == user_id,
+        BudgetAlert.notified_at.is_(None)
+    ).order_by(BudgetAlert.id).with_for_update(skip_locked=True).all()
+    if not alerts:
+        return []
+    now = datetime.now(timezone.utc)
+    for alert in alerts:
+        alert.notified_at = now
+    payloads = [response_dict(BudgetAlertResponse, alert) for alert in alerts]
+    db.commit()
+    for payload in payloads:
+        publish_event(user_id, "budget.threshold", payload)
+    return payloads
+
+def list_budget_alerts(db: Session, user_id: int, year: Optional[int] = None, month: Optional[int] = None) -> List[BudgetAlert]:
+    """The user's alerts, newest first, optionally for one month"""
+    query = db.query(BudgetAlert).filter(BudgetAlert.user_id == user_id)
+    if year is not None and month is not None:
+        query = query.filter(BudgetAlert.month == datetime(year, month, 1).date())
+    elif year is not None:
+        query = query.filter(
+            BudgetAlert.month >= datetime(year, 1, 1).date(),
+            BudgetAlert.month < datetime(year + 1, 1, 1).date()
+        )
+    return query.order_by(BudgetAlert.created_at.desc(), BudgetAlert.id.desc()).all()
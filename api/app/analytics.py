@@ -0,0 +1,125 @@
+"""Spending roll-ups for a single user or a household.
+
+A household is everyone sharing the caller's accounts: its transactions are all
+transactions on the caller's accessible accounts, whichever member created them.
+Each transaction is selected once through `account_id IN (...)`, so shared accounts
+are never double counted the way a join through user_accounts would.
+
+Household roll-ups are cached per household: the key is the account-id set plus the
+query parameters, the version is each account's data_version, which database
+triggers bump on every transaction insert/update/delete (migration 0008). Category
+names aren't part of that version, so totals are cached by category id and named
+when served.
+"""
+import os
+from decimal import Decimal
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from api.access import accessible_account_ids
+from api.cache import VersionedLRUCache
+from api.models import Account, Category, Merchant, Transaction, User, transaction_allocations
+
+HOUSEHOLD_CACHE_SIZE = int(os.getenv("HOUSEHOLD_CACHE_SIZE", "1000"))
+
+_household_cache = VersionedLRUCache(HOUSEHOLD_CACHE_SIZE)
+
+def transaction_scope(db: Session, user: User, household: bool = False, source=Transaction):
+    """Filter clause selecting the user's own transactions, or the household's. source is
+    Transaction or transaction_allocations.c."""
+    if household:
+        return source.account_id.in_(accessible_account_ids(db, user))
+    return source.user_id == user.id
+
+def household_version(db: Session, account_ids: FrozenSet[int]) -> Tuple[Tuple[int, int], ...]:
+    """(account_id, data_version) pairs - changes whenever any household transaction does"""
+    if not account_ids:
+        return ()
+    return tuple(db.query(Account.id, Account.data_version).filter(
+        Account.id.in_(account_ids)
+    ).order_by(Account.id).all())
+
+def _expense_allocations(db: Session, scope, start_date: Optional[str], end_date: Optional[str], *columns):
+    """Query of columns over the expense rows of transaction_allocations in scope and range"""
+    allocations = transaction_allocations.c
+    query = db.query(*columns).select_from(transaction_allocations).filter(
+        scope,
+        allocations.amount < 0  # Only expenses
+    )
+    if start_date:
+        query = query.filter(allocations.date >= start_date)
+    if end_date:
+        query = query.filter(allocations.date <= end_date)
+    return query
+
+def spending_by_category(db: Session, scope, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, Decimal]:
+    """Expense totals by category name in one aggregate query over transaction_allocations,
+    so splits count in their own categories (effective category, else Uncategorized)"""
+    allocations = transaction_allocations.c
+    category_name = func.coalesce(Category.name, "Uncategorized")
+    query = _expense_allocations(
+        db, scope, start_date, end_date, category_name, func.sum(func.abs(allocations.amount))
+    ).outerjoin(Category, allocations.category_id == Category.id)
+    return {name: total for name, total in query.group_by(category_name)}
+
+def _spending_by_category_id(db: Session, scope, start_date: Optional[str], end_date: Optional[str]) -> Dict[Optional[int], Decimal]:
+    """Expense totals by effective category id (None: uncategorized)"""
+    allocations = transaction_allocations.c
+    query = _expense_allocations(
+        db, scope, start_date, end_date, allocations.category_id, func.sum(func.abs(allocations.amount))
+    )
+    return dict(query.group_by(allocations.category_id).all())
+
+def _by_category_name(db: Session, totals: Dict[Optional[int], Decimal]) -> Dict[str, Decimal]:
+    """Totals by category id as totals by current category name, like spending_by_category"""
+    ids = [category_id for category_id in totals if category_id is not None]
+    names = dict(db.query(Category.id, Category.name).filter(Category.id.in_(ids)).all()) if ids else {}
+    spending: Dict[str, Decimal] = {}
+    for category_id, total in totals.items():
+        # Categories deleted since the totals were cached count as uncategorized
+        name = names.get(category_id, "Uncategorized")
+        spending[name] = spending.get(name, Decimal("0")) + total
+    return spending
+
+def spending_by_merchant(db: Session, scope, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, Decimal]:
+    """Expense totals by merchant display name, grouped on merchant_id (no merchant: Unknown)"""
+    query = db.query(
+        Transaction.merchant_id,
+        func.sum(func.abs(Transaction.amount)).label("total")
+    ).filter(
+        scope,
+        Transaction.amount < 0  # Only expenses
+    )
+
+    if start_date:
+        query = query.filter(Transaction.date >= start_date)
+    if end_date:
+        query = query.filter(Transaction.date <= end_date)
+
+    # Group on the integer id first, then look up the few names
+    totals = query.group_by(Transaction.merchant_id).subquery()
+    rows = db.query(
+        func.coalesce(Merchant.display_name, "Unknown"),
+        totals.c.total
+    ).select_from(totals).outerjoin(
+        Merchant, totals.c.merchant_id == Merchant.id
+    ).order_by(totals.c.total.desc())
+    spending: Dict[str, Decimal] = {}
+    for name, total in rows:
+        # Distinct merchants can share a display name
+        spending[name] = spending.get(name, Decimal("0")) + total
+    return spending
+
+def household_spending_by_category(db: Session, user: User, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, Decimal]:
+    """spending_by_category over the household, served from cache while no household transaction changed"""
+    account_ids = accessible_account_ids(db, user)
+    key = ("spending_by_category", account_ids, start_date, end_date)
+    version = household_version(db, account_ids)
+    # Cached by category id: renaming a category changes no transaction, so names are looked up each time
+    totals = _household_cache.get(key, version)
+    if totals is None:
+        totals = _spending_by_category_id(db, transaction_allocations.c.account_id.in_(account_ids), start_date, end_date)
+        _household_cache.put(key, version, totals)
+    return _by_category_name(db, totals)
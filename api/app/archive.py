@@ -0,0 +1,334 @@
+"""Cold-storage archive for old transactions.
+
+The archive job moves transactions dated before the archive cutoff - the start of
+the month ARCHIVE_HORIZON_MONTHS ago - out of the hot transactions table. Each
+user's transactions on one account for one month become a single
+transaction_archive_chunks row holding a zstd-compressed Parquet file with every
+column (and the transactions' splits), and their totals per effective category -
+splits in their own categories - are added to
+transaction_archive_rollups, which stays queryable with plain SQL and through
+GET /transactions/archive/monthly. Each chunk is moved with one DELETE ... RETURNING
+in the same database transaction as the chunk insert, so a row is always either live
+or archived, never both.
+
+GET /transactions/ only reads the archive when the requested range starts before the
+cutoff (or has no start date). Raising ARCHIVE_HORIZON_MONTHS later moves the cutoff
+back; restore the months that became recent with `restore`, or they stop being listed.
+
+    python -m api.archive run
+    python -m api.archive restore --since 2024-01-01
+"""
+import argparse
+import io
+import logging
+import os
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from api.access import accessible_account_ids
+from api.database import SessionLocal
+from api.duplicates import row_fingerprint
+from api.models import Category, Transaction, TransactionArchiveChunk, TransactionArchiveRollup, TransactionSplit, User
+from api.merchants import merchant_source, normalize_merchant_name, resolve_merchants
+from api.partitions import next_period, period_start
+from api.serialization import related_response_dicts, transaction_record_to_dict
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_HORIZON_MONTHS = int(os.getenv("ARCHIVE_HORIZON_MONTHS", "13"))
+
+_TRANSACTION_COLUMNS = [column.name for column in Transaction.__table__.columns]
+
+def archive_cutoff(today: Optional[date] = None) -> date:
+    """Transactions dated before this (UTC) are archived"""
+    today = today or datetime.now(timezone.utc).date()
+    return next_period(period_start(today, "month"), "month", -ARCHIVE_HORIZON_MONTHS)
+
+def _utc_midnight(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+def _parse_bound(value: Optional[str]) -> Optional[datetime]:
+    """A start_date/end_date query value as PostgreSQL reads it (naive values are UTC)"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def needs_archive(start_date: Optional[str]) -> bool:
+    """Whether a listing starting at start_date can include archived transactions"""
+    start = _parse_bound(start_date)
+    return start is None or start < _utc_midnight(archive_cutoff())
+
+def encode_chunk(records: List[Dict[str, Any]]) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = io.BytesIO()
+    pq.write_table(pa.Table.from_pylist(records), sink, compression="zstd")
+    return sink.getvalue()
+
+def decode_chunk(payload: bytes) -> List[Dict[str, Any]]:
+    """The chunk's transactions as dicts with every current transactions column (columns
+    added after the chunk was written are None; columns since dropped are kept as well)"""
+    import pyarrow.parquet as pq
+
+    records = []
+    for stored in pq.read_table(io.BytesIO(payload)).to_pylist():
+        record = dict.fromkeys(_TRANSACTION_COLUMNS)
+        record.update(stored)
+        records.append(record)
+    return records
+
+# Move one user/account/month and its splits out of transactions, adding its totals to the
+# rollups in the same statement. The totals are grouped over the moved rows' allocations
+# (as in the transaction_allocations view) so splits count in their own categories.
+_MOVE_SQL = text("""
+    WITH moved AS (
+        DELETE FROM transactions
+        WHERE user_id = :user_id AND account_id IS NOT DISTINCT FROM CAST(:account_id AS integer)
+          AND date >= :start AND date < :end
+        RETURNING *
+    ), moved_splits AS (
+        DELETE FROM transaction_splits AS s
+        USING moved
+        WHERE moved.split_amount IS NOT NULL AND s.transaction_id = moved.id
+        RETURNING s.*
+    ), allocations AS (
+        SELECT id AS transaction_id, effective_category_id, amount - COALESCE(split_amount, 0) AS amount
+        FROM moved
+        WHERE split_amount IS NULL OR split_amount <> amount
+        UNION ALL
+        SELECT transaction_id, effective_category_id, amount FROM moved_splits
+    ), rollup AS (
+        INSERT INTO transaction_archive_rollups
+            (user_id, account_id, month, category_id, transaction_count, expense_total, income_total)
+        SELECT :user_id, CAST(:account_id AS integer), CAST(:month AS date), effective_category_id, COUNT(DISTINCT transaction_id),
+               COALESCE(SUM(-amount) FILTER (WHERE amount < 0), 0),
+               COALESCE(SUM(amount) FILTER (WHERE amount > 0), 0)
+        FROM allocations
+        GROUP BY effective_category_id
+        ON CONFLICT ON CONSTRAINT uq_transaction_archive_rollup DO UPDATE SET
+            transaction_count = transaction_archive_rollups.transaction_count + EXCLUDED.transaction_count,
+            expense_total = transaction_archive_rollups.expense_total + EXCLUDED.expense_total,
+            income_total = transaction_archive_rollups.income_total + EXCLUDED.income_total
+    )
+    SELECT moved.*, (
+        SELECT json_agg(json_build_object(
+            'id', s.id, 'amount', CAST(s.amount AS text), 'custom_category_id', s.custom_category_id,
+            'custom_subcategory_id', s.custom_subcategory_id, 'notes', s.notes
+        ) ORDER BY s.id)
+        FROM moved_splits AS s WHERE s.transaction_id = moved.id
+    ) AS splits
+    FROM moved
+""")
+
+# Only the partitions before the cutoff are scanned
+_GROUPS_SQL = text("""
+    SELECT DISTINCT user_id, account_id, CAST(date_trunc('month', date AT TIME ZONE 'UTC') AS date) AS month
+    FROM transactions
+    WHERE date < :cutoff
+    ORDER BY month, user_id, account_id
+""")
+
+def _without_change_log(db: Session) -> None:
+    """Keep the rest of the database transaction out of the sync change log (migration 0012)
+    and the budget spend totals (0013): archived transactions are still listed and still
+    spent, so moving them is not a change"""
+    db.execute(text("SET LOCAL app.change_log = 'off'"))
+
+def _archive_group(db: Session, user_id: int, account_id: Optional[int], month: date, cutoff: date) -> int:
+    _without_change_log(db)
+    records = [dict(row) for row in db.execute(_MOVE_SQL, {
+        "user_id": user_id,
+        "account_id": account_id,
+        "month": month,
+        "start": _utc_midnight(month),
+        "end": _utc_midnight(min(next_period(month, "month"), cutoff)),
+    }).mappings()]
+    # Another run may have archived the group first
+    if not records:
+        return 0
+    db.add(TransactionArchiveChunk(
+        user_id=user_id,
+        account_id=account_id,
+        month=month,
+        row_count=len(records),
+        payload=encode_chunk(records)
+    ))
+    return len(records)
+
+def archive_transactions(cutoff: Optional[date] = None) -> int:
+    """Archive every transaction dated before cutoff (default archive_cutoff()), committing
+    after each user/account/month. Returns the number of transactions archived."""
+    cutoff = cutoff or archive_cutoff()
+    db = SessionLocal()
+    try:
+        groups = db.execute(_GROUPS_SQL, {"cutoff": _utc_midnight(cutoff)}).all()
+        archived = 0
+        for group in groups:
+            archived += _archive_group(db, group.user_id, group.account_id, group.month, cutoff)
+            db.commit()
+        logger.info("Archived %s transactions dated before %s", archived, cutoff)
+        return archived
+    finally:
+        db.close()
+
+def restore_archive(since: date) -> int:
+    """Move archived months from `since` on back into transactions. Returns the number restored."""
+    db = SessionLocal()
+    try:
+        chunk_ids = list(db.execute(
+            select(TransactionArchiveChunk.id).where(TransactionArchiveChunk.month >= period_start(since, "month"))
+            .order_by(TransactionArchiveChunk.id)
+        ).scalars())
+        restored = 0
+        for chunk_id in chunk_ids:
+            chunk = db.get(TransactionArchiveChunk, chunk_id)
+            decoded = decode_chunk(chunk.payload)
+            # Chunks written before merchants existed carry the merchant details instead of an id.
+            # Merchants are shared, so only details that came from Plaid are kept
+            legacy = [record for record in decoded if record["merchant_id"] is None]
+            if legacy:
+                merchant_ids = resolve_merchants(db, [
+                    record if record["plaid_transaction_id"] else {"merchant_name": record["merchant_name"], "name": record["name"]}
+                    for record in legacy
+                ])
+                for record in legacy:
+                    record["merchant_id"] = merchant_ids.get(
+                        normalize_merchant_name(merchant_source(record["merchant_name"], record["name"]))
+                    )
+            # ...and chunks written before fingerprints existed carry none
+            for record in decoded:
+                if record["fingerprint"] is None:
+                    record["fingerprint"] = row_fingerprint(record)
+            records = [{column: record[column] for column in _TRANSACTION_COLUMNS} for record in decoded]
+            splits = [
+                dict(split, user_id=record["user_id"], transaction_id=record["id"], transaction_date=record["date"])
+                for record in decoded for split in record.get("splits") or ()
+            ]
+            _without_change_log(db)
+            db.execute(insert(Transaction.__table__), records)
+            if splits:
+                db.execute(insert(TransactionSplit.__table__), splits)
+            db.execute(delete(TransactionArchiveRollup).where(
+                TransactionArchiveRollup.user_id == chunk.user_id,
+                TransactionArchiveRollup.account_id.is_not_distinct_from(chunk.account_id),
+                TransactionArchiveRollup.month == chunk.month
+            ))
+            db.delete(chunk)
+            db.commit()
+            restored += len(records)
+        return restored
+    finally:
+        db.close()
+
+def archived_transactions(
+    db: Session,
+    user: User,
+    account_id: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category_id: Optional[int] = None,
+    subcategory_id: Optional[int] = None,
+    household: bool = False
+) -> List[Dict[str, Any]]:
+    """Archived transactions matching the GET /transactions/ filters, as response dicts"""
+    start, end = _parse_bound(start_date), _parse_bound(end_date)
+    chunks = db.query(TransactionArchiveChunk.payload)
+    if household:
+        chunks = chunks.filter(TransactionArchiveChunk.account_id.in_(accessible_account_ids(db, user)))
+    else:
+        chunks = chunks.filter(TransactionArchiveChunk.user_id == user.id)
+    if account_id:
+        chunks = chunks.filter(TransactionArchiveChunk.account_id == account_id)
+    if start:
+        chunks = chunks.filter(TransactionArchiveChunk.month >= period_start(start.date(), "month"))
+    if end:
+        chunks = chunks.filter(TransactionArchiveChunk.month <= end.date())
+
+    records = []
+    for payload, in chunks:
+        for record in decode_chunk(payload):
+            if start and record["date"] < start:
+                continue
+            if end and record["date"] > end:
+                continue
+            if subcategory_id and record["custom_subcategory_id"] != subcategory_id:
+                continue
+            records.append(record)
+
+    accounts, categories, subcategories, merchants = related_response_dicts(db, records)
+    items = []
+    for record in records:
+        # Categories deleted since archiving are dropped like the live foreign keys' SET NULL,
+        # and the effective category follows the subcategory's current parent
+        if record["custom_category_id"] not in categories:
+            record["custom_category_id"] = None
+        subcategory = subcategories.get(record["custom_subcategory_id"])
+        if subcategory is None:
+            record["custom_subcategory_id"] = None
+        record["effective_category_id"] = record["custom_category_id"] or (subcategory and subcategory["category_id"])
+        if category_id and record["effective_category_id"] != category_id:
+            continue
+        items.append(transaction_record_to_dict(record, accounts, categories, subcategories, merchants))
+    return items
+
+def archived_monthly_totals(
+    db: Session,
+    user: User,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    account_id: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Archived totals per month and category, summed over accounts"""
+    category_name = func.coalesce(Category.name, "Uncategorized")
+    query = db.query(
+        TransactionArchiveRollup.month,
+        TransactionArchiveRollup.category_id,
+        category_name.label("category_name"),
+        func.sum(TransactionArchiveRollup.transaction_count).label("transaction_count"),
+        func.sum(TransactionArchiveRollup.expense_total).label("expense_total"),
+        func.sum(TransactionArchiveRollup.income_total).label("income_total")
+    ).outerjoin(
+        Category, TransactionArchiveRollup.category_id == Category.id
+    ).filter(
+        TransactionArchiveRollup.user_id == user.id
+    )
+
+    start, end = _parse_bound(start_date), _parse_bound(end_date)
+    if start:
+        query = query.filter(TransactionArchiveRollup.month >= period_start(start.date(), "month"))
+    if end:
+        query = query.filter(TransactionArchiveRollup.month <= end.date())
+    if account_id:
+        query = query.filter(TransactionArchiveRollup.account_id == account_id)
+
+    rows = query.group_by(
+        TransactionArchiveRollup.month, TransactionArchiveRollup.category_id, category_name
+    ).order_by(TransactionArchiveRollup.month, category_name)
+    return [dict(row._mapping) for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old transactions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="archive transactions older than the horizon")
+    run.add_argument("--before", type=date.fromisoformat, help="archive before this date instead of the horizon")
+    restore = commands.add_parser("restore", help="move archived months back into transactions")
+    restore.add_argument("--since", type=date.fromisoformat, required=True)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        print(f"Archived {archive_transactions(args.before)} transactions")
+    else:
+        print(f"Restored {restore_archive(args.since)} transactions")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
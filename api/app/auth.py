@@ -2,20 +2,21 @@ import os
 import hashlib
 import secrets
 
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
-from api.database import get_db
-from api.models import User
+from api.database import SessionLocal, get_db
+from api.models import User, RefreshToken
 
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
 security = HTTPBearer()
 
@@ -51,6 +52,61 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def hash_refresh_token(token: str) -> str:
+    """Hash a refresh token for storage and lookup.
+    
+    Refresh tokens are high-entropy random strings, so a single SHA-256 is enough
+    (unlike passwords, which need the slow PBKDF2 path).
+    """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def create_refresh_token(db: Session, user_id: int, family_id: Optional[str] = None) -> str:
+    """Create and store a new refresh token, returning the raw token.
+    
+    Only the hash is persisted. Pass the family_id of the token being rotated to keep
+    the rotation chain together; a new login starts a new family.
+    """
+    token = secrets.token_urlsafe(48)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or secrets.token_hex(16),
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    return token
+
+def revoke_refresh_token_family(db: Session, family_id: str) -> None:
+    """Revoke every still-active token in a rotation chain"""
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id,
+        RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.now(timezone.utc)}, synchronize_session=False)
+
+def rotate_refresh_token(db: Session, token: str) -> Optional[Tuple[str, str]]:
+    """Exchange a refresh token for a new one.
+    
+    Returns (user email, new refresh token), or None if the token is unknown, expired
+    or revoked. Presenting an already-rotated token is treated as theft and revokes
+    the whole family. The caller is responsible for committing.
+    """
+    row = db.query(RefreshToken, User.email).join(User, RefreshToken.user_id == User.id).filter(
+        RefreshToken.token_hash == hash_refresh_token(token)
+    ).with_for_update(of=RefreshToken).first()
+    if row is None:
+        return None
+    
+    refresh_token, email = row
+    now = datetime.now(timezone.utc)
+    if refresh_token.revoked_at is not None:
+        revoke_refresh_token_family(db, refresh_token.family_id)
+        return None
+    if refresh_token.expires_at <= now:
+        return None
+    
+    refresh_token.revoked_at = now
+    new_token = create_refresh_token(db, refresh_token.user_id, refresh_token.family_id)
+    return email, new_token
+
 def verify_token(token: str) -> Optional[str]:
     """Verify a JWT token and return the email"""
     try:
@@ -81,4 +137,32 @@ async def get_current_user(
     if user is None:
         raise credentials_exception
     
-    return user
\ No newline at end of file
+    return user
+
+def get_stream_user_id(request: Request) -> int:
+    """Authenticate a long-lived stream (GET /events) and return the user's id.
+    
+    Browsers' EventSource cannot set headers, so the access token may also come as the
+    access_token query parameter. The user is looked up on a session closed right away,
+    so an open stream never holds a database connection.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        token = request.query_params.get("access_token")
+    email = verify_token(token) if token else None
+    if email is None:
+        raise credentials_exception
+    
+    db = SessionLocal()
+    try:
+        user_id = db.query(User.id).filter(User.email == email).scalar()
+    finally:
+        db.close()
+    if user_id is None:
+        raise credentials_exception
+    return user_id
@@ -0,0 +1,126 @@
+"""Single-request dashboard bootstrap.
+
+GET /bootstrap returns everything the dashboard renders on first load - the user,
+their accounts, categories, subcategories, budget settings, the month's budget and
+the month's transactions - in one response built from one database session, instead
+of seven round trips that each authenticate and check out a connection of their own.
+
+Each section is one query (the budget's entries find their categories in the
+session's identity map, loaded by the categories sections before it), and the
+transactions go through the fast path. The response carries a weak ETag over its
+body; a client sending it back in If-None-Match gets a 304 with no body when nothing
+changed.
+"""
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException
+from sqlalchemy.orm import Session, joinedload
+
+from api.access import accessible_account_ids
+from api.analytics import transaction_scope
+from api.archive import archived_transactions, needs_archive
+from api.budgets import month_bounds, resolve_template
+from api.models import Account, Category, Subcategory, Transaction, User, UserBudgetSettings
+from api.schemas import (
+    AccountResponse, BudgetTemplateResponse, CategoryResponse, SubcategoryResponse,
+    UserBudgetSettingsResponse, UserResponse
+)
+from api.serialization import orjson_default, response_dict, transaction_rows
+
+# In build order: categories come before the budget so its entries need no queries of their own
+BOOTSTRAP_SECTIONS = ("user", "accounts", "categories", "subcategories", "budget_settings", "budget", "transactions")
+
+def parse_sections(sections: Optional[str]) -> List[str]:
+    """The requested sections from a comma-separated list, in build order (all when omitted)"""
+    if not sections:
+        return list(BOOTSTRAP_SECTIONS)
+    requested = {section.strip() for section in sections.split(",") if section.strip()}
+    unknown = requested - set(BOOTSTRAP_SECTIONS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown sections: {', '.join(sorted(unknown))}. Valid sections: {', '.join(BOOTSTRAP_SECTIONS)}"
+        )
+    return [section for section in BOOTSTRAP_SECTIONS if section in requested]
+
+def _budget(db: Session, user: User, year: int, month: int) -> Optional[Dict[str, Any]]:
+    template = resolve_template(db, user.id, year, month)
+    if template is None:
+        return None
+    budget = response_dict(BudgetTemplateResponse, template)
+    # Default budget standing in for this month, as GET /budget/monthly/{year}/{month}/ returns it
+    budget.update(year=year, month=month)
+    return budget
+
+def _transactions(db: Session, user: User, year: int, month: int) -> List[Dict[str, Any]]:
+    start, end = month_bounds(year, month)
+    query = db.query(Transaction).filter(
+        transaction_scope(db, user),
+        Transaction.date >= start,
+        Transaction.date < end
+    ).order_by(Transaction.date.desc())
+    rows = transaction_rows(query)
+    if needs_archive(start.isoformat()):
+        archived = [
+            # Response dicts carry the date only; end is midnight UTC
+            item for item in archived_transactions(db, user, start_date=start.isoformat())
+            if item["date"] < end.date()
+        ]
+        if archived:
+            rows = rows + archived
+            rows.sort(key=lambda item: item["date"], reverse=True)
+    return rows
+
+def build_bootstrap(db: Session, user: User, sections: List[str], year: int, month: int) -> Dict[str, Any]:
+    """The bootstrap payload; sections that have nothing yet (budget settings, budget) are null"""
+    payload: Dict[str, Any] = {"year": year, "month": month}
+    for section in sections:
+        if section == "user":
+            payload["user"] = response_dict(UserResponse, user)
+        elif section == "accounts":
+            account_ids = accessible_account_ids(db, user)
+            accounts = db.query(Account).filter(Account.id.in_(account_ids)).all() if account_ids else []
+            payload["accounts"] = [response_dict(AccountResponse, account) for account in accounts]
+        elif section == "categories":
+            categories = db.query(Category).filter(
+                (Category.user_id == user.id) | (Category.is_system == True)
+            ).order_by(Category.is_system.desc(), Category.name).all()
+            payload["categories"] = [response_dict(CategoryResponse, category) for category in categories]
+        elif section == "subcategories":
+            subcategories = db.query(Subcategory).options(joinedload(Subcategory.category)).filter(
+                (Subcategory.user_id == user.id) | (Subcategory.is_system == True)
+            ).order_by(Subcategory.is_system.desc(), Subcategory.name).all()
+            payload["subcategories"] = [response_dict(SubcategoryResponse, subcategory) for subcategory in subcategories]
+        elif section == "budget_settings":
+            settings = db.query(UserBudgetSettings).filter(UserBudgetSettings.user_id == user.id).first()
+            payload["budget_settings"] = response_dict(UserBudgetSettingsResponse, settings) if settings else None
+        elif section == "budget":
+            payload["budget"] = _budget(db, user, year, month)
+        elif section == "transactions":
+            payload["transactions"] = _transactions(db, user, year, month)
+    return payload
+
+def render_bootstrap(payload: Dict[str, Any]) -> bytes:
+    return orjson.dumps(payload, default=orjson_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+def etag_for(body: bytes) -> str:
+    # Weak: the compression middleware may re-encode the body on the way out
+    return f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches etag (weak comparison, lists and * allowed)"""
+    if not if_none_match:
+        return False
+    tag = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == tag:
+            return True
+    return False
+
+def current_month() -> Tuple[int, int]:
+    today = datetime.now(timezone.utc).date()
+    return today.year, today.month
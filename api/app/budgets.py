@@ -0,0 +1,231 @@
+"""Budget template persistence helpers.
+
+Template entries are keyed on (category_id, subcategory_id). Saving a template
+diffs the submitted entries against the stored ones and only touches rows that
+changed: one DELETE for removed keys and one INSERT ... ON CONFLICT
+(uq_template_entry) DO UPDATE for new and changed amounts. Unchanged entries keep
+their ids and timestamps.
+
+Months without a budget of their own fall back to the user's default template,
+which is only copied into the month (materialized) when that month is edited.
+Cloning copies a template to a range of months with a single INSERT ... SELECT.
+"""
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from api.models import BudgetTemplate, BudgetTemplateEntry, Category, Subcategory
+
+EntryKey = Tuple[Optional[int], Optional[int]]
+
+def entry_key(entry) -> EntryKey:
+    return (entry.category_id, entry.subcategory_id)
+
+def _load_categories(db: Session, keys: Iterable[EntryKey]):
+    """Load the categories/subcategories referenced by the given keys in two queries"""
+    category_ids = {category_id for category_id, _ in keys if category_id is not None}
+    subcategory_ids = {subcategory_id for _, subcategory_id in keys if subcategory_id is not None}
+    categories, subcategories = {}, {}
+    if category_ids:
+        categories = {category.id: category for category in db.query(Category).filter(Category.id.in_(category_ids))}
+    if subcategory_ids:
+        subcategories = {
+            subcategory.id: subcategory
+            for subcategory in db.query(Subcategory).options(joinedload(Subcategory.category)).filter(
+                Subcategory.id.in_(subcategory_ids)
+            )
+        }
+    return categories, subcategories
+
+def sync_template_entries(db: Session, template: BudgetTemplate, entries: Iterable) -> List[BudgetTemplateEntry]:
+    """Make the template's entries match `entries` with the minimum number of writes.
+
+    Later entries with the same key win. Sets template.entries to the resulting
+    entries (ordered by id) without reloading the collection; the caller commits.
+    """
+    desired: Dict[EntryKey, Decimal] = {}
+    for entry in entries:
+        desired[entry_key(entry)] = entry.budgeted_amount
+
+    existing = {
+        entry_key(entry): entry
+        for entry in db.query(BudgetTemplateEntry).filter(BudgetTemplateEntry.template_id == template.id)
+    }
+
+    removed_ids = [entry.id for key, entry in existing.items() if key not in desired]
+    changed = [
+        {
+            "template_id": template.id,
+            "category_id": key[0],
+            "subcategory_id": key[1],
+            "budgeted_amount": amount,
+        }
+        for key, amount in desired.items()
+        if key not in existing or existing[key].budgeted_amount != amount
+    ]
+
+    if removed_ids:
+        db.execute(delete(BudgetTemplateEntry).where(BudgetTemplateEntry.id.in_(removed_ids)))
+
+    upserted = []
+    if changed:
+        statement = insert(BudgetTemplateEntry).values(changed)
+        statement = statement.on_conflict_do_update(
+            constraint="uq_template_entry",
+            set_={"budgeted_amount": statement.excluded.budgeted_amount, "updated_at": func.now()}
+        ).returning(BudgetTemplateEntry)
+        # populate_existing refreshes the already-loaded objects for updated rows
+        upserted = db.scalars(statement, execution_options={"populate_existing": True}).all()
+
+    upserted_keys = {entry_key(entry) for entry in upserted}
+    result = upserted + [
+        entry for key, entry in existing.items() if key in desired and key not in upserted_keys
+    ]
+    result.sort(key=lambda entry: entry.id)
+
+    # Attach the nested category/subcategory the response needs instead of lazy loading per entry
+    categories, subcategories = _load_categories(db, desired)
+    for entry in result:
+        set_committed_value(entry, "category", categories.get(entry.category_id))
+        set_committed_value(entry, "subcategory", subcategories.get(entry.subcategory_id))
+    set_committed_value(template, "entries", result)
+    return result
+
+BUDGET_CLONE_MAX_MONTHS = 120
+
+def month_range(start_year: int, start_month: int, end_year: int, end_month: int) -> List[Tuple[int, int]]:
+    """(year, month) pairs from start to end, inclusive"""
+    months = []
+    year, month = start_year, start_month
+    while (year, month) <= (end_year, end_month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def month_bounds(year: int, month: int) -> Tuple[datetime, datetime]:
+    """[start, end) UTC datetimes of a month"""
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + 1, 1, 1, tzinfo=timezone.utc) if month == 12 else datetime(year, month + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+def get_template(db: Session, user_id: int, year: int, month: int) -> Optional[BudgetTemplate]:
+    """The month's own budget, if it has one"""
+    return db.query(BudgetTemplate).filter(
+        BudgetTemplate.user_id == user_id,
+        BudgetTemplate.year == year,
+        BudgetTemplate.month == month
+    ).first()
+
+def get_default_template(db: Session, user_id: int) -> Optional[BudgetTemplate]:
+    return db.query(BudgetTemplate).filter(
+        BudgetTemplate.user_id == user_id,
+        BudgetTemplate.is_default == True
+    ).first()
+
+def resolve_template(db: Session, user_id: int, year: int, month: int) -> Optional[BudgetTemplate]:
+    """The month's own budget, falling back to the user's default template"""
+    return get_template(db, user_id, year, month) or get_default_template(db, user_id)
+
+def materialize_template(db: Session, user_id: int, year: int, month: int) -> Optional[BudgetTemplate]:
+    """The month's own budget, copying the default template into the month first if needed"""
+    template = get_template(db, user_id, year, month)
+    if template is not None:
+        return template
+    default = get_default_template(db, user_id)
+    if default is None:
+        return None
+    clone_template(db, default, [(year, month)])
+    return get_template(db, user_id, year, month)
+
+# One statement: compute the source month's unspent amounts, insert the target templates
+# (skipping months that already have one) and copy the source entries into them.
+# Actual spending matches the monthly summary: categorized expenses (allocations, so
+# splits count in their own categories) by subcategory, and by category for category entries.
+_CLONE_SQL = text("""
+    WITH spent AS (
+        SELECT a.subcategory_id, a.category_id, SUM(ABS(a.amount)) AS amount
+        FROM transaction_allocations a
+        WHERE a.user_id = :user_id AND a.category_id IS NOT NULL AND a.amount < 0
+          AND a.date >= :source_start AND a.date < :source_end
+        GROUP BY a.subcategory_id, a.category_id
+    ), source_entries AS (
+        SELECT e.category_id, e.subcategory_id, e.budgeted_amount,
+               CASE WHEN :carry_over THEN GREATEST(e.budgeted_amount - COALESCE(
+                   CASE WHEN e.subcategory_id IS NOT NULL
+                        THEN (SELECT SUM(amount) FROM spent WHERE spent.subcategory_id = e.subcategory_id)
+                        ELSE (SELECT SUM(amount) FROM spent WHERE spent.category_id = e.category_id)
+                   END, 0), 0)
+               ELSE 0 END AS unspent
+        FROM budget_template_entries e
+        WHERE e.template_id = :source_id
+    ), new_templates AS (
+        INSERT INTO budget_templates (user_id, year, month, total_budget, is_default)
+        SELECT :user_id, target.year, target.month,
+               source.total_budget + CASE WHEN target.year = :first_year AND target.month = :first_month
+                   THEN (SELECT COALESCE(SUM(unspent), 0) FROM source_entries) ELSE 0 END,
+               target.year IS NOT DISTINCT FROM CAST(:default_year AS integer)
+                   AND target.month IS NOT DISTINCT FROM CAST(:default_month AS integer)
+        FROM budget_templates source,
+             unnest(CAST(:years AS integer[]), CAST(:months AS integer[])) AS target(year, month)
+        WHERE source.id = :source_id
+        ON CONFLICT ON CONSTRAINT uq_user_monthly_budget DO NOTHING
+        RETURNING id, year, month
+    ), new_entries AS (
+        INSERT INTO budget_template_entries (template_id, category_id, subcategory_id, budgeted_amount)
+        SELECT new_templates.id, source_entries.category_id, source_entries.subcategory_id,
+               source_entries.budgeted_amount + CASE
+                   WHEN new_templates.year = :first_year AND new_templates.month = :first_month
+                   THEN source_entries.unspent ELSE 0 END
+        FROM new_templates CROSS JOIN source_entries
+    )
+    SELECT year, month FROM new_templates
+""")
+
+def clone_template(
+    db: Session,
+    source: BudgetTemplate,
+    targets: List[Tuple[int, int]],
+    overwrite: bool = False,
+    carry_over_from: Optional[Tuple[int, int]] = None
+) -> List[Tuple[int, int]]:
+    """Copy source and its entries to each (year, month) in targets. Returns the months created.
+
+    Months that already have a budget are replaced when overwrite is set, otherwise left
+    alone; a replaced default budget's clone becomes the default. carry_over_from=(year,
+    month) adds that month's unspent amount per entry to the first target month. The
+    caller commits.
+    """
+    targets = [target for target in targets if target != (source.year, source.month)]
+    if not targets:
+        return []
+
+    default_target = (None, None)
+    if overwrite:
+        replaced = db.execute(delete(BudgetTemplate).where(
+            BudgetTemplate.user_id == source.user_id,
+            BudgetTemplate.id != source.id,
+            tuple_(BudgetTemplate.year, BudgetTemplate.month).in_(targets)
+        ).returning(BudgetTemplate.year, BudgetTemplate.month, BudgetTemplate.is_default)).all()
+        # Months without a budget of their own keep falling back to that month's budget
+        default_target = next(((row.year, row.month) for row in replaced if row.is_default), default_target)
+
+    source_start, source_end = month_bounds(*(carry_over_from or (source.year, source.month)))
+    created = db.execute(_CLONE_SQL, {
+        "user_id": source.user_id,
+        "source_id": source.id,
+        "source_start": source_start,
+        "source_end": source_end,
+        "carry_over": carry_over_from is not None,
+        "years": [year for year, _ in targets],
+        "months": [month for _, month in targets],
+        "first_year": targets[0][0],
+        "first_month": targets[0][1],
+        "default_year": default_target[0],
+        "default_month": default_target[1],
+    }).all()
+    return sorted((row.year, row.month) for row in created)
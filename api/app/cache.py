@@ -0,0 +1,136 @@
+"""Small in-process caches shared by the API helpers"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class VersionedLRUCache:
+    """Bounded LRU of key -> (version, value). A lookup only hits when the stored
+    version equals the caller's current version, so bumping a version invalidates
+    every worker's copy without messaging between them."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, version: Hashable, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = (version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+class TTLCache:
+    """Bounded LRU whose entries expire ttl seconds after they are stored.
+
+    get_or_load coalesces concurrent misses for a key: one caller runs the loader and
+    the others wait for its result instead of making the same upstream call. With a
+    path the entries are also written there as JSON (atomically, on every store) and
+    read back on start, so they survive restarts; values must then be JSON-compatible.
+    """
+
+    def __init__(self, max_size: int, ttl: float, path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()  # key -> (expires_at, value), expires_at in wall-clock seconds
+        self.inflight: Dict[Hashable, Future] = {}
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evictions": 0, "errors": 0}
+        if path:
+            self._read()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], refresh: bool = False) -> Any:
+        """The cached value for key, or the loader's result; refresh skips the cached value"""
+        with self.lock:
+            if not refresh:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    if entry[0] > time.time():
+                        self.entries.move_to_end(key)
+                        self.counters["hits"] += 1
+                        return entry[1]
+                    del self.entries[key]
+                    self.counters["expired"] += 1
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self.lock:
+                del self.inflight[key]
+                self.counters["errors"] += 1
+            future.set_exception(e)
+            raise
+        self.put(key, value)
+        with self.lock:
+            del self.inflight[key]
+        future.set_result(value)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+            snapshot = list(self.entries.items()) if self.path else None
+        if snapshot is not None:
+            self._write(snapshot)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Counters since start, the current size and the hit rate"""
+        with self.lock:
+            metrics = dict(self.counters, size=len(self.entries), max_size=self.max_size)
+        lookups = metrics["hits"] + metrics["misses"] + metrics["coalesced"]
+        metrics["hit_rate"] = round((metrics["hits"] + metrics["coalesced"]) / lookups, 4) if lookups else None
+        return metrics
+
+    def _read(self) -> None:
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, expires_at, value in stored[-self.max_size:]:
+            if expires_at > now:
+                self.entries[key] = (expires_at, value)
+
+    def _write(self, snapshot: List[Tuple[Hashable, Tuple[float, Any]]]) -> None:
+        # Write a temporary file and rename it, so a crash never leaves a half-written cache
+        temporary = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, "w") as f:
+                json.dump([[key, expires_at, value] for key, (expires_at, value) in snapshot], f, default=str)
+            os.replace(temporary, self.path)
+        except OSError:
+            logger.exception("Could not write cache file %s", self.path)
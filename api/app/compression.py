@@ -0,0 +1,108 @@
+"""Response compression middleware.
+
+Compresses responses above a size threshold with brotli when the client accepts it
+and the optional `brotli` package is installed, otherwise with gzip. Streaming
+responses (e.g. /transactions/export) are compressed chunk by chunk. Media types that
+are already compressed (Parquet) are passed through untouched.
+"""
+import io
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional - fall back to gzip only
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+
+# Payloads that are already compressed gain nothing from another pass, and event streams
+# must reach the client as each event is written rather than when a gzip block fills
+UNCOMPRESSIBLE_MEDIA_TYPES = {"application/vnd.apache.parquet", "text/event-stream"}
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    """True if the Accept-Encoding header lists coding with a non-zero q-value"""
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+class _BrotliFile:
+    """Minimal file-like wrapper so GZipResponder's buffering logic can drive brotli"""
+
+    def __init__(self, fileobj, quality: int):
+        self.fileobj = fileobj
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def write(self, data: bytes) -> None:
+        # Flush after every chunk so streamed responses reach the client incrementally
+        self.fileobj.write(self.compressor.process(data) + self.compressor.flush())
+
+    def close(self) -> None:
+        self.fileobj.write(self.compressor.finish())
+
+class _CompressionResponder(GZipResponder):
+    """GZipResponder that skips uncompressible media types and can encode with brotli"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int, encoding: str, compresslevel: int, brotli_quality: int):
+        super().__init__(app, minimum_size, compresslevel=compresslevel)
+        self.encoding = encoding
+        if encoding == "br":
+            # GzipFile has already written its header to the parent's buffer - start a fresh one
+            self.gzip_buffer = io.BytesIO()
+            self.gzip_file = _BrotliFile(self.gzip_buffer, brotli_quality)
+        # GZipResponder writes through self.send; route it via the relabelling hook below
+        self.send = self.send_downstream
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.downstream_send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        await self.send_with_gzip(message)
+        if message["type"] == "http.response.start":
+            media_type = Headers(raw=message["headers"]).get("content-type", "").split(";")[0].strip()
+            if media_type in UNCOMPRESSIBLE_MEDIA_TYPES:
+                # Treat as already encoded so the body is passed through as-is
+                self.content_encoding_set = True
+
+    async def send_downstream(self, message: Message) -> None:
+        # GZipResponder always labels the body "gzip"; relabel when brotli was used
+        if message["type"] == "http.response.start" and self.encoding == "br" and not self.content_encoding_set:
+            for index, (name, value) in enumerate(message["headers"]):
+                if name == b"content-encoding" and value == b"gzip":
+                    message["headers"][index] = (name, b"br")
+        await self.downstream_send(message)
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        compresslevel: int = 6,
+        brotli_quality: int = 4
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            accept_encoding = Headers(scope=scope).get("Accept-Encoding", "")
+            encoding = None
+            if brotli is not None and _accepts(accept_encoding, "br"):
+                encoding = "br"
+            elif _accepts(accept_encoding, "gzip"):
+                encoding = "gzip"
+            if encoding:
+                responder = _CompressionResponder(
+                    self.app, self.minimum_size, encoding, self.compresslevel, self.brotli_quality
+                )
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,200 @@
+"""Duplicate transactions: fingerprints and near-duplicate clusters.
+
+The same purchase can arrive more than once - entered by hand, imported from a
+statement file and synced from Plaid - and every copy inflates the spending totals.
+Every transaction carries a fingerprint, a 16-byte hash of its account, UTC day,
+amount and normalized merchant name (see api/merchants.py), indexed per user. Each
+insert path checks its whole batch against the stored fingerprints in one query:
+
+- POST /transactions/ answers 409 with the stored transaction's id, unless
+  allow_duplicate is set
+- statement imports skip rows already stored, matching identical rows by count
+- Plaid syncs adopt a stored transaction with the same fingerprint and no Plaid id
+  instead of adding a second copy
+
+GET /transactions/duplicates finds the near-duplicates a fingerprint misses - a few
+days apart, or one copy without an account - with a self-join of the user's
+transactions bounded by a date window, and returns them as clusters.
+
+Rows written to the database by other means get their fingerprint from
+
+    python -m api.duplicates backfill
+"""
+import argparse
+import hashlib
+import os
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from api.database import SessionLocal
+from api.merchants import merchant_source, normalize_merchant_name
+from api.models import Transaction
+from api.serialization import transaction_rows
+
+DUPLICATE_WINDOW_DAYS = int(os.getenv("DUPLICATE_WINDOW_DAYS", "3"))
+MAX_DUPLICATE_WINDOW_DAYS = 31
+FINGERPRINT_BACKFILL_BATCH_SIZE = 5000
+
+@lru_cache(maxsize=4096)
+def _name_key(merchant_name: Optional[str], name: Optional[str]) -> str:
+    # Batches repeat the same few hundred merchants
+    source = merchant_source(merchant_name, name)
+    return normalize_merchant_name(source) or (source or "").strip().lower()
+
+def _utc_day(value: Union[date, datetime]) -> datetime:
+    # Date-only values are stored as midnight UTC
+    if not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def transaction_fingerprint(
+    account_id: Optional[int], date: Union[date, datetime], amount: Any, name: Optional[str], merchant_name: Optional[str] = None
+) -> bytes:
+    """What identifies a transaction: its account, UTC day, amount and normalized merchant name"""
+    key = f"{account_id or ''}|{_utc_day(date).date().isoformat()}|{Decimal(str(amount)):.2f}|{_name_key(merchant_name, name)}"
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+def row_fingerprint(row: Mapping[str, Any]) -> bytes:
+    """transaction_fingerprint of a dict of transactions column values"""
+    return transaction_fingerprint(row.get("account_id"), row["date"], row["amount"], row.get("name"), row.get("merchant_name"))
+
+# Fingerprints include the day, so the date bounds only narrow the partitions read
+_STORED_SQL = text("""
+    SELECT fingerprint, array_agg(id ORDER BY id)
+    FROM transactions
+    WHERE user_id = :user_id AND fingerprint = ANY(CAST(:fingerprints AS bytea[]))
+      AND date >= :start AND date < :end
+      AND (NOT :unsynced_only OR plaid_transaction_id IS NULL)
+    GROUP BY fingerprint
+""")
+
+def stored_duplicates(bind, user_id: int, rows: List[Mapping[str, Any]], unsynced_only: bool = False) -> Dict[bytes, List[int]]:
+    """fingerprint -> ids of the user's stored transactions with it, for rows that have a
+    fingerprint and a date. One query regardless of the number of rows; unsynced_only
+    leaves out transactions that came from Plaid."""
+    if not rows:
+        return {}
+    days = [_utc_day(row["date"]) for row in rows]
+    return {
+        bytes(fingerprint): ids for fingerprint, ids in bind.execute(_STORED_SQL, {
+            "user_id": user_id,
+            "fingerprints": list({row["fingerprint"] for row in rows}),
+            "start": min(days),
+            "end": max(days) + timedelta(days=1),
+            "unsynced_only": unsynced_only,
+        })
+    }
+
+# Pairs of the user's transactions at the same merchant with the same amount, at most
+# :window apart, on the same account or with either unassigned. Each pair once, the
+# earlier row first; ix_transactions_user_merchant_date serves the inner side.
+_PAIRS_SQL = text("""
+    SELECT a.id, b.id, b.date, a.fingerprint IS NOT NULL AND a.fingerprint = b.fingerprint
+    FROM transactions AS a
+    JOIN transactions AS b
+      ON b.user_id = a.user_id AND b.merchant_id = a.merchant_id
+     AND b.date >= a.date AND b.date <= a.date + :window
+     AND (b.date, b.id) > (a.date, a.id)
+     AND b.amount = a.amount
+     AND (a.account_id IS NULL OR b.account_id IS NULL OR b.account_id = a.account_id)
+    WHERE a.user_id = :user_id
+""")
+
+def _find(parent: Dict[int, int], node: int) -> int:
+    root = parent.setdefault(node, node)
+    while root != parent[root]:
+        root = parent[root]
+    while parent[node] != root:
+        parent[node], node = root, parent[node]
+    return root
+
+def duplicate_clusters(
+    db: Session, user_id: int, window_days: int = DUPLICATE_WINDOW_DAYS, limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Clusters of likely duplicate transactions, most recent first. A cluster is exact
+    when all its transactions have the same fingerprint."""
+    pairs = db.execute(_PAIRS_SQL, {"user_id": user_id, "window": timedelta(days=window_days)}).all()
+    if not pairs:
+        return []
+    # Clusters are the connected components of the pairs
+    parent: Dict[int, int] = {}
+    for a, b, _, _ in pairs:
+        parent[_find(parent, a)] = _find(parent, b)
+    clusters: Dict[int, Dict[str, Any]] = {}
+    for a, b, latest, exact in pairs:
+        cluster = clusters.setdefault(_find(parent, a), {"ids": set(), "latest": latest, "exact": True})
+        cluster["ids"].update((a, b))
+        cluster["latest"] = max(cluster["latest"], latest)
+        cluster["exact"] = cluster["exact"] and exact
+    ordered = sorted(clusters.values(), key=lambda cluster: cluster["latest"], reverse=True)[:limit]
+
+    ids = [transaction_id for cluster in ordered for transaction_id in cluster["ids"]]
+    rows = {
+        row["id"]: row for row in transaction_rows(
+            db.query(Transaction).filter(Transaction.user_id == user_id, Transaction.id.in_(ids))
+        )
+    }
+    return [
+        {
+            "exact": cluster["exact"],
+            "transactions": sorted((rows[transaction_id] for transaction_id in cluster["ids"]), key=lambda row: (row["date"], row["id"])),
+        }
+        for cluster in ordered
+    ]
+
+_BATCH_SQL = text("""
+    SELECT id, account_id, date, amount, name, merchant_name
+    FROM transactions
+    WHERE fingerprint IS NULL AND id > :after
+    ORDER BY id
+    LIMIT :limit
+""")
+
+_ASSIGN_SQL = text("""
+    UPDATE transactions AS t SET fingerprint = assigned.fingerprint
+    FROM unnest(CAST(:ids AS integer[]), CAST(:fingerprints AS bytea[])) AS assigned(id, fingerprint)
+    WHERE t.id = assigned.id
+""")
+
+def backfill_fingerprints(bind, batch_size: int = FINGERPRINT_BACKFILL_BATCH_SIZE, commit=None) -> int:
+    """Set the fingerprint of every transaction that has none, in id order and batches.
+    commit, if given, is called after each batch. Returns the number of transactions filled in."""
+    assigned, after = 0, 0
+    while True:
+        rows = [dict(row) for row in bind.execute(_BATCH_SQL, {"after": after, "limit": batch_size}).mappings()]
+        if not rows:
+            return assigned
+        after = rows[-1]["id"]
+        # A fingerprint isn't a change clients sync or a change in spending
+        bind.execute(text("SET LOCAL app.change_log = 'off'"))
+        bind.execute(_ASSIGN_SQL, {
+            "ids": [row["id"] for row in rows],
+            "fingerprints": [row_fingerprint(row) for row in rows],
+        })
+        assigned += len(rows)
+        if commit is not None:
+            commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain transaction fingerprints")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill = commands.add_parser("backfill", help="fingerprint transactions that have none")
+    backfill.add_argument("--batch-size", type=int, default=FINGERPRINT_BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        assigned = backfill_fingerprints(db, args.batch_size, commit=db.commit)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Fingerprinted {assigned} transactions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Server-sent events: push changes to the frontend instead of having it poll.
+
+GET /events is an SSE stream of the current user's events, e.g.
+
+    event: transaction.created
+    data: {...TransactionResponse...}
+
+Event types: transaction.created, transaction.updated, sync.completed and
+budget.threshold. Handlers publish events after committing; the bus delivers them
+to every open stream of the user. A stream that falls more than EVENT_QUEUE_SIZE
+events behind loses them and gets a `resync` event instead, as does a client that
+reconnects - it should catch up through GET /sync.
+
+The default bus is in-process, which is enough for a single worker. With several
+workers set EVENT_BUS_BACKEND=postgres: events are then published with pg_notify and
+every worker LISTENs on the channel and delivers them to its own streams.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+import orjson
+from fastapi import Request
+from sqlalchemy import text
+
+from api.database import engine
+from api.serialization import orjson_default
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUS_BACKEND = os.getenv("EVENT_BUS_BACKEND", "local")  # local or postgres
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+EVENT_RETRY_MILLISECONDS = 5000
+
+EVENT_CHANNEL = "app_events"
+# NOTIFY payloads must stay under 8000 bytes
+_MAX_NOTIFY_PAYLOAD = 7900
+
+_RESYNC = {"type": "resync", "data": None}
+
+# Event ids only make browsers send Last-Event-ID when they reconnect
+_event_ids = itertools.count(1)
+
+class _Subscriber:
+    """One open stream: a bounded queue owned by the stream's event loop"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, size: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        # Runs on the subscriber's loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind to be worth catching up event by event
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_RESYNC)
+
+class EventBus:
+    """In-process pub/sub keyed by user id; publish is safe to call from any thread"""
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Set[_Subscriber]] = defaultdict(set)
+
+    def subscribe(self, user_id: int) -> _Subscriber:
+        """Register a stream; must be called on the event loop that will consume it"""
+        subscriber = _Subscriber(asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id: int, subscriber: _Subscriber) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def publish(self, user_id: int, event_type: str, data: Any = None) -> None:
+        self.dispatch(user_id, {"type": event_type, "data": data})
+
+    def dispatch(self, user_id: int, event: Dict[str, Any]) -> None:
+        """Hand an event to this process's streams of the user"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+            except RuntimeError:
+                # The stream's loop has shut down
+                self.unsubscribe(user_id, subscriber)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+class PostgresEventBus(EventBus):
+    """EventBus whose events go through PostgreSQL NOTIFY, so streams on every worker get them"""
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE, channel: str = EVENT_CHANNEL):
+        super().__init__(queue_size)
+        self.channel = channel
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, user_id: int, event_type: str, data: Any = None) -> None:
+        message = {"user_id": user_id, "type": event_type, "data": data}
+        payload = orjson.dumps(message, default=orjson_default, option=orjson.OPT_UTC_Z).decode()
+        if len(payload.encode()) > _MAX_NOTIFY_PAYLOAD:
+            # Too big for NOTIFY - send the event without its data, clients refetch
+            message["data"] = None
+            payload = json.dumps(message)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+        except Exception:
+            # Pushes are best-effort; the write they announce has already been committed
+            logger.exception("Failed to publish %s event", event_type)
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen, name="event-bus-listen", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _listen(self) -> None:
+        """LISTEN on the channel and dispatch notifications, reconnecting after failures"""
+        while not self._stopping.is_set():
+            try:
+                raw = engine.raw_connection()
+            except Exception:
+                logger.exception("Event bus listener could not connect")
+                self._stopping.wait(5)
+                continue
+            try:
+                connection = raw.driver_connection
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {self.channel}")
+                while not self._stopping.is_set():
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        message = json.loads(notification.payload)
+                        self.dispatch(message.pop("user_id"), message)
+            except Exception:
+                logger.exception("Event bus listener failed, reconnecting")
+                self._stopping.wait(1)
+            finally:
+                # The connection had autocommit switched on - don't return it to the pool
+                raw.invalidate()
+
+event_bus = PostgresEventBus() if EVENT_BUS_BACKEND == "postgres" else EventBus()
+
+def publish_event(user_id: int, event_type: str, data: Any = None) -> None:
+    """Push an event to the user's open streams; call after the change is committed"""
+    event_bus.publish(user_id, event_type, data)
+
+def format_event(event: Dict[str, Any]) -> str:
+    data = orjson.dumps(event["data"], default=orjson_default, option=orjson.OPT_UTC_Z).decode()
+    return f"id: {next(_event_ids)}\nevent: {event['type']}\ndata: {data}\n\n"
+
+async def event_stream(request: Request, user_id: int) -> AsyncIterator[str]:
+    """The SSE body for one client: events as they arrive, a comment line as keepalive"""
+    subscriber = event_bus.subscribe(user_id)
+    try:
+        yield f"retry: {EVENT_RETRY_MILLISECONDS}\n\n"
+        # Whatever happened while the client was away is only available through /sync
+        if request.headers.get("last-event-id") is not None:
+            yield format_event(_RESYNC)
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        event_bus.unsubscribe(user_id, subscriber)
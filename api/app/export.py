@@ -0,0 +1,161 @@
+"""Streaming transaction export (CSV, Parquet, Arrow IPC stream).
+
+Rows are read through a server-side cursor in chunks of EXPORT_CHUNK_SIZE and each
+chunk is converted with pandas and written out before the next one is fetched, so a
+multi-year export uses constant memory. pandas and pyarrow are imported lazily to keep
+them out of the API's startup path.
+"""
+import io
+import os
+from typing import Iterator
+
+from sqlalchemy import func
+from sqlalchemy.orm import Query, aliased
+
+from api.database import SessionLocal
+from api.models import Transaction, Account, Category, Subcategory
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+_account = aliased(Account, name="export_account")
+_category = aliased(Category, name="export_category")
+_subcategory = aliased(Subcategory, name="export_subcategory")
+_subcategory_category = aliased(Category, name="export_subcategory_category")
+
+EXPORT_COLUMNS = [
+    "id", "date", "amount", "iso_currency_code", "name", "merchant_name", "pending",
+    "account_id", "account_name", "category", "subcategory", "notes", "tags",
+]
+
+def export_statement(query: Query):
+    """Turn a filtered Query over Transaction into the flat SELECT used for export"""
+    return query.with_entities(
+        Transaction.id,
+        func.date(Transaction.date).label("date"),
+        Transaction.amount,
+        Transaction.iso_currency_code,
+        Transaction.name,
+        Transaction.merchant_name,
+        Transaction.pending,
+        Transaction.account_id,
+        _account.name.label("account_name"),
+        # A transaction's category is either set directly or implied by its subcategory
+        func.coalesce(_category.name, _subcategory_category.name).label("category"),
+        _subcategory.name.label("subcategory"),
+        Transaction.notes,
+        Transaction.tags,
+    ).outerjoin(
+        _account, Transaction.account_id == _account.id
+    ).outerjoin(
+        _category, Transaction.custom_category_id == _category.id
+    ).outerjoin(
+        _subcategory, Transaction.custom_subcategory_id == _subcategory.id
+    ).outerjoin(
+        _subcategory_category, _subcategory.category_id == _subcategory_category.id
+    ).statement
+
+def iter_chunks(statement, chunk_size: int = EXPORT_CHUNK_SIZE, bind=None):
+    """Yield pandas DataFrames of up to chunk_size rows, read with a server-side cursor.
+
+    Uses its own session so the cursor stays open for the lifetime of the streamed
+    response, independent of the request's session. bind selects the engine (e.g. a
+    read replica); the primary is used by default.
+    """
+    import pandas as pd
+
+    db = SessionLocal(bind=bind) if bind is not None else SessionLocal()
+    try:
+        result = db.execute(statement, execution_options={"stream_results": True, "yield_per": chunk_size})
+        for rows in result.partitions():
+            df = pd.DataFrame.from_records(rows, columns=EXPORT_COLUMNS)
+            # Nullable integer so missing accounts don't turn the column into floats
+            df["account_id"] = df["account_id"].astype("Int64")
+            yield df
+    finally:
+        db.close()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose contents are drained after every chunk"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.int64()),
+        ("date", pa.date32()),
+        ("amount", pa.decimal128(15, 2)),
+        ("iso_currency_code", pa.string()),
+        ("name", pa.string()),
+        ("merchant_name", pa.string()),
+        ("pending", pa.bool_()),
+        ("account_id", pa.int64()),
+        ("account_name", pa.string()),
+        ("category", pa.string()),
+        ("subcategory", pa.string()),
+        ("notes", pa.string()),
+        ("tags", pa.list_(pa.string())),
+    ])
+
+def _stream_csv(chunks) -> Iterator[bytes]:
+    header = True
+    for df in chunks:
+        # Lists aren't a CSV type - join tags with ';'
+        df["tags"] = df["tags"].map(lambda tags: ";".join(tags) if tags else None)
+        yield df.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+    if header:
+        # No rows at all - still emit the header line
+        yield (",".join(EXPORT_COLUMNS) + "\n").encode("utf-8")
+
+def _stream_arrow(chunks, file_format: str) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for df in chunks:
+            # Each chunk becomes one Parquet row group / one Arrow record batch
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def stream_export(statement, file_format: str, chunk_size: int = EXPORT_CHUNK_SIZE, bind=None) -> Iterator[bytes]:
+    """Stream the export body for the given format"""
+    chunks = iter_chunks(statement, chunk_size, bind)
+    if file_format == "csv":
+        return _stream_csv(chunks)
+    return _stream_arrow(chunks, file_format)
@@ -0,0 +1,298 @@
+"""Statement file import (CSV, OFX, QIF).
+
+POST /transactions/import loads a bank statement file as one generator pipeline:
+
+    lines -> parse -> normalize -> chunks of IMPORT_CHUNK_SIZE -> dedupe -> batch insert
+
+The upload is read line by line and only one chunk of rows is held at a time, so a
+multi-megabyte statement imports with constant memory and one INSERT per chunk. Rows
+that can't be parsed are skipped and reported with their row number (at most
+IMPORT_MAX_ERRORS of them); with dry_run everything runs except the commit.
+
+A row is a duplicate when the account already has a transaction with the same
+fingerprint - same day, amount and normalized name (see api/duplicates.py). Identical rows are matched by count - a statement
+with two identical coffees imports both, and importing the same file again imports
+nothing.
+
+CSV columns are found by header (date, amount or debit/credit, description/payee,
+memo); OFX STMTTRN records and QIF entries are read in both their usual dialects.
+Amounts keep the file's sign - negative for money leaving the account - unless
+invert_amounts is set for banks that export debits as positive numbers.
+"""
+import csv
+import io
+import os
+import re
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from api.duplicates import stored_duplicates, transaction_fingerprint
+from api.merchants import merchant_source, normalize_merchant_name, resolve_merchants
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "2000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+IMPORT_FORMATS = ("csv", "ofx", "qif")
+
+# Tried in order when the caller gives no date_format; day-first dates need one
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y/%m/%d", "%d.%m.%Y", "%Y%m%d", "%b %d, %Y", "%d %b %Y")
+
+# Lowercased CSV header -> field
+CSV_COLUMNS = {
+    "date": "date", "transaction date": "date", "posting date": "date", "posted date": "date", "trans. date": "date",
+    "amount": "amount", "transaction amount": "amount",
+    "debit": "debit", "withdrawal": "debit", "withdrawals": "debit",
+    "credit": "credit", "deposit": "credit", "deposits": "credit",
+    "description": "name", "name": "name", "payee": "name", "merchant": "name", "details": "name",
+    "memo": "memo", "notes": "memo",
+    "currency": "iso_currency_code",
+}
+
+class RowError(ValueError):
+    """A row that can't be imported"""
+
+class ImportReport:
+    """Counts and the (capped) per-row error list of one import"""
+
+    def __init__(self, max_errors: int = IMPORT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def error(self, row: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+def detect_format(filename: Optional[str], format: Optional[str]) -> str:
+    """The file format from the explicit parameter or the file extension, or a 400"""
+    if not format and filename and "." in filename:
+        format = filename.rsplit(".", 1)[1]
+    format = (format or "").lower()
+    if format == "qfx":
+        format = "ofx"
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported import format. Use one of: {', '.join(IMPORT_FORMATS)}")
+    return format
+
+def read_lines(file: BinaryIO) -> Iterator[str]:
+    """Decoded lines of an uploaded file, read incrementally"""
+    # utf-8-sig drops the byte order mark some banks prepend; undecodable bytes become U+FFFD
+    return io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+
+def parse_amount(value: Optional[str]) -> Decimal:
+    text = (value or "").strip()
+    negative = text.startswith("(") and text.endswith(")")
+    text = re.sub(r"[^\d.\-+]", "", text.strip("()"))
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise RowError(f"Invalid amount: {value!r}")
+    return -abs(amount) if negative else amount
+
+@lru_cache(maxsize=4096)
+def _parse_day(text: str, date_format: Optional[str]) -> Optional[datetime]:
+    # A statement has a few hundred distinct dates at most
+    for candidate in ((date_format,) if date_format else DATE_FORMATS):
+        try:
+            day = datetime.strptime(text, candidate).date()
+        except ValueError:
+            continue
+        return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return None
+
+def parse_date(value: Optional[str], date_format: Optional[str] = None) -> datetime:
+    """Midnight UTC of the row's date (transactions are dated in UTC)"""
+    date = _parse_day((value or "").strip(), date_format)
+    if date is None:
+        raise RowError(f"Invalid date: {value!r}")
+    return date
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Tuple[int, Dict[str, Optional[str]]]]:
+    """(row number, fields) per data row; row 1 is the header"""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    fields = [CSV_COLUMNS.get(column.strip().lower()) for column in header]
+    if "date" not in fields or not ({"amount", "debit", "credit"} & set(fields)):
+        raise HTTPException(status_code=400, detail="CSV needs a date column and an amount (or debit/credit) column")
+    for number, values in enumerate(reader, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        yield number, {field: value for field, value in zip(fields, values) if field}
+
+# OFX 1.x is SGML (leaf elements without closing tags), 2.x is XML; both put one
+# element per line in practice, and some writers put a whole record on one line
+_OFX_ELEMENT = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+def parse_ofx(lines: Iterable[str]) -> Iterator[Tuple[int, Dict[str, Optional[str]]]]:
+    """(record number, fields) per STMTTRN record"""
+    record: Optional[Dict[str, Optional[str]]] = None
+    number = 0
+    for line in lines:
+        for closing, tag, value in _OFX_ELEMENT.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and record is not None:
+                    number += 1
+                    yield number, record
+                    record = None
+                elif not closing:
+                    record = {}
+            elif record is not None and not closing and value.strip():
+                record[tag] = value.strip()
+
+def parse_qif(lines: Iterable[str]) -> Iterator[Tuple[int, Dict[str, Optional[str]]]]:
+    """(entry number, fields) per QIF entry; fields are keyed by their one-letter code"""
+    entry: Dict[str, Optional[str]] = {}
+    number = 0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line or line.startswith("!"):
+            continue
+        if line.startswith("^"):
+            if entry:
+                number += 1
+                yield number, entry
+            entry = {}
+            continue
+        # Split lines (S/E/$) repeat per split; the entry's own fields come first
+        entry.setdefault(line[0], line[1:].strip())
+    if entry:
+        yield number + 1, entry
+
+def _ofx_date(value: Optional[str]) -> datetime:
+    # YYYYMMDD[HHMMSS[.XXX]][[+-]offset:TZ]; the date part is all we keep
+    return parse_date((value or "")[:8], "%Y%m%d")
+
+def _qif_date(value: Optional[str], date_format: Optional[str]) -> datetime:
+    # Quicken writes 2-digit years after an apostrophe (1/5'24) and pads with spaces
+    text = (value or "").replace("'", "/").replace(" ", "")
+    return parse_date(text, date_format)
+
+def normalize_row(format: str, fields: Dict[str, Optional[str]], date_format: Optional[str], invert_amounts: bool) -> Dict[str, Any]:
+    """Transaction fields (date, amount, name, notes, iso_currency_code) from a parsed row"""
+    if format == "csv":
+        date = parse_date(fields.get("date"), date_format)
+        if (fields.get("amount") or "").strip():
+            amount = parse_amount(fields["amount"])
+        else:
+            debit, credit = (fields.get("debit") or "").strip(), (fields.get("credit") or "").strip()
+            if not debit and not credit:
+                raise RowError("Missing amount")
+            amount = (parse_amount(credit) if credit else Decimal(0)) - (abs(parse_amount(debit)) if debit else Decimal(0))
+        name, notes, currency = fields.get("name"), fields.get("memo"), fields.get("iso_currency_code")
+    elif format == "ofx":
+        date = _ofx_date(fields.get("DTPOSTED"))
+        amount = parse_amount(fields.get("TRNAMT"))
+        name, notes, currency = fields.get("NAME") or fields.get("PAYEE"), fields.get("MEMO"), fields.get("CURRENCY")
+    else:
+        date = _qif_date(fields.get("D"), date_format)
+        amount = parse_amount(fields.get("T") or fields.get("U"))
+        name, notes, currency = fields.get("P"), fields.get("M"), None
+    name = (name or notes or "").strip()
+    if not name:
+        raise RowError("Missing description")
+    return {
+        "date": date,
+        "amount": -amount if invert_amounts else amount,
+        "name": name[:500],
+        "notes": notes.strip() if notes and notes.strip() != name else None,
+        "iso_currency_code": currency.strip().upper()[:3] if currency and currency.strip() else None,
+    }
+
+_PARSERS = {"csv": parse_csv, "ofx": parse_ofx, "qif": parse_qif}
+
+def normalized_rows(
+    file: BinaryIO, format: str, report: ImportReport,
+    date_format: Optional[str] = None, invert_amounts: bool = False
+) -> Iterator[Dict[str, Any]]:
+    """Parse and normalize, recording rows that fail in the report"""
+    for number, fields in _PARSERS[format](read_lines(file)):
+        report.rows += 1
+        try:
+            yield normalize_row(format, fields, date_format, invert_amounts)
+        except RowError as e:
+            report.error(number, str(e))
+
+def chunked(rows: Iterable[Dict[str, Any]], size: int = IMPORT_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# One statement per chunk, however many rows it has
+_INSERT_SQL = text("""
+    INSERT INTO transactions (user_id, account_id, date, amount, name, notes, iso_currency_code, merchant_id, fingerprint, pending)
+    SELECT :user_id, :account_id, row.date, row.amount, row.name, row.notes, row.iso_currency_code, row.merchant_id, row.fingerprint, false
+    FROM unnest(
+        CAST(:dates AS timestamptz[]), CAST(:amounts AS numeric[]), CAST(:names AS text[]), CAST(:notes AS text[]),
+        CAST(:currencies AS text[]), CAST(:merchant_ids AS integer[]), CAST(:fingerprints AS bytea[])
+    ) AS row(date, amount, name, notes, iso_currency_code, merchant_id, fingerprint)
+""")
+
+def _insert_rows(db: Session, user_id: int, account_id: Optional[int], rows: List[Dict[str, Any]]) -> None:
+    merchant_ids = resolve_merchants(db, rows)
+    db.execute(_INSERT_SQL, {
+        "user_id": user_id,
+        "account_id": account_id,
+        "dates": [row["date"] for row in rows],
+        "amounts": [row["amount"] for row in rows],
+        "names": [row["name"] for row in rows],
+        "notes": [row["notes"] for row in rows],
+        "currencies": [row["iso_currency_code"] for row in rows],
+        "merchant_ids": [merchant_ids.get(normalize_merchant_name(merchant_source(None, row["name"]))) for row in rows],
+        "fingerprints": [row["fingerprint"] for row in rows],
+    })
+
+def import_statement(
+    db: Session, user_id: int, file: BinaryIO, format: str, account_id: Optional[int] = None,
+    date_format: Optional[str] = None, invert_amounts: bool = False, dry_run: bool = False
+) -> Dict[str, Any]:
+    """Run the import pipeline; the caller commits (or, for a dry run, rolls back)"""
+    report = ImportReport()
+    # Identical rows seen so far in the file, so the nth copy is only a duplicate if n are stored
+    seen: Dict[bytes, int] = defaultdict(int)
+    for chunk in chunked(normalized_rows(file, format, report, date_format, invert_amounts)):
+        for row in chunk:
+            row["fingerprint"] = transaction_fingerprint(account_id, row["date"], row["amount"], row["name"])
+        stored = stored_duplicates(db, user_id, chunk)
+        rows = []
+        for row in chunk:
+            key = row["fingerprint"]
+            seen[key] += 1
+            if seen[key] <= len(stored.get(key, ())):
+                report.duplicates += 1
+                continue
+            rows.append(row)
+        if not rows:
+            continue
+        report.imported += len(rows)
+        if not dry_run:
+            _insert_rows(db, user_id, account_id, rows)
+    return report.as_dict()
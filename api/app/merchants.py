@@ -0,0 +1,173 @@
+"""Merchant normalization and the merchants dimension table.
+
+Every transaction points at a row in `merchants` through merchant_id instead of
+repeating the merchant's entity id, logo and website. The merchant is found by
+normalizing the transaction's merchant_name (or, without one, its raw name): payment
+processor prefixes ("SQ *", "TST*", "PAYPAL *"...), store numbers ("#1234",
+"STORE 0042") and punctuation are stripped and the result is lowercased, so
+"SQ *BLUE BOTTLE #12" and "Blue Bottle" share one merchant. Merchants are global;
+logo, website and Plaid entity id are filled in from the first Plaid transaction that
+has them and never overwritten. Manually entered transactions only ever name a
+merchant, so one user can't change what every other user sees.
+
+Transactions inserted through the API get their merchant_id on insert. Rows written
+to the database by other means are filled in by
+
+    python -m api.merchants backfill
+"""
+import argparse
+import re
+from typing import Dict, Iterable, Mapping, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from api.database import SessionLocal
+from api.models import Merchant
+
+MERCHANT_BACKFILL_BATCH_SIZE = 5000
+
+# Card processors and payment platforms that prefix the merchant in bank descriptors
+_PROCESSOR_PREFIX = re.compile(
+    r"^(?:(?:sq|tst|sp|py|pp|paypal|ic|cke|zettle|sumup)\s*\*|(?:pos(?: debit)?|debit card purchase|checkcard)\b)\s*",
+    re.IGNORECASE
+)
+# Order/reference codes after the name, e.g. "AMAZON.COM*2K1AB3"
+_REFERENCE_SUFFIX = re.compile(r"\*\s*\w*\d\w*\s*$")
+# "#1234", "store 0042", "no. 17" and bare numbers of three or more digits
+_STORE_NUMBER = re.compile(r"#\s*\d+|\b(?:store|str|no\.?|loc)\s*\d+\b|\b\d{3,}\b", re.IGNORECASE)
+_NON_WORD = re.compile(r"[^\w&']+")
+
+def clean_merchant_name(raw: Optional[str]) -> Optional[str]:
+    """The merchant name without processor prefixes, store numbers and stray punctuation"""
+    if not raw:
+        return None
+    name = raw.strip()
+    # Prefixes can stack, e.g. "POS DEBIT SQ *COFFEE"
+    while True:
+        stripped = _PROCESSOR_PREFIX.sub("", name, count=1)
+        if stripped == name:
+            break
+        name = stripped
+    name = _REFERENCE_SUFFIX.sub("", name)
+    name = _STORE_NUMBER.sub(" ", name)
+    name = " ".join(_NON_WORD.sub(" ", name).split())
+    return name[:255] or None
+
+def normalize_merchant_name(raw: Optional[str]) -> Optional[str]:
+    """Key that identifies a merchant: the cleaned name, lowercased"""
+    name = clean_merchant_name(raw)
+    return name.lower() if name else None
+
+def merchant_source(merchant_name: Optional[str], name: Optional[str]) -> Optional[str]:
+    """The string a transaction's merchant is derived from"""
+    return merchant_name or name
+
+def resolve_merchants(bind, entries: Iterable[Mapping]) -> Dict[str, int]:
+    """Create missing merchants for the given entries and return normalized name -> merchant id.
+
+    Each entry has merchant_name and name, and optionally merchant_entity_id, logo_url
+    and website, which must come from Plaid (merchants are shared by all users). One INSERT ... ON CONFLICT plus one SELECT regardless of the number of
+    entries; bind is a Session or Connection, the caller commits.
+    """
+    merchants: Dict[str, dict] = {}
+    for entry in entries:
+        source = merchant_source(entry.get("merchant_name"), entry.get("name"))
+        key = normalize_merchant_name(source)
+        if key is None:
+            continue
+        merchant = merchants.setdefault(key, {
+            "normalized_name": key,
+            "display_name": clean_merchant_name(source),
+            "merchant_entity_id": None,
+            "logo_url": None,
+            "website": None,
+        })
+        # First non-empty value wins within the batch, as it does against stored rows
+        for field in ("merchant_entity_id", "logo_url", "website"):
+            if merchant[field] is None and entry.get(field):
+                merchant[field] = entry[field]
+    if not merchants:
+        return {}
+
+    statement = insert(Merchant).values(list(merchants.values()))
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[Merchant.normalized_name],
+        set_={
+            "merchant_entity_id": func.coalesce(Merchant.merchant_entity_id, excluded.merchant_entity_id),
+            "logo_url": func.coalesce(Merchant.logo_url, excluded.logo_url),
+            "website": func.coalesce(Merchant.website, excluded.website),
+        },
+        # Only touch existing merchants when there's something to fill in
+        where=(
+            (Merchant.merchant_entity_id.is_(None) & excluded.merchant_entity_id.isnot(None))
+            | (Merchant.logo_url.is_(None) & excluded.logo_url.isnot(None))
+            | (Merchant.website.is_(None) & excluded.website.isnot(None))
+        )
+    )
+    bind.execute(statement)
+    return dict(bind.execute(
+        select(Merchant.normalized_name, Merchant.id).where(Merchant.normalized_name.in_(list(merchants)))
+    ).all())
+
+def resolve_merchant_id(bind, merchant_name: Optional[str], name: Optional[str], **details) -> Optional[int]:
+    """Merchant id for a single transaction; details are merchant_entity_id, logo_url, website"""
+    ids = resolve_merchants(bind, [{"merchant_name": merchant_name, "name": name, **details}])
+    return ids.get(normalize_merchant_name(merchant_source(merchant_name, name)))
+
+_BATCH_SQL = text("""
+    SELECT id, merchant_name, name
+    FROM transactions
+    WHERE merchant_id IS NULL AND id > :after
+    ORDER BY id
+    LIMIT :limit
+""")
+
+_ASSIGN_SQL = text("""
+    UPDATE transactions AS t SET merchant_id = assigned.merchant_id
+    FROM unnest(CAST(:ids AS integer[]), CAST(:merchant_ids AS integer[])) AS assigned(id, merchant_id)
+    WHERE t.id = assigned.id
+""")
+
+def backfill_merchant_ids(bind, batch_size: int = MERCHANT_BACKFILL_BATCH_SIZE, commit=None) -> int:
+    """Set merchant_id on every transaction that has none, in id order and batches.
+    commit, if given, is called after each batch. Returns the number of transactions
+    assigned a merchant."""
+    assigned, after = 0, 0
+    while True:
+        rows = [dict(row) for row in bind.execute(_BATCH_SQL, {"after": after, "limit": batch_size}).mappings()]
+        if not rows:
+            return assigned
+        after = rows[-1]["id"]
+        ids_by_key = resolve_merchants(bind, rows)
+        pairs = [
+            (row["id"], ids_by_key[key]) for row in rows
+            if (key := normalize_merchant_name(merchant_source(row["merchant_name"], row["name"]))) in ids_by_key
+        ]
+        if pairs:
+            bind.execute(_ASSIGN_SQL, {
+                "ids": [transaction_id for transaction_id, _ in pairs],
+                "merchant_ids": [merchant_id for _, merchant_id in pairs],
+            })
+            assigned += len(pairs)
+        if commit is not None:
+            commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the merchants table")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill = commands.add_parser("backfill", help="assign merchants to transactions that have none")
+    backfill.add_argument("--batch-size", type=int, default=MERCHANT_BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        assigned = backfill_merchant_ids(db, args.batch_size, commit=db.commit)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Assigned merchants to {assigned} transactions")
+
+if __name__ == "__main__":
+    main()
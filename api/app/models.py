@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, DECIMAL, ForeignKey, ARRAY, JSON, UniqueConstraint, Table
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Boolean, Text, DECIMAL, ForeignKey, ARRAY, JSON, LargeBinary, UniqueConstraint, Table, Index, FetchedValue
+from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -22,6 +23,12 @@ class User(Base):
     first_name = Column(String(100))
     last_name = Column(String(100))
     plaid_user_id = Column(String(255), unique=True)
+    # Bumped whenever the user's account memberships change; keys the access cache (access.py)
+    access_version = Column(Integer, nullable=False, default=0, server_default='0')
+    # Last change sequence number handed out for this user's writes (see api/sync.py)
+    change_seq = Column(BigInteger, nullable=False, server_default='0')
+    # Tombstones up to this sequence number have been pruned; older sync cursors get a full snapshot
+    sync_min_seq = Column(BigInteger, nullable=False, server_default='0')
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -31,13 +38,32 @@ class User(Base):
     budget_settings = relationship("UserBudgetSettings", back_populates="user", uselist=False, cascade="all, delete-orphan")
     budget_templates = relationship("BudgetTemplate", back_populates="user", cascade="all, delete-orphan")
     accounts = relationship("Account", secondary=user_accounts, back_populates="users")
-    transactions = relationship("Transaction", back_populates="user", cascade="all, delete-orphan")
+    # passive_deletes: the database cascades deletes, the ORM does not load children first
+    transactions = relationship("Transaction", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    refresh_tokens = relationship("RefreshToken", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+
+class RefreshToken(Base):
+    """Long-lived refresh token - only the SHA-256 hash of the token is stored"""
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    family_id = Column(String(64), nullable=False, index=True)  # Shared by every token in one rotation chain
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    user = relationship("User", back_populates="refresh_tokens")
 
 class Account(Base):
     __tablename__ = "accounts"
     
     id = Column(Integer, primary_key=True, index=True)
     plaid_item_id = Column(Integer)
+    # Plaid's account id, which transactions from /transactions/sync refer to (see api/plaid_sync.py)
+    plaid_account_id = Column(String(255), unique=True)
     name = Column(String(255), nullable=False)
     official_name = Column(String(500))
     type = Column(String(50), nullable=False)
@@ -48,12 +74,57 @@ class Account(Base):
     balance_limit = Column(DECIMAL(15, 2))
     balance_iso_currency_code = Column(String(3))
     verification_status = Column(String(50))
+    # Bumped by database triggers whenever a transaction on the account changes (see analytics.py)
+    data_version = Column(Integer, nullable=False, server_default='0')
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     users = relationship("User", secondary=user_accounts, back_populates="accounts")
-    transactions = relationship("Transaction", back_populates="account", cascade="all, delete-orphan")
+    transactions = relationship("Transaction", back_populates="account", cascade="all, delete-orphan", passive_deletes=True)
+
+class PlaidItem(Base):
+    """A linked Plaid item (one institution login) and where its transactions sync left off"""
+    __tablename__ = "plaid_items"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    item_id = Column(String(255), unique=True, nullable=False)  # Plaid's item id, as sent in webhooks
+    access_token = Column(String(255), nullable=False)
+    institution_id = Column(String(255))
+    institution_name = Column(String(255))
+    webhook_url = Column(String(500))
+    available_products = Column(ARRAY(String))
+    billed_products = Column(ARRAY(String))
+    # /transactions/sync cursor after the last completed sync; NULL syncs the full history
+    transactions_cursor = Column(Text)
+    error_code = Column(String(100))  # From the last ITEM ERROR webhook, cleared by a successful sync
+    last_synced_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class PlaidSyncJob(Base):
+    """A transactions sync of one Plaid item, queued by webhooks"""
+    __tablename__ = "plaid_sync_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    plaid_item_id = Column(Integer, ForeignKey("plaid_items.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    webhook_code = Column(String(50))  # Webhook that queued the job
+    webhook_count = Column(Integer, nullable=False, default=1)  # Webhooks coalesced into the job
+    added = Column(Integer, nullable=False, default=0)
+    modified = Column(Integer, nullable=False, default=0)
+    removed = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    completed_at = Column(DateTime(timezone=True))
+    
+    __table_args__ = (
+        Index('ix_plaid_sync_jobs_item_status', 'plaid_item_id', 'status'),
+        # At most one queued job per item: webhooks arriving before it starts join it
+        Index('uq_plaid_sync_jobs_pending', 'plaid_item_id', unique=True, postgresql_where=(status == 'pending')),
+    )
 
 class Category(Base):
     __tablename__ = "categories"
@@ -72,7 +143,7 @@ class Category(Base):
     user = relationship("User", back_populates="categories")
     subcategories = relationship("Subcategory", back_populates="category", cascade="all, delete-orphan")
     # Direct transactions assigned to this category
-    transactions_as_custom_category = relationship("Transaction", foreign_keys="Transaction.custom_category_id", back_populates="custom_category")
+    transactions_as_custom_category = relationship("Transaction", foreign_keys="Transaction.custom_category_id", back_populates="custom_category", passive_deletes=True)
     # Transactions where subcategory belongs to this category (parent-child relationship)
     # Gets all transactions whose subcategory has this category as its parent
     transactions_as_category = relationship(
@@ -105,34 +176,58 @@ class Subcategory(Base):
     # Relationships
     user = relationship("User", back_populates="subcategories")
     category = relationship("Category", back_populates="subcategories")
-    transactions_as_subcategory = relationship("Transaction", foreign_keys="Transaction.custom_subcategory_id", back_populates="custom_subcategory")
+    transactions_as_subcategory = relationship("Transaction", foreign_keys="Transaction.custom_subcategory_id", back_populates="custom_subcategory", passive_deletes=True)
+
+class Merchant(Base):
+    """A normalized merchant shared by every transaction that names it"""
+    __tablename__ = "merchants"
+    
+    id = Column(Integer, primary_key=True)
+    normalized_name = Column(String(255), nullable=False, unique=True)  # Lowercased lookup key
+    display_name = Column(String(255), nullable=False)
+    merchant_entity_id = Column(String(255), index=True)  # Plaid's merchant id
+    logo_url = Column(String(500))
+    website = Column(String(500))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class Transaction(Base):
     __tablename__ = "transactions"
     
-    id = Column(Integer, primary_key=True, index=True)
+    # The table is range-partitioned on date (see api/partitions.py), so the primary key
+    # and unique constraints include date; the ORM still identifies rows by id alone
+    id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=True)
-    plaid_transaction_id = Column(String(255), unique=True)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=True, index=True)
+    plaid_transaction_id = Column(String(255))
     amount = Column(DECIMAL(15, 2), nullable=False)
     iso_currency_code = Column(String(3))
-    date = Column(DateTime(timezone=True), nullable=False)
+    date = Column(DateTime(timezone=True), primary_key=True, nullable=False)
     datetime = Column(DateTime(timezone=True))
     name = Column(String(500), nullable=False)
     merchant_name = Column(String(255))
-    merchant_entity_id = Column(String(255))
-    logo_url = Column(String(500))
-    website = Column(String(500))
+    # Normalized merchant (see api/merchants.py); entity id, logo and website live there
+    merchant_id = Column(Integer, ForeignKey("merchants.id", ondelete="SET NULL"))
     authorized_date = Column(DateTime(timezone=True))
     authorized_datetime = Column(DateTime(timezone=True))
     pending = Column(Boolean, default=False)
+    # For posted transactions: the plaid_transaction_id of the pending transaction it replaces
+    pending_transaction_id = Column(String(255), index=True)
     transaction_type = Column(String(50))
     
     # Custom categorization fields
     custom_category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"))
     custom_subcategory_id = Column(Integer, ForeignKey("subcategories.id", ondelete="SET NULL"))
+    # custom_category_id, else the parent category of custom_subcategory_id. Maintained by
+    # database triggers (see migration 0006) so every write path - including FK SET NULL
+    # actions and subcategory re-parenting - keeps it current
+    effective_category_id = Column(Integer, server_default=FetchedValue(), server_onupdate=FetchedValue())
     notes = Column(Text)
     tags = Column(ARRAY(String))
+    # Hash of account, day, amount and normalized merchant name (see api/duplicates.py)
+    fingerprint = Column(LargeBinary)
+    # Sum of the transaction's splits, None when it has none; the rest of the amount stays
+    # in the transaction's own category. Maintained by database triggers (migration 0016)
+    split_amount = Column(DECIMAL(15, 2))
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -142,6 +237,146 @@ class Transaction(Base):
     account = relationship("Account", back_populates="transactions")
     custom_category = relationship("Category", foreign_keys=[custom_category_id], back_populates="transactions_as_custom_category")
     custom_subcategory = relationship("Subcategory", foreign_keys=[custom_subcategory_id], back_populates="transactions_as_subcategory")
+    merchant = relationship("Merchant", lazy="joined")
+    
+    merchant_entity_id = association_proxy("merchant", "merchant_entity_id")
+    logo_url = association_proxy("merchant", "logo_url")
+    website = association_proxy("merchant", "website")
+    
+    __table_args__ = (
+        # Candidate lookup for pending -> posted reconciliation; pending rows are few, so keep the index partial
+        Index('ix_transactions_pending_lookup', 'user_id', 'account_id', 'date', postgresql_where=(pending == True)),
+        # Also serves the ON DELETE CASCADE lookup when a user is deleted
+        Index('ix_transactions_user_date', 'user_id', 'date'),
+        # Category filters and roll-ups
+        Index('ix_transactions_user_effective_category_date', 'user_id', 'effective_category_id', 'date'),
+        # Per-merchant roll-ups and matching
+        Index('ix_transactions_user_merchant_date', 'user_id', 'merchant_id', 'date'),
+        # Duplicate checks on insert
+        Index('ix_transactions_user_fingerprint', 'user_id', 'fingerprint'),
+        # Also serves plaid_transaction_id lookups
+        UniqueConstraint('plaid_transaction_id', 'date', name='uq_transactions_plaid_transaction_id_date'),
+        {'postgresql_partition_by': 'RANGE (date)'},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+class TransactionSplit(Base):
+    """Part of a transaction's amount allocated to another category or subcategory"""
+    __tablename__ = "transaction_splits"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # No foreign key: transactions rows move between partitions. Triggers (migration 0016)
+    # delete the splits with their transaction and keep transaction_date equal to its date
+    transaction_id = Column(Integer, nullable=False, index=True)
+    transaction_date = Column(DateTime(timezone=True), nullable=False)
+    amount = Column(DECIMAL(15, 2), nullable=False)
+    custom_category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"))
+    custom_subcategory_id = Column(Integer, ForeignKey("subcategories.id", ondelete="SET NULL"))
+    # As on transactions: custom_category_id, else the parent category of custom_subcategory_id
+    effective_category_id = Column(Integer, server_default=FetchedValue(), server_onupdate=FetchedValue())
+    notes = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index('ix_transaction_splits_user_date', 'user_id', 'transaction_date'),
+    )
+
+class PlaidTransactionId(Base):
+    """Which transaction holds a Plaid transaction id. The partitioned transactions table can
+    only enforce uniqueness per date; this one enforces it globally."""
+    __tablename__ = "plaid_transaction_ids"
+
+    plaid_transaction_id = Column(String(255), primary_key=True)
+    # Kept by triggers (migration 0017) as transactions are inserted, updated and deleted.
+    # No foreign key, as with transaction_splits
+    transaction_id = Column(Integer, nullable=False, index=True)
+    transaction_date = Column(DateTime(timezone=True), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+
+# Read-only view (migration 0016) that aggregations group over instead of transactions:
+# one row per unsplit transaction, per split, and per split transaction's remainder, so
+# split and unsplit transactions sum in one query. Left out of autogenerate (info).
+transaction_allocations = Table(
+    "transaction_allocations",
+    Base.metadata,
+    Column("transaction_id", Integer),
+    Column("split_id", Integer),
+    Column("user_id", Integer),
+    Column("account_id", Integer),
+    Column("date", DateTime(timezone=True)),
+    Column("pending", Boolean),
+    Column("category_id", Integer),
+    Column("subcategory_id", Integer),
+    Column("amount", DECIMAL(15, 2)),
+    info={"is_view": True}
+)
+
+class TransactionArchiveChunk(Base):
+    """One user's archived transactions on one account for one month, as a compressed Parquet blob"""
+    __tablename__ = "transaction_archive_chunks"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=True, index=True)
+    month = Column(Date, nullable=False)  # First day of the month (UTC)
+    row_count = Column(Integer, nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # Parquet (zstd) with every transactions column
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index('ix_transaction_archive_chunks_user_month', 'user_id', 'month'),
+    )
+
+class TransactionArchiveRollup(Base):
+    """Monthly totals of archived transactions per account and effective category"""
+    __tablename__ = "transaction_archive_rollups"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=True, index=True)
+    month = Column(Date, nullable=False)
+    category_id = Column(Integer)  # effective_category_id when archived; not a foreign key, categories may go away
+    transaction_count = Column(Integer, nullable=False)
+    expense_total = Column(DECIMAL(15, 2), nullable=False)  # Sum of |amount| over negative amounts
+    income_total = Column(DECIMAL(15, 2), nullable=False)
+    
+    # The archive job adds to existing rows, so NULL account/category must conflict too
+    __table_args__ = (
+        UniqueConstraint('user_id', 'month', 'account_id', 'category_id', name='uq_transaction_archive_rollup', postgresql_nulls_not_distinct=True),
+    )
+
+class ChangeLogEntry(Base):
+    """Latest change to one of a user's entities, written by database triggers (see migration 0012)"""
+    __tablename__ = "change_log"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    entity_type = Column(String(32), primary_key=True)  # transactions, accounts, categories, subcategories, budgets, budget_settings
+    entity_id = Column(Integer, primary_key=True)
+    seq = Column(BigInteger, nullable=False)  # The user's change_seq when the entity last changed
+    deleted = Column(Boolean, nullable=False, default=False)  # Tombstone
+    changed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    
+    __table_args__ = (
+        Index('ix_change_log_user_seq', 'user_id', 'seq'),
+    )
+
+class PurgeJob(Base):
+    """Background deletion of an account or user too large to delete in one request"""
+    __tablename__ = "purge_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    # Requesting user - kept as NULL once a user purge removes the user itself
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), index=True)
+    target_type = Column(String(20), nullable=False)  # 'account' or 'user'
+    target_id = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    total_rows = Column(Integer, nullable=False, default=0)  # Transactions to delete when the job was created
+    deleted_rows = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    completed_at = Column(DateTime(timezone=True))
 
 class UserBudgetSettings(Base):
     """User's budget settings: monthly income and savings goal"""
@@ -151,6 +386,8 @@ class UserBudgetSettings(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), unique=True, nullable=False)
     monthly_income = Column(DECIMAL(15, 2), nullable=False)
     monthly_savings_goal = Column(DECIMAL(15, 2), nullable=False)
+    # Percentages of a budget entry's amount at which a budget alert fires (see api/alerts.py)
+    alert_thresholds = Column(ARRAY(Integer), nullable=False, server_default='{80,100}')
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -166,6 +403,8 @@ class BudgetTemplate(Base):
     month = Column(Integer, nullable=False)  # Month number (1-12)
     year = Column(Integer, nullable=False)  # Year (e.g., 2024)
     total_budget = Column(DECIMAL(15, 2), nullable=False)  # Total budget for the month
+    # The default template stands in for months without a budget of their own
+    is_default = Column(Boolean, nullable=False, default=False, server_default='false')
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -176,6 +415,8 @@ class BudgetTemplate(Base):
     # Unique constraint: one budget per user per month/year
     __table_args__ = (
         UniqueConstraint('user_id', 'year', 'month', name='uq_user_monthly_budget'),
+        # At most one default template per user
+        Index('uq_user_default_budget', 'user_id', unique=True, postgresql_where=(is_default == True)),
     )
 
 class BudgetTemplateEntry(Base):
@@ -196,7 +437,46 @@ class BudgetTemplateEntry(Base):
     subcategory = relationship("Subcategory")
     
     # Unique constraint: one entry per category/subcategory per template
+    # NULLS NOT DISTINCT so category-level entries (subcategory_id NULL) conflict too - the upsert relies on it
+    __table_args__ = (
+        UniqueConstraint('template_id', 'category_id', 'subcategory_id', name='uq_template_entry', postgresql_nulls_not_distinct=True),
+    )
+
+class BudgetSpend(Base):
+    """Running expense total per user, month, effective category and subcategory, kept by database triggers"""
+    __tablename__ = "budget_spend"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    month = Column(Date, nullable=False)  # First day of the month (UTC)
+    category_id = Column(Integer, nullable=False)  # effective_category_id
+    subcategory_id = Column(Integer)  # custom_subcategory_id
+    spent = Column(DECIMAL(15, 2), nullable=False)  # Sum of |amount| over negative amounts
+    
+    __table_args__ = (
+        UniqueConstraint('user_id', 'month', 'category_id', 'subcategory_id', name='uq_budget_spend', postgresql_nulls_not_distinct=True),
+    )
+
+class BudgetAlert(Base):
+    """A budget entry's spending crossed one of the user's alert thresholds - recorded once per month"""
+    __tablename__ = "budget_alerts"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    month = Column(Date, nullable=False)
+    template_id = Column(Integer, ForeignKey("budget_templates.id", ondelete="SET NULL"))
+    # The budget entry's category/subcategory; not foreign keys, alerts outlive categories
+    category_id = Column(Integer)
+    subcategory_id = Column(Integer)
+    threshold = Column(Integer, nullable=False)  # Percent of budgeted_amount
+    budgeted_amount = Column(DECIMAL(15, 2), nullable=False)
+    spent = Column(DECIMAL(15, 2), nullable=False)  # When the alert fired
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    notified_at = Column(DateTime(timezone=True))  # Pushed to the user's event streams
+    
     __table_args__ = (
-        UniqueConstraint('template_id', 'category_id', 'subcategory_id', name='uq_template_entry'),
+        UniqueConstraint('user_id', 'month', 'category_id', 'subcategory_id', 'threshold', name='uq_budget_alert', postgresql_nulls_not_distinct=True),
+        # Undelivered alerts, drained after each transaction write
+        Index('ix_budget_alerts_undelivered', 'user_id', postgresql_where=(notified_at == None)),
     )
 
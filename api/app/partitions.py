@@ -0,0 +1,211 @@
+"""Range partitioning of the transactions table by date.
+
+Migration 0009 turns transactions into a partitioned table with one partition per
+month (or per year, see TRANSACTION_PARTITION_INTERVAL) plus a default partition
+that catches dates no partition covers yet. Queries that filter on `date` only scan
+the partitions in range (partition pruning), and old partitions can be vacuumed,
+detached or dropped on their own without touching recent data.
+
+Partitions for upcoming periods must exist before rows for them arrive, otherwise
+those rows land in the default partition. The API creates the next
+TRANSACTION_PARTITIONS_AHEAD partitions on startup; run this module from cron to
+keep them coming on long-lived deployments:
+
+    python -m api.partitions ensure
+    python -m api.partitions list
+    python -m api.partitions detach --before 2020-01-01 [--drop]
+"""
+import argparse
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from api.database import engine
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_PARTITION_INTERVAL = os.getenv("TRANSACTION_PARTITION_INTERVAL", "month")
+TRANSACTION_PARTITIONS_AHEAD = int(os.getenv("TRANSACTION_PARTITIONS_AHEAD", "3"))
+
+PARENT_TABLE = "transactions"
+DEFAULT_PARTITION = "transactions_default"
+INTERVALS = ("month", "year")
+
+# transactions_p2024_03 (monthly) / transactions_p2024 (yearly)
+_PARTITION_NAME = re.compile(r"^transactions_p(\d{4})(?:_(\d{2}))?$")
+
+# Serializes partition maintenance between workers starting at the same time
+_MAINTENANCE_LOCK_ID = 0x7472616E  # "tran"
+
+def period_start(day: date, interval: str) -> date:
+    """First day of the month/year containing day"""
+    return date(day.year, day.month, 1) if interval == "month" else date(day.year, 1, 1)
+
+def next_period(start: date, interval: str, count: int = 1) -> date:
+    """Start of the period `count` periods after start"""
+    if interval == "year":
+        return date(start.year + count, 1, 1)
+    months = start.year * 12 + start.month - 1 + count
+    return date(months // 12, months % 12 + 1, 1)
+
+def partition_name(start: date, interval: str) -> str:
+    if interval == "month":
+        return f"transactions_p{start.year:04d}_{start.month:02d}"
+    return f"transactions_p{start.year:04d}"
+
+def partition_range(name: str) -> Optional[Tuple[date, date, str]]:
+    """(start, end, interval) of a partition from its name, or None for other tables"""
+    match = _PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    year, month = int(match.group(1)), match.group(2)
+    interval = "month" if month else "year"
+    start = date(year, int(month) if month else 1, 1)
+    return start, next_period(start, interval), interval
+
+def _utc_bound(day: date) -> str:
+    # Explicit UTC offset so the bounds don't depend on the session's TimeZone
+    return f"{day.isoformat()} 00:00:00+00"
+
+def is_partitioned(conn: Connection) -> bool:
+    return conn.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"
+    ), {"table": PARENT_TABLE}).scalar() or False
+
+def list_partitions(conn: Connection) -> List[Tuple[str, str, int]]:
+    """(name, bound expression, estimated rows) of each partition"""
+    return [tuple(row) for row in conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), GREATEST(c.reltuples, 0)::bigint
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table)
+        ORDER BY c.relname
+    """), {"table": PARENT_TABLE})]
+
+def partition_interval(conn: Connection) -> str:
+    """Interval of the existing partitions, falling back to TRANSACTION_PARTITION_INTERVAL"""
+    for name, _, _ in reversed(list_partitions(conn)):
+        bounds = partition_range(name)
+        if bounds is not None:
+            return bounds[2]
+    return TRANSACTION_PARTITION_INTERVAL
+
+def create_partition(conn: Connection, start: date, interval: str, parent: str = PARENT_TABLE) -> Optional[str]:
+    """Create the partition for the period starting at start. Returns its name, or None if it exists.
+
+    Rows for the period that already landed in the default partition are moved into
+    the new one (PostgreSQL refuses to create the partition while they are there).
+    """
+    name = partition_name(start, interval)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return None
+
+    lower, upper = _utc_bound(start), _utc_bound(next_period(start, interval))
+    params = {"lower": lower, "upper": upper}
+    has_default = conn.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar() is not None
+    stranded = has_default and conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= CAST(:lower AS timestamptz) AND date < CAST(:upper AS timestamptz))"
+    ), params).scalar()
+
+    if stranded:
+        conn.execute(text(f"CREATE TEMP TABLE stranded_transactions (LIKE {parent})"))
+        conn.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE date >= CAST(:lower AS timestamptz) AND date < CAST(:upper AS timestamptz)
+                RETURNING *
+            )
+            INSERT INTO stranded_transactions SELECT * FROM moved
+        """), params)
+
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {parent} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    ))
+
+    if stranded:
+        # The rows only change partitions: keep them out of the change log and budget spend
+        # totals (the DELETE above went to the partition directly and fired no triggers on them)
+        previous = conn.execute(text("SELECT current_setting('app.change_log', true)")).scalar() or ""
+        conn.execute(text("SELECT set_config('app.change_log', 'off', true)"))
+        conn.execute(text(f"INSERT INTO {parent} SELECT * FROM stranded_transactions"))
+        conn.execute(text("SELECT set_config('app.change_log', :previous, true)"), {"previous": previous})
+        conn.execute(text("DROP TABLE stranded_transactions"))
+        logger.info("Moved default-partition rows into %s", name)
+    return name
+
+def create_default_partition(conn: Connection, parent: str = PARENT_TABLE) -> None:
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {parent} DEFAULT"))
+
+def ensure_partitions(conn: Connection, first: date, last: date, interval: str, parent: str = PARENT_TABLE) -> List[str]:
+    """Create any missing partitions for the periods from first through last. Returns the new names."""
+    created = []
+    start = period_start(first, interval)
+    while start <= last:
+        name = create_partition(conn, start, interval, parent)
+        if name is not None:
+            created.append(name)
+        start = next_period(start, interval)
+    return created
+
+def ensure_future_partitions(ahead: int = TRANSACTION_PARTITIONS_AHEAD) -> List[str]:
+    """Create partitions for the current period and the next `ahead` ones (no-op before migration 0009)"""
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _MAINTENANCE_LOCK_ID})
+        interval = partition_interval(conn)
+        current = period_start(datetime.now(timezone.utc).date(), interval)
+        created = ensure_partitions(conn, current, next_period(current, interval, ahead), interval)
+    if created:
+        logger.info("Created transaction partitions: %s", ", ".join(created))
+    return created
+
+def detach_partitions(before: date, drop: bool = False) -> List[str]:
+    """Detach (or drop) the partitions that end on or before `before`.
+
+    A detached partition is an ordinary table named like the partition: it can be
+    dumped, archived or vacuumed on its own, and reattached with ALTER TABLE
+    transactions ATTACH PARTITION.
+    """
+    detached = []
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _MAINTENANCE_LOCK_ID})
+        for name, _, _ in list_partitions(conn):
+            bounds = partition_range(name)
+            if bounds is None or bounds[1] > before:
+                continue
+            conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            if drop:
+                conn.execute(text(f"DROP TABLE {name}"))
+            detached.append(name)
+    return detached
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the transactions table partitions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="create partitions for the coming periods")
+    ensure.add_argument("--ahead", type=int, default=TRANSACTION_PARTITIONS_AHEAD)
+    commands.add_parser("list", help="show partitions and estimated row counts")
+    detach = commands.add_parser("detach", help="detach partitions that end on or before a date")
+    detach.add_argument("--before", type=date.fromisoformat, required=True)
+    detach.add_argument("--drop", action="store_true", help="drop the detached partitions")
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        created = ensure_future_partitions(args.ahead)
+        print("\n".join(created) if created else "All partitions exist")
+    elif args.command == "list":
+        with engine.connect() as conn:
+            for name, bound, rows in list_partitions(conn):
+                print(f"{name:28} {rows:>12}  {bound}")
+    else:
+        names = detach_partitions(args.before, args.drop)
+        print("\n".join(names) if names else "Nothing to detach")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
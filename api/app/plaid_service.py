@@ -1,14 +1,78 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
 import os
-import plaid
-from plaid.api import plaid_api
+import random
+import threading
+import time
 
-from plaid.model.transactions_get_request import TransactionsGetRequest
-from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
-from plaid.model.accounts_get_request import AccountsGetRequest
-from plaid.configuration import Configuration
-from plaid.api_client import ApiClient
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from datetime import datetime, date
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+
+from api.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# The plaid SDK is large (hundreds of generated model modules), so it is imported
+# lazily inside the methods that need it rather than at module load.
+
+# Institution metadata almost never changes; account metadata (and balances) more often
+PLAID_INSTITUTION_CACHE_TTL_SECONDS = float(os.getenv("PLAID_INSTITUTION_CACHE_TTL_SECONDS", "86400"))
+PLAID_ACCOUNTS_CACHE_TTL_SECONDS = float(os.getenv("PLAID_ACCOUNTS_CACHE_TTL_SECONDS", "300"))
+PLAID_CACHE_MAX_ENTRIES = int(os.getenv("PLAID_CACHE_MAX_ENTRIES", "1000"))
+# Directory to persist the institution cache in across restarts (memory only when unset)
+PLAID_CACHE_DIR = os.getenv("PLAID_CACHE_DIR")
+
+# The SDK is blocking: requests run on a dedicated thread pool, and each holds a slot of
+# the global limit (sized to the Plaid quota) and of its item's limit while in flight
+PLAID_WORKER_THREADS = int(os.getenv("PLAID_WORKER_THREADS", "32"))
+PLAID_MAX_CONCURRENCY = int(os.getenv("PLAID_MAX_CONCURRENCY", "16"))
+PLAID_MAX_CONCURRENCY_PER_ITEM = int(os.getenv("PLAID_MAX_CONCURRENCY_PER_ITEM", "2"))
+# Keep-alive HTTP connections; fewer than the concurrency limit and the surplus reconnects every time
+PLAID_HTTP_POOL_SIZE = int(os.getenv("PLAID_HTTP_POOL_SIZE", str(PLAID_MAX_CONCURRENCY)))
+PLAID_RATE_LIMIT_RETRIES = int(os.getenv("PLAID_RATE_LIMIT_RETRIES", "5"))
+PLAID_BACKOFF_BASE_SECONDS = float(os.getenv("PLAID_BACKOFF_BASE_SECONDS", "0.5"))
+PLAID_BACKOFF_MAX_SECONDS = float(os.getenv("PLAID_BACKOFF_MAX_SECONDS", "30"))
+
+def _item_key(access_token: str) -> str:
+    # Access tokens are credentials - don't keep them as dictionary keys
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+def _is_rate_limited(error) -> bool:
+    if error.status == 429:
+        return True
+    try:
+        return json.loads(error.body).get("error_type") == "RATE_LIMIT_EXCEEDED"
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+class _ItemSlots:
+    """Per-item semaphores, created on first use and dropped once nobody holds or waits for them"""
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.slots: Dict[str, list] = {}  # key -> [semaphore, holders and waiters]
+    
+    @contextmanager
+    def hold(self, key: str):
+        with self.lock:
+            entry = self.slots.get(key)
+            if entry is None:
+                entry = self.slots[key] = [threading.Semaphore(self.limit), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.slots[key]
 
 class PlaidService:
     def __init__(self):
@@ -16,33 +80,99 @@ class PlaidService:
         self.secret = os.getenv("PLAID_SECRET")
         self.environment = os.getenv("PLAID_ENV", "sandbox")
         
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._executor = None
+        self._global_slots = threading.BoundedSemaphore(PLAID_MAX_CONCURRENCY)
+        self._item_slots = _ItemSlots(PLAID_MAX_CONCURRENCY_PER_ITEM)
+        
+        self.institution_cache = TTLCache(
+            PLAID_CACHE_MAX_ENTRIES, PLAID_INSTITUTION_CACHE_TTL_SECONDS,
+            path=os.path.join(PLAID_CACHE_DIR, "plaid_institutions.json") if PLAID_CACHE_DIR else None
+        )
+        # Never persisted: entries are keyed by access token and hold balances
+        self.accounts_cache = TTLCache(PLAID_CACHE_MAX_ENTRIES, PLAID_ACCOUNTS_CACHE_TTL_SECONDS)
+    
+    @property
+    def client(self):
+        """The Plaid API client, built on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._setup_client()
+        return self._client
+    
+    def _setup_client(self):
+        """Setup the Plaid API client"""
+        import plaid
+        from plaid.api import plaid_api
+        from plaid.configuration import Configuration
+        from plaid.api_client import ApiClient
+        
         # Map environment to Plaid host
-        self.host_map = {
+        host_map = {
             "sandbox": plaid.Environment.Sandbox,
             "development": plaid.Environment.Development,
             "production": plaid.Environment.Production
         }
         
-        self._setup_client()
-    
-    def _setup_client(self):
-        """Setup the Plaid API client"""
         configuration = Configuration(
-            host=self.host_map[self.environment],
+            host=host_map[self.environment],
             api_key={
                 "clientId": self.client_id,
                 "secret": self.secret
             }
         )
+        configuration.connection_pool_maxsize = PLAID_HTTP_POOL_SIZE
         api_client = ApiClient(configuration)
-        self.client = plaid_api.PlaidApi(api_client)
+        return plaid_api.PlaidApi(api_client)
     
-    async def get_accounts(self, access_token: str) -> List[Dict[str, Any]]:
-        """Get accounts for a given access token"""
+    def _request(self, operation: str, request, access_token: Optional[str] = None):
+        """Call a PlaidApi operation within the global and (given its access token) the
+        item's concurrency limit, retrying RATE_LIMIT_EXCEEDED with jittered exponential
+        backoff. Blocking; coroutines go through _run."""
+        from plaid.exceptions import ApiException
+        
+        item_slot = self._item_slots.hold(_item_key(access_token)) if access_token else nullcontext()
+        with item_slot:
+            for attempt in range(PLAID_RATE_LIMIT_RETRIES + 1):
+                with self._global_slots:
+                    try:
+                        return getattr(self.client, operation)(request)
+                    except ApiException as e:
+                        if not _is_rate_limited(e) or attempt == PLAID_RATE_LIMIT_RETRIES:
+                            raise
+                # Full jitter, so a throttled fan-out doesn't retry in lockstep; the global
+                # slot is released meanwhile, the item's is kept
+                delay = random.uniform(0, min(PLAID_BACKOFF_MAX_SECONDS, PLAID_BACKOFF_BASE_SECONDS * 2 ** attempt))
+                logger.warning("Plaid %s rate limited, retrying in %.2fs", operation, delay)
+                time.sleep(delay)
+    
+    async def _run(self, function, *args):
+        """Run a blocking call on the Plaid thread pool"""
+        if self._executor is None:
+            with self._client_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=PLAID_WORKER_THREADS, thread_name_prefix="plaid")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(function, *args))
+    
+    def close(self) -> None:
+        """Stop the thread pool; requests in flight finish, later ones start a new pool"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+    
+    async def get_accounts(self, access_token: str, refresh: bool = False) -> List[Dict[str, Any]]:
+        """Get accounts for a given access token (cached; refresh skips the cache)"""
         try:
-            request = AccountsGetRequest(access_token=access_token)
-            response = self.client.accounts_get(request)
-            return response["accounts"]
+            from plaid.model.accounts_get_request import AccountsGetRequest
+            
+            def load():
+                request = AccountsGetRequest(access_token=access_token)
+                return self._request("accounts_get", request, access_token).to_dict()["accounts"]
+            
+            return await self._run(self.accounts_cache.get_or_load, _item_key(access_token), load, refresh)
         except Exception as e:
             raise Exception(f"Failed to get accounts: {str(e)}")
     
@@ -55,6 +185,9 @@ class PlaidService:
     ) -> List[Dict[str, Any]]:
         """Get transactions for a given access token and date range"""
         try:
+            from plaid.model.transactions_get_request import TransactionsGetRequest
+            from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
+            
             options = TransactionsGetRequestOptions()
             if account_ids:
                 options.account_ids = account_ids
@@ -65,11 +198,50 @@ class PlaidService:
                 end_date=end_date,
                 options=options
             )
-            response = self.client.transactions_get(request)
+            response = await self._run(self._request, "transactions_get", request, access_token)
             return response["transactions"]
         except Exception as e:
             raise Exception(f"Failed to get transactions: {str(e)}")
     
+    def sync_transactions(self, access_token: str, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Every transaction change since cursor (all history without one): added, modified,
+        removed and the next_cursor to store, paging through /transactions/sync"""
+        try:
+            from plaid.exceptions import ApiException
+            from plaid.model.transactions_sync_request import TransactionsSyncRequest
+            
+            for attempt in range(3):
+                changes = {"added": [], "modified": [], "removed": [], "next_cursor": cursor}
+                try:
+                    while True:
+                        request = TransactionsSyncRequest(access_token=access_token)
+                        if changes["next_cursor"]:
+                            request.cursor = changes["next_cursor"]
+                        response = self._request("transactions_sync", request, access_token).to_dict()
+                        for key in ("added", "modified", "removed"):
+                            changes[key].extend(response[key])
+                        changes["next_cursor"] = response["next_cursor"]
+                        if not response["has_more"]:
+                            return changes
+                except ApiException as e:
+                    # Data changed while paging - Plaid asks to start over from the original cursor
+                    if "TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION" in str(e.body) and attempt < 2:
+                        continue
+                    raise
+        except Exception as e:
+            raise Exception(f"Failed to sync transactions: {str(e)}")
+    
+    def get_webhook_verification_key(self, key_id: str) -> Dict[str, Any]:
+        """The JWK Plaid signs webhooks with, by its key id"""
+        try:
+            from plaid.model.webhook_verification_key_get_request import WebhookVerificationKeyGetRequest
+            
+            request = WebhookVerificationKeyGetRequest(key_id=key_id)
+            response = self._request("webhook_verification_key_get", request)
+            return response.to_dict()["key"]
+        except Exception as e:
+            raise Exception(f"Failed to get webhook verification key: {str(e)}")
+    
     async def get_transaction_details(self, access_token: str, transaction_id: str) -> Dict[str, Any]:
         """Get detailed information for a specific transaction"""
         try:
@@ -97,7 +269,7 @@ class PlaidService:
                 user=user
             )
             
-            response = self.client.link_token_create(request)
+            response = self._request("link_token_create", request)
             return response["link_token"]
         except Exception as e:
             raise Exception(f"Failed to create link token: {str(e)}")
@@ -108,7 +280,7 @@ class PlaidService:
             from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
             
             request = ItemPublicTokenExchangeRequest(public_token=public_token)
-            response = self.client.item_public_token_exchange(request)
+            response = self._request("item_public_token_exchange", request)
             return {
                 "access_token": response["access_token"],
                 "item_id": response["item_id"]
@@ -122,11 +294,23 @@ class PlaidService:
             from plaid.model.institutions_get_by_id_request import InstitutionsGetByIdRequest
             from plaid.model.country_code import CountryCode
             
-            request = InstitutionsGetByIdRequest(
-                institution_id=institution_id,
-                country_codes=[CountryCode("US")]
-            )
-            response = self.client.institutions_get_by_id(request)
-            return response["institution"]
+            def load():
+                request = InstitutionsGetByIdRequest(
+                    institution_id=institution_id,
+                    country_codes=[CountryCode("US")]
+                )
+                return self._request("institutions_get_by_id", request).to_dict()["institution"]
+            
+            return await self._run(self.institution_cache.get_or_load, institution_id, load)
         except Exception as e:
-            raise Exception(f"Failed to get institution info: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to get institution info: {str(e)}")
+    
+    def cache_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Hit/miss counters of the metadata caches"""
+        return {
+            "institutions": self.institution_cache.metrics(),
+            "accounts": self.accounts_cache.metrics()
+        }
+
+# Shared by the API and the background sync jobs (the SDK client is built lazily on first use)
+plaid_service = PlaidService()
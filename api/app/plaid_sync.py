@@ -0,0 +1,444 @@
+"""Webhook-driven Plaid syncs.
+
+Plaid calls POST /plaid/webhook when an item has new data. Instead of re-pulling every
+item's date range on a schedule, a TRANSACTIONS webhook (SYNC_UPDATES_AVAILABLE,
+DEFAULT_UPDATE, ...) queues a sync job for exactly the item it names, so an item that
+sends no webhooks costs no API calls.
+
+Jobs are coalesced: an item has at most one pending job (a partial unique index), and
+webhooks arriving before it starts only add to its webhook_count. A job starts
+PLAID_SYNC_COALESCE_SECONDS after it is queued so a burst of webhooks ends up in one
+sync, and an item's jobs never overlap - a job queued while another one runs is
+picked up by that runner when it finishes.
+
+A sync pages through /transactions/sync from the item's stored cursor and applies the
+added, modified and removed transactions and the new cursor in one database
+transaction, then publishes sync.completed to the item owner's event streams. Plaid
+amounts are positive for money leaving the account; they are stored negated, as
+expenses are everywhere else. An added transaction that matches the fingerprint of one
+entered by hand or imported (see api/duplicates.py) takes that one over instead of
+being stored twice, and one whose Plaid id is already stored updates that transaction.
+
+Webhooks carry a Plaid-Verification JWT (ES256, signed with a key fetched by its kid)
+whose request_body_sha256 claim must match the body. With PLAID_WEBHOOK_SECRET set
+they are verified as HS256 with that secret instead, which is what the local fake
+sender signs with:
+
+    PLAID_WEBHOOK_SECRET=dev python -m api.plaid_sync send ITEM_ID --count 5
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime, time as dt_time, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from jose import JWTError, jwt
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from api.access import invalidate_account_access
+from api.alerts import deliver_budget_alerts
+from api.database import SessionLocal
+from api.duplicates import row_fingerprint, stored_duplicates
+from api.events import publish_event
+from api.merchants import merchant_source, normalize_merchant_name, resolve_merchants
+from api.models import Account, PlaidItem, PlaidSyncJob, Transaction, user_accounts
+from api.plaid_service import plaid_service
+from api.reconciliation import reconcile_pending_transactions
+
+logger = logging.getLogger(__name__)
+
+PLAID_WEBHOOK_SECRET = os.getenv("PLAID_WEBHOOK_SECRET")
+PLAID_WEBHOOK_MAX_AGE_SECONDS = int(os.getenv("PLAID_WEBHOOK_MAX_AGE_SECONDS", "300"))
+# Unknown key ids come from unauthenticated requests: look up at most one per interval,
+# and don't retry a key id Plaid failed to return for a while
+PLAID_WEBHOOK_KEY_LOOKUP_INTERVAL_SECONDS = float(os.getenv("PLAID_WEBHOOK_KEY_LOOKUP_INTERVAL_SECONDS", "10"))
+PLAID_WEBHOOK_KEY_FAILURE_TTL_SECONDS = float(os.getenv("PLAID_WEBHOOK_KEY_FAILURE_TTL_SECONDS", "3600"))
+PLAID_SYNC_COALESCE_SECONDS = float(os.getenv("PLAID_SYNC_COALESCE_SECONDS", "5"))
+# A job running longer than this is taken to be abandoned (its worker died) and no longer holds back its item
+PLAID_SYNC_TIMEOUT_SECONDS = int(os.getenv("PLAID_SYNC_TIMEOUT_SECONDS", "900"))
+
+# TRANSACTIONS webhook codes that mean there is something to sync
+SYNC_WEBHOOK_CODES = {
+    "SYNC_UPDATES_AVAILABLE", "DEFAULT_UPDATE", "INITIAL_UPDATE", "HISTORICAL_UPDATE", "TRANSACTIONS_REMOVED"
+}
+
+# Verification keys by kid; Plaid rotates keys rarely, so fetch each one once
+_verification_keys: Dict[str, Dict[str, Any]] = {}
+# kid -> monotonic time its lookup failed, and when the next lookup may run
+_failed_key_lookups: Dict[str, float] = {}
+_next_key_lookup = 0.0
+_verification_keys_lock = threading.Lock()
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail)
+
+def _verification_key(key_id: str) -> Dict[str, Any]:
+    """The verification key with this kid, or a 401 when it can't be had (now)"""
+    global _next_key_lookup
+    key = _verification_keys.get(key_id)
+    if key is not None:
+        return key
+    now = time.monotonic()
+    with _verification_keys_lock:
+        failed_at = _failed_key_lookups.get(key_id)
+        if failed_at is not None and now - failed_at < PLAID_WEBHOOK_KEY_FAILURE_TTL_SECONDS:
+            raise _unauthorized("Unknown webhook verification key")
+        if now < _next_key_lookup:
+            raise _unauthorized("Unknown webhook verification key")
+        _next_key_lookup = now + PLAID_WEBHOOK_KEY_LOOKUP_INTERVAL_SECONDS
+    try:
+        key = plaid_service.get_webhook_verification_key(key_id)
+    except Exception:
+        logger.warning("Could not get webhook verification key %r", key_id, exc_info=True)
+        with _verification_keys_lock:
+            # Forget expired failures so the map doesn't grow with every kid ever tried
+            for stale in [kid for kid, at in _failed_key_lookups.items() if now - at >= PLAID_WEBHOOK_KEY_FAILURE_TTL_SECONDS]:
+                del _failed_key_lookups[stale]
+            _failed_key_lookups[key_id] = now
+        raise _unauthorized("Unknown webhook verification key")
+    with _verification_keys_lock:
+        _verification_keys[key_id] = key
+    return key
+
+def verify_webhook(body: bytes, token: Optional[str]) -> None:
+    """Check a webhook's Plaid-Verification JWT against its raw body, or raise a 401"""
+    if not token:
+        raise _unauthorized("Missing Plaid-Verification header")
+    try:
+        header = jwt.get_unverified_header(token)
+        if PLAID_WEBHOOK_SECRET:
+            claims = jwt.decode(token, PLAID_WEBHOOK_SECRET, algorithms=["HS256"])
+        else:
+            if header.get("alg") != "ES256" or not header.get("kid"):
+                raise _unauthorized("Invalid webhook signature")
+            key = _verification_key(header["kid"])
+            if key.get("expired_at"):
+                raise _unauthorized("Webhook signed with an expired key")
+            claims = jwt.decode(token, key, algorithms=["ES256"])
+    except JWTError:
+        raise _unauthorized("Invalid webhook signature")
+    if time.time() - claims.get("iat", 0) > PLAID_WEBHOOK_MAX_AGE_SECONDS:
+        raise _unauthorized("Webhook is too old")
+    digest = hashlib.sha256(body).hexdigest()
+    if not hmac.compare_digest(digest, str(claims.get("request_body_sha256", ""))):
+        raise _unauthorized("Webhook body does not match its signature")
+
+def queue_sync(db: Session, plaid_item_id: int, webhook_code: Optional[str]) -> Tuple[int, bool]:
+    """Queue a sync of the item, or join its pending one. Returns (job id, whether the job
+    is new); the caller commits and schedules new jobs with schedule_sync."""
+    statement = pg_insert(PlaidSyncJob).values(
+        plaid_item_id=plaid_item_id, status="pending", webhook_code=webhook_code,
+        webhook_count=1, added=0, modified=0, removed=0
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[PlaidSyncJob.plaid_item_id],
+        index_where=(PlaidSyncJob.status == "pending"),
+        set_={"webhook_count": PlaidSyncJob.webhook_count + 1}
+    ).returning(PlaidSyncJob.id, PlaidSyncJob.webhook_count)
+    job_id, webhook_count = db.execute(statement).one()
+    return job_id, webhook_count == 1
+
+def receive_webhook(db: Session, body: bytes, token: Optional[str]) -> Dict[str, Any]:
+    """Verify and act on one webhook: queue (or coalesce into) a sync of its item"""
+    verify_webhook(body, token)
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Webhook body is not JSON")
+    webhook_type = payload.get("webhook_type")
+    webhook_code = payload.get("webhook_code")
+
+    item = db.query(PlaidItem).filter(PlaidItem.item_id == payload.get("item_id")).first()
+    # Acknowledge what we don't act on, or Plaid keeps retrying it
+    if item is None:
+        return {"status": "ignored"}
+    if webhook_type == "ITEM" and webhook_code == "ERROR":
+        item.error_code = (payload.get("error") or {}).get("error_code") or webhook_code
+        db.commit()
+        return {"status": "recorded"}
+    if webhook_type != "TRANSACTIONS" or webhook_code not in SYNC_WEBHOOK_CODES:
+        return {"status": "ignored"}
+
+    job_id, created = queue_sync(db, item.id, webhook_code)
+    db.commit()
+    if created:
+        schedule_sync(item.id)
+    return {"status": "queued" if created else "coalesced", "job_id": job_id}
+
+def schedule_sync(plaid_item_id: int, delay: float = PLAID_SYNC_COALESCE_SECONDS) -> None:
+    """Run the item's pending sync after delay, in the background"""
+    timer = threading.Timer(delay, run_item_syncs, args=(plaid_item_id,))
+    timer.daemon = True
+    timer.start()
+
+# Start the item's pending job unless another of its jobs is still running or the job
+# is younger than min_age seconds
+_CLAIM_SQL = text("""
+    UPDATE plaid_sync_jobs SET status = 'running', started_at = now()
+    WHERE id = (
+        SELECT pending.id FROM plaid_sync_jobs AS pending
+        WHERE pending.plaid_item_id = :item_id AND pending.status = 'pending'
+        AND pending.created_at <= now() - make_interval(secs => :min_age)
+        AND NOT EXISTS (
+            SELECT 1 FROM plaid_sync_jobs AS running
+            WHERE running.plaid_item_id = :item_id AND running.status = 'running'
+            AND running.started_at > now() - make_interval(secs => :timeout)
+        )
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id
+""")
+
+def claim_sync_job(db: Session, plaid_item_id: int, min_age: float = 0) -> Optional[int]:
+    job_id = db.execute(_CLAIM_SQL, {
+        "item_id": plaid_item_id, "min_age": min_age, "timeout": PLAID_SYNC_TIMEOUT_SECONDS
+    }).scalar()
+    db.commit()
+    return job_id
+
+def run_item_syncs(plaid_item_id: int) -> None:
+    """Run the item's pending jobs one after another until none is left"""
+    db = SessionLocal()
+    try:
+        min_age = 0
+        while True:
+            job_id = claim_sync_job(db, plaid_item_id, min_age)
+            if job_id is None:
+                return
+            run_sync_job(job_id)
+            # A job queued during the sync is still coalescing webhooks; if it's too young
+            # its own timer starts it
+            min_age = PLAID_SYNC_COALESCE_SECONDS
+    except Exception:
+        logger.exception("Sync of Plaid item %s failed", plaid_item_id)
+    finally:
+        db.close()
+
+def _transaction_values(item: PlaidItem, data: Dict[str, Any], account_ids: Dict[str, int], merchant_ids: Dict[str, int]) -> Dict[str, Any]:
+    """Transaction column values for a Plaid transaction"""
+    day = datetime.combine(data["date"], dt_time(), tzinfo=timezone.utc)
+    key = normalize_merchant_name(merchant_source(data.get("merchant_name"), data.get("name")))
+    values = {
+        "user_id": item.user_id,
+        "account_id": account_ids.get(data.get("account_id")),
+        "plaid_transaction_id": data["transaction_id"],
+        "pending_transaction_id": data.get("pending_transaction_id"),
+        "amount": -Decimal(str(data["amount"])),
+        "iso_currency_code": data.get("iso_currency_code"),
+        "date": day,
+        "datetime": data.get("datetime"),
+        "name": data.get("name") or data.get("merchant_name") or "",
+        "merchant_name": data.get("merchant_name"),
+        "merchant_id": merchant_ids.get(key),
+        "pending": bool(data.get("pending")),
+        "authorized_date": datetime.combine(data["authorized_date"], dt_time(), tzinfo=timezone.utc) if data.get("authorized_date") else None,
+        "authorized_datetime": data.get("authorized_datetime"),
+        "transaction_type": data.get("transaction_type"),
+    }
+    values["fingerprint"] = row_fingerprint(values)
+    return values
+
+def _link_accounts(db: Session, item: PlaidItem, plaid_account_ids: Iterable[str]) -> Dict[str, int]:
+    """Plaid account id -> account id for the item, creating accounts seen for the first time"""
+    account_ids = dict(
+        db.query(Account.plaid_account_id, Account.id).filter(Account.plaid_item_id == item.id)
+    )
+    missing = set(plaid_account_ids) - set(account_ids)
+    if not missing:
+        return account_ids
+
+    # get_accounts is a coroutine; this runs on a worker thread without an event loop.
+    # Something new showed up, so a cached account list won't do
+    for data in asyncio.run(plaid_service.get_accounts(item.access_token, refresh=True)):
+        if data["account_id"] in account_ids:
+            continue
+        balances = data.get("balances") or {}
+        account = Account(
+            plaid_item_id=item.id,
+            plaid_account_id=data["account_id"],
+            name=data["name"],
+            official_name=data.get("official_name"),
+            type=data["type"],
+            subtype=data.get("subtype"),
+            mask=data.get("mask"),
+            balance_available=balances.get("available"),
+            balance_current=balances.get("current"),
+            balance_limit=balances.get("limit"),
+            balance_iso_currency_code=balances.get("iso_currency_code"),
+            verification_status=data.get("verification_status")
+        )
+        db.add(account)
+        db.flush()
+        db.execute(insert(user_accounts).values(user_id=item.user_id, account_id=account.id))
+        account_ids[data["account_id"]] = account.id
+    invalidate_account_access(db, [item.user_id])
+    return account_ids
+
+def _adopt_duplicates(db: Session, item: PlaidItem, rows: List[Dict[str, Any]], posted_ids: List[int]) -> List[Dict[str, Any]]:
+    """Give stored transactions without a Plaid id (entered by hand, imported) that match an
+    added transaction's fingerprint its Plaid data, adding the posted ones to posted_ids.
+    Returns the rows that still need inserting."""
+    if not rows:
+        return rows
+    stored = stored_duplicates(db, item.user_id, rows, unsynced_only=True)
+    adopted: Dict[int, Dict[str, Any]] = {}
+    remaining = []
+    for row in rows:
+        ids = stored.get(row["fingerprint"])
+        if ids:
+            adopted[ids.pop(0)] = row
+        else:
+            remaining.append(row)
+    if adopted:
+        # Like modified transactions, they keep the user's categorization, notes and tags
+        for transaction in db.query(Transaction).filter(Transaction.id.in_(list(adopted))):
+            for column, value in adopted[transaction.id].items():
+                setattr(transaction, column, value)
+            if not transaction.pending:
+                posted_ids.append(transaction.id)
+        db.flush()
+    return remaining
+
+def apply_sync(db: Session, item: PlaidItem, changes: Dict[str, Any]) -> Dict[str, int]:
+    """Write a /transactions/sync result to the item owner's transactions; the caller commits"""
+    added: List[Dict[str, Any]] = changes["added"]
+    modified: List[Dict[str, Any]] = changes["modified"]
+    removed_ids = [data["transaction_id"] for data in changes["removed"]]
+
+    account_ids = _link_accounts(db, item, {data["account_id"] for data in added + modified})
+    merchant_ids = resolve_merchants(db, added + modified)
+
+    # Transactions already stored under their Plaid id are updated, whether modified or
+    # added again (a replayed sync, e.g. after a failed commit, or a re-sent add with a new
+    # date). Modified transactions we never stored (e.g. removed locally) are added again.
+    incoming = {data["transaction_id"]: data for data in added + modified}
+    existing = {
+        transaction.plaid_transaction_id: transaction
+        for transaction in db.query(Transaction).filter(
+            Transaction.user_id == item.user_id,
+            Transaction.plaid_transaction_id.in_(list(incoming))
+        )
+    } if incoming else {}
+    new: List[Dict[str, Any]] = []
+    for plaid_transaction_id, data in incoming.items():
+        transaction = existing.get(plaid_transaction_id)
+        if transaction is None:
+            new.append(data)
+            continue
+        # The user's categorization, notes and tags are kept
+        for column, value in _transaction_values(item, data, account_ids, merchant_ids).items():
+            setattr(transaction, column, value)
+    db.flush()
+
+    posted_ids: List[int] = []
+    rows = _adopt_duplicates(db, item, [_transaction_values(item, data, account_ids, merchant_ids) for data in new], posted_ids)
+    if rows:
+        # Plaid ids are unique across all transactions (migration 0017), so these are all new
+        statement = insert(Transaction).values(rows).returning(Transaction.id, Transaction.pending)
+        posted_ids += [transaction_id for transaction_id, pending in db.execute(statement) if not pending]
+
+    removed = 0
+    if removed_ids:
+        removed = db.execute(delete(Transaction).where(
+            Transaction.user_id == item.user_id,
+            Transaction.plaid_transaction_id.in_(removed_ids)
+        )).rowcount
+
+    # Posted transactions may replace pending ones - merge them so they aren't counted twice
+    if posted_ids:
+        reconcile_pending_transactions(db, item.user_id, posted_ids=posted_ids)
+    return {"added": len(new), "modified": len(existing), "removed": removed}
+
+def run_sync_job(job_id: int) -> None:
+    """Sync the job's item with its own session and announce the result"""
+    db = SessionLocal()
+    try:
+        job = db.get(PlaidSyncJob, job_id)
+        # Serializes with anything else writing the item's cursor
+        item = db.query(PlaidItem).filter(PlaidItem.id == job.plaid_item_id).with_for_update().one()
+        changes = plaid_service.sync_transactions(item.access_token, item.transactions_cursor)
+        counts = apply_sync(db, item, changes)
+
+        item.transactions_cursor = changes["next_cursor"]
+        item.last_synced_at = func.now()
+        item.error_code = None
+        job.added, job.modified, job.removed = counts["added"], counts["modified"], counts["removed"]
+        job.status = "completed"
+        job.completed_at = func.now()
+        db.commit()
+
+        publish_event(item.user_id, "sync.completed", {"item_id": item.item_id, "job_id": job.id, **counts})
+        deliver_budget_alerts(db, item.user_id)
+    except Exception as e:
+        logger.exception("Plaid sync job %s failed", job_id)
+        db.rollback()
+        job = db.get(PlaidSyncJob, job_id)
+        if job is not None:
+            job.status = "failed"
+            job.error = str(e)
+            job.completed_at = func.now()
+            db.commit()
+    finally:
+        db.close()
+
+def resume_sync_jobs() -> None:
+    """Run jobs left pending by a restart (their timers died with the process)"""
+    db = SessionLocal()
+    try:
+        item_ids = list(db.execute(
+            select(PlaidSyncJob.plaid_item_id).where(PlaidSyncJob.status == "pending").distinct()
+        ).scalars())
+    finally:
+        db.close()
+    for plaid_item_id in item_ids:
+        run_item_syncs(plaid_item_id)
+
+def sign_webhook(body: bytes, secret: str) -> str:
+    """A Plaid-Verification JWT for body, as the fake sender sends it"""
+    claims = {"iat": int(time.time()), "request_body_sha256": hashlib.sha256(body).hexdigest()}
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+def send_webhook(url: str, item_id: str, webhook_code: str, webhook_type: str = "TRANSACTIONS", secret: Optional[str] = None) -> Dict[str, Any]:
+    """Post a fake, locally signed webhook to a receiver running with PLAID_WEBHOOK_SECRET"""
+    body = json.dumps({
+        "webhook_type": webhook_type,
+        "webhook_code": webhook_code,
+        "item_id": item_id,
+        "environment": "sandbox",
+    }).encode()
+    request = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "Plaid-Verification": sign_webhook(body, secret or PLAID_WEBHOOK_SECRET),
+    })
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+def main():
+    parser = argparse.ArgumentParser(description="Plaid webhook tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    send = commands.add_parser("send", help="send fake webhooks signed with PLAID_WEBHOOK_SECRET")
+    send.add_argument("item_id")
+    send.add_argument("--code", default="SYNC_UPDATES_AVAILABLE")
+    send.add_argument("--type", default="TRANSACTIONS")
+    send.add_argument("--count", type=int, default=1, help="webhooks to send in a burst")
+    send.add_argument("--url", default="http://localhost:8000/plaid/webhook")
+    args = parser.parse_args()
+
+    if not PLAID_WEBHOOK_SECRET:
+        parser.error("PLAID_WEBHOOK_SECRET must be set (to the receiver's value)")
+    for _ in range(args.count):
+        print(send_webhook(args.url, args.item_id, args.code, args.type))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Set-based account and user deletion.
+
+Deletes never load child rows into the session: the foreign keys cascade in the
+database (ON DELETE CASCADE / SET NULL, with passive_deletes on the relationships).
+Targets with up to PURGE_INLINE_LIMIT transactions are deleted inside the request.
+Larger ones get a PurgeJob that deletes their transactions in batches of
+PURGE_BATCH_SIZE, committing and recording progress after each batch so the
+request returns immediately and no single transaction holds millions of row locks.
+Unfinished jobs are picked up again on startup.
+"""
+import logging
+import os
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from api.database import SessionLocal
+from api.models import Account, PurgeJob, Transaction, User, user_accounts
+
+logger = logging.getLogger(__name__)
+
+PURGE_INLINE_LIMIT = int(os.getenv("PURGE_INLINE_LIMIT", "10000"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "5000"))
+
+# target_type -> (target model, transaction column that references it)
+_TARGETS = {
+    "account": (Account, Transaction.account_id),
+    "user": (User, Transaction.user_id),
+}
+
+def count_transactions(db: Session, target_type: str, target_id: int, limit: Optional[int] = None) -> int:
+    """Count the target's transactions, stopping early once limit is exceeded"""
+    _, column = _TARGETS[target_type]
+    rows = select(Transaction.id).where(column == target_id)
+    if limit is not None:
+        rows = rows.limit(limit + 1)
+    return db.execute(select(func.count()).select_from(rows.subquery())).scalar()
+
+def sole_member_account_ids(db: Session, user_id: int) -> List[int]:
+    """Accounts the user is the only member of"""
+    member_of = select(user_accounts.c.account_id).where(user_accounts.c.user_id == user_id)
+    return list(db.execute(
+        select(user_accounts.c.account_id)
+        .where(user_accounts.c.account_id.in_(member_of))
+        .group_by(user_accounts.c.account_id)
+        .having(func.count() == 1)
+    ).scalars())
+
+def delete_target(db: Session, target_type: str, target_id: int) -> None:
+    """Delete the account or user row; the database cascades to everything that references it"""
+    model, _ = _TARGETS[target_type]
+    db.execute(delete(model).where(model.id == target_id))
+
+def delete_or_schedule(db: Session, target_type: str, target_id: int, requested_by: Optional[int]) -> Optional[PurgeJob]:
+    """Delete a small target now, or create a PurgeJob for a large one. The caller commits
+    and then runs the job with run_purge_jobs (e.g. as a background task)."""
+    total = count_transactions(db, target_type, target_id, limit=PURGE_INLINE_LIMIT)
+    if total <= PURGE_INLINE_LIMIT:
+        delete_target(db, target_type, target_id)
+        return None
+
+    job = PurgeJob(
+        user_id=requested_by,
+        target_type=target_type,
+        target_id=target_id,
+        status="pending",
+        total_rows=count_transactions(db, target_type, target_id),
+        deleted_rows=0
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+def _delete_batch(db: Session, target_type: str, target_id: int, batch_size: int) -> int:
+    _, column = _TARGETS[target_type]
+    # SKIP LOCKED lets two workers resuming the same job split the rows instead of blocking
+    batch = (
+        select(Transaction.id)
+        .where(column == target_id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    return db.execute(delete(Transaction).where(Transaction.id.in_(batch))).rowcount
+
+def run_purge_job(job_id: int, batch_size: int = PURGE_BATCH_SIZE) -> None:
+    """Run one purge job to completion with its own session"""
+    db = SessionLocal()
+    try:
+        job = db.get(PurgeJob, job_id)
+        if job is None or job.status == "completed":
+            return
+        job.status = "running"
+        db.commit()
+
+        while True:
+            deleted = _delete_batch(db, job.target_type, job.target_id, batch_size)
+            if deleted == 0:
+                break
+            job.deleted_rows += deleted
+            db.commit()
+
+        # Only small leftovers (rows inserted meanwhile) remain for the database cascade
+        delete_target(db, job.target_type, job.target_id)
+        job.status = "completed"
+        job.completed_at = func.now()
+        db.commit()
+    except Exception as e:
+        logger.exception("Purge job %s failed", job_id)
+        db.rollback()
+        job = db.get(PurgeJob, job_id)
+        if job is not None:
+            job.status = "failed"
+            job.error = str(e)
+            db.commit()
+    finally:
+        db.close()
+
+def run_purge_jobs(job_ids: Iterable[int]) -> None:
+    """Run purge jobs one after another"""
+    for job_id in job_ids:
+        run_purge_job(job_id)
+
+def resume_purge_jobs() -> None:
+    """Restart jobs that were pending or interrupted by a shutdown"""
+    db = SessionLocal()
+    try:
+        job_ids = list(db.execute(
+            select(PurgeJob.id).where(PurgeJob.status.in_(["pending", "running"])).order_by(PurgeJob.id)
+        ).scalars())
+    finally:
+        db.close()
+    run_purge_jobs(job_ids)
@@ -0,0 +1,124 @@
+"""Pending -> posted transaction reconciliation.
+
+When a pending transaction posts, Plaid (or a manual entry) produces a second, posted
+row for the same purchase. This stage pairs each pending row with the posted row that
+replaces it, carries the user's categorization, notes, tags and splits over to the posted row,
+and deletes the pending one so aggregations don't double count.
+
+Pairs are found in two passes:
+  1. exact - the posted row's pending_transaction_id names the pending row
+  2. fuzzy - same account, amount within tolerance, posted within the date window
+     after the pending date, and the same normalized merchant (merchant_id)
+
+Both passes are single queries driven by the partial ix_transactions_pending_lookup
+index; merges run as set-based UPDATE/DELETE statements in batches.
+"""
+import os
+from decimal import Decimal
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session, aliased
+
+from api.models import Transaction
+
+RECONCILE_AMOUNT_TOLERANCE = Decimal(os.getenv("RECONCILE_AMOUNT_TOLERANCE", "1.00"))
+# Relative tolerance covers tips and currency conversion (e.g. 0.25 = 25% of the posted amount)
+RECONCILE_AMOUNT_TOLERANCE_PCT = Decimal(os.getenv("RECONCILE_AMOUNT_TOLERANCE_PCT", "0.25"))
+RECONCILE_DATE_WINDOW_DAYS = int(os.getenv("RECONCILE_DATE_WINDOW_DAYS", "7"))
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "500"))
+
+def find_pending_matches(db: Session, user_id: int, posted_ids: Optional[Iterable[int]] = None) -> List[Tuple[int, int]]:
+    """Return one-to-one (pending_id, posted_id) pairs for the user.
+
+    posted_ids restricts the posted side, e.g. to rows that were just inserted.
+    """
+    pending = aliased(Transaction, name="pending_txn")
+    posted = aliased(Transaction, name="posted_txn")
+    posted_ids = list(posted_ids) if posted_ids is not None else None
+
+    def posted_filter(query):
+        query = query.filter(posted.user_id == user_id, posted.pending == False)
+        if posted_ids is not None:
+            query = query.filter(posted.id.in_(posted_ids))
+        return query
+
+    # Pass 1: explicit link from the posted row
+    exact = posted_filter(db.query(pending.id, posted.id).join(
+        pending,
+        (pending.user_id == posted.user_id)
+        & (pending.plaid_transaction_id == posted.pending_transaction_id)
+        & (pending.pending == True)
+    )).all()
+
+    # Pass 2: fuzzy match for posted rows without a link
+    amount_difference = func.abs(pending.amount - posted.amount)
+    day_difference = func.date_part("day", posted.date - pending.date)
+    fuzzy = posted_filter(db.query(pending.id, posted.id).join(
+        pending,
+        (pending.user_id == posted.user_id)
+        & (pending.pending == True)
+        & (pending.account_id == posted.account_id)
+        & (pending.date <= posted.date)
+        & (pending.date >= posted.date - text(f"interval '{RECONCILE_DATE_WINDOW_DAYS} days'"))
+        & (amount_difference <= func.greatest(
+            RECONCILE_AMOUNT_TOLERANCE, func.abs(posted.amount) * RECONCILE_AMOUNT_TOLERANCE_PCT
+        ))
+        & (pending.merchant_id == posted.merchant_id)
+    )).filter(
+        posted.pending_transaction_id.is_(None)
+    ).order_by(day_difference, amount_difference, pending.id).all()
+
+    # Greedy one-to-one assignment: exact links first, then closest fuzzy candidates
+    used_pending, used_posted, pairs = set(), set(), []
+    for pending_id, posted_id in list(exact) + list(fuzzy):
+        if pending_id in used_pending or posted_id in used_posted:
+            continue
+        used_pending.add(pending_id)
+        used_posted.add(posted_id)
+        pairs.append((pending_id, posted_id))
+    return pairs
+
+_MERGE_SQL = text("""
+    UPDATE transactions AS posted SET
+        custom_category_id = COALESCE(posted.custom_category_id, pending.custom_category_id),
+        custom_subcategory_id = COALESCE(posted.custom_subcategory_id, pending.custom_subcategory_id),
+        notes = COALESCE(posted.notes, pending.notes),
+        tags = CASE WHEN COALESCE(cardinality(posted.tags), 0) = 0 THEN pending.tags ELSE posted.tags END,
+        pending_transaction_id = COALESCE(posted.pending_transaction_id, pending.plaid_transaction_id),
+        updated_at = now()
+    FROM unnest(CAST(:pending_ids AS integer[]), CAST(:posted_ids AS integer[])) AS pairs(pending_id, posted_id)
+    JOIN transactions AS pending ON pending.id = pairs.pending_id
+    WHERE posted.id = pairs.posted_id
+""")
+
+# Splits follow too, unless the posted row has its own or its amount no longer covers them
+_MOVE_SPLITS_SQL = text("""
+    UPDATE transaction_splits AS s SET transaction_id = posted.id, transaction_date = posted.date
+    FROM unnest(CAST(:pending_ids AS integer[]), CAST(:posted_ids AS integer[])) AS pairs(pending_id, posted_id)
+    JOIN transactions AS pending ON pending.id = pairs.pending_id
+    JOIN transactions AS posted ON posted.id = pairs.posted_id
+    WHERE s.transaction_id = pending.id
+      AND pending.split_amount IS NOT NULL AND posted.split_amount IS NULL
+      AND sign(pending.split_amount) = sign(posted.amount) AND abs(pending.split_amount) <= abs(posted.amount)
+""")
+
+_DELETE_SQL = text("DELETE FROM transactions WHERE id = ANY(CAST(:pending_ids AS integer[]))")
+
+def merge_pending_pairs(db: Session, pairs: List[Tuple[int, int]], batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+    """Carry user edits from pending to posted rows and delete the pending rows, in batches"""
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        pending_ids = [pending_id for pending_id, _ in batch]
+        posted_ids = [posted_id for _, posted_id in batch]
+        db.execute(_MERGE_SQL, {"pending_ids": pending_ids, "posted_ids": posted_ids})
+        db.execute(_MOVE_SPLITS_SQL, {"pending_ids": pending_ids, "posted_ids": posted_ids})
+        db.execute(_DELETE_SQL, {"pending_ids": pending_ids})
+    return len(pairs)
+
+def reconcile_pending_transactions(db: Session, user_id: int, posted_ids: Optional[Iterable[int]] = None) -> int:
+    """Find and merge pending/posted pairs for a user. Returns the number merged; the caller commits."""
+    pairs = find_pending_matches(db, user_id, posted_ids)
+    if not pairs:
+        return 0
+    return merge_pending_pairs(db, pairs)
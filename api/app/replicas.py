@@ -0,0 +1,130 @@
+"""Read-replica routing.
+
+Read-only endpoints take their session from get_read_db instead of get_db. It
+hands out replicas from DATABASE_READ_URLS in round-robin order, skipping any
+replica that failed to connect within the last REPLICA_RETRY_SECONDS, and falls
+back to the primary when none is available or no replicas are configured.
+
+Read-your-writes: ReadYourWritesMiddleware records when each user last sent a
+write request (POST/PUT/PATCH/DELETE), and for READ_YOUR_WRITES_SECONDS afterwards
+that user's reads go to the primary so they never see replication lag on their own
+changes. The record is per worker process, so with several workers keep the window
+above the replicas' typical lag or use sticky sessions at the load balancer.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from api.auth import verify_token
+from api.database import SessionLocal, read_engines
+
+logger = logging.getLogger(__name__)
+
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+class ReplicaRouter:
+    """Round-robin over replica engines with a simple down-marking health check"""
+
+    def __init__(self, engines: List[Engine], retry_seconds: float = REPLICA_RETRY_SECONDS):
+        self.engines = list(engines)
+        self.retry_seconds = retry_seconds
+        self.down_until: Dict[int, float] = {}
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def candidates(self) -> List[Engine]:
+        """Healthy replicas, starting with the next one in round-robin order"""
+        if not self.engines:
+            return []
+        start = next(self.counter)
+        now = time.monotonic()
+        ordered = [self.engines[(start + offset) % len(self.engines)] for offset in range(len(self.engines))]
+        with self.lock:
+            return [engine for engine in ordered if self.down_until.get(id(engine), 0) <= now]
+
+    def mark_down(self, engine: Engine) -> None:
+        logger.warning("Read replica %s unavailable, retrying in %ss", engine.url.host, self.retry_seconds)
+        with self.lock:
+            self.down_until[id(engine)] = time.monotonic() + self.retry_seconds
+
+router = ReplicaRouter(read_engines)
+
+class _RecentWriters:
+    """user -> monotonic time of their last write request"""
+
+    def __init__(self, window: float):
+        self.window = window
+        self.last_write: Dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def mark(self, user_key: str) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self.last_write[user_key] = now
+            # Forget users whose window has passed so the map stays small
+            if len(self.last_write) > 10000:
+                self.last_write = {key: at for key, at in self.last_write.items() if now - at < self.window}
+
+    def wrote_recently(self, user_key: Optional[str]) -> bool:
+        if user_key is None:
+            return False
+        with self.lock:
+            at = self.last_write.get(user_key)
+        return at is not None and time.monotonic() - at < self.window
+
+recent_writers = _RecentWriters(READ_YOUR_WRITES_SECONDS)
+
+def _user_key(headers) -> Optional[str]:
+    """The authenticated user's email from a Bearer token, or None"""
+    authorization = headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return verify_token(token)
+
+class ReadYourWritesMiddleware:
+    """Records write requests per user so their following reads stay on the primary"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["method"] in WRITE_METHODS and router.engines:
+            user_key = _user_key(Headers(scope=scope))
+            if user_key is not None:
+                recent_writers.mark(user_key)
+        await self.app(scope, receive, send)
+
+def read_session(user_key: Optional[str] = None):
+    """Session on a healthy replica, or on the primary if there is none or the user just wrote"""
+    if not recent_writers.wrote_recently(user_key):
+        for engine in router.candidates():
+            db = SessionLocal(bind=engine)
+            try:
+                # Connect now so an unreachable replica falls through to the next one
+                db.connection()
+                return db
+            except OperationalError:
+                db.close()
+                router.mark_down(engine)
+    return SessionLocal()
+
+def get_read_db(request: Request):
+    """Dependency for read-only handlers - like get_db, but routed to a read replica"""
+    db = read_session(_user_key(request.headers) if router.engines else None)
+    try:
+        yield db
+    finally:
+        db.close()
@@ -21,6 +21,10 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+# Auth schemas
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
 # Plaid Item schemas
 class PlaidItemBase(BaseModel):
     item_id: str
@@ -50,6 +54,8 @@ class PlaidItemCreate(PlaidItemBase):
 class PlaidItemResponse(PlaidItemBase):
     id: int
     user_id: int
+    error_code: Optional[str] = None
+    last_synced_at: Optional[dt_type] = None
     created_at: dt_type
     
     class Config:
@@ -135,11 +141,10 @@ class TransactionBase(BaseModel):
 class TransactionCreate(TransactionBase):
     account_id: Optional[int] = None
     plaid_transaction_id: Optional[str] = None
+    pending_transaction_id: Optional[str] = None
     iso_currency_code: Optional[str] = None
     datetime: Optional[dt_type] = None
-    merchant_entity_id: Optional[str] = None
-    logo_url: Optional[str] = None
-    website: Optional[str] = None
+    # No merchant_entity_id/logo_url/website: merchants are shared, so those come only from Plaid
     authorized_date: Optional[date] = None
     authorized_datetime: Optional[dt_type] = None
     transaction_type: Optional[str] = None
@@ -151,12 +156,14 @@ class TransactionCreate(TransactionBase):
 class TransactionResponse(TransactionBase):
     id: int
     plaid_transaction_id: Optional[str] = None
+    pending_transaction_id: Optional[str] = None
     account_id: Optional[int] = None
     iso_currency_code: Optional[str] = None
     datetime: Optional[dt_type] = None
     authorized_date: Optional[date] = None
     authorized_datetime: Optional[dt_type] = None
     transaction_type: Optional[str] = None
+    merchant_id: Optional[int] = None
     merchant_entity_id: Optional[str] = None
     logo_url: Optional[str] = None
     website: Optional[str] = None
@@ -164,8 +171,10 @@ class TransactionResponse(TransactionBase):
     # Custom categorization
     custom_category_id: Optional[int] = None
     custom_subcategory_id: Optional[int] = None
+    effective_category_id: Optional[int] = None  # Category directly or via the subcategory
     notes: Optional[str] = None
     tags: Optional[List[str]] = []
+    split_amount: Optional[Decimal] = None  # Sum of the splits; the rest stays in the transaction's category
     
     # Relationships
     account: Optional[AccountResponse] = None
@@ -181,7 +190,76 @@ class TransactionUpdate(BaseModel):
     notes: Optional[str] = None
     tags: Optional[List[str]] = None
 
-# Note: TransactionSplit and RecurringTransaction models removed from schema
+class TransactionSplitCreate(BaseModel):
+    amount: Decimal
+    custom_category_id: Optional[int] = None
+    custom_subcategory_id: Optional[int] = None
+    notes: Optional[str] = None
+
+class TransactionSplitsUpdate(BaseModel):
+    """Replaces all of a transaction's splits; an empty list unsplits it"""
+    splits: List[TransactionSplitCreate]
+
+class TransactionSplitResponse(TransactionSplitCreate):
+    id: int
+    transaction_id: int
+    effective_category_id: Optional[int] = None
+    created_at: dt_type
+    
+    class Config:
+        from_attributes = True
+
+class ReconciliationResponse(BaseModel):
+    """Result of merging pending transactions into their posted counterparts"""
+    merged: int
+
+class ImportRowError(BaseModel):
+    """A statement row that was skipped, by row (CSV, counting the header) or record number (OFX, QIF)"""
+    row: int
+    error: str
+
+class TransactionImportResponse(BaseModel):
+    """Result of a statement file import"""
+    format: str
+    dry_run: bool
+    rows: int
+    imported: int
+    duplicates: int
+    failed: int
+    errors: List[ImportRowError]
+    errors_truncated: bool
+
+class DuplicateClusterResponse(BaseModel):
+    """Transactions that likely record the same purchase; exact when their fingerprints match"""
+    exact: bool
+    transactions: List[TransactionResponse]
+
+class ArchivedMonthlyTotalResponse(BaseModel):
+    """Totals of one month's archived transactions in one category"""
+    month: date
+    category_id: Optional[int] = None
+    category_name: str
+    transaction_count: int
+    expense_total: Decimal
+    income_total: Decimal
+
+# Purge job schemas
+class PurgeJobResponse(BaseModel):
+    """Progress of a background account/user deletion"""
+    id: int
+    target_type: str
+    target_id: int
+    status: str
+    total_rows: int
+    deleted_rows: int
+    error: Optional[str] = None
+    created_at: dt_type
+    completed_at: Optional[dt_type] = None
+    
+    class Config:
+        from_attributes = True
+
+# Note: RecurringTransaction model removed from schema
 
 # Analytics schemas
 class SpendingByCategoryResponse(BaseModel):
@@ -221,6 +299,7 @@ class BudgetTemplateResponse(BaseModel):
     month: int
     year: int
     total_budget: Decimal
+    is_default: bool = False
     entries: List[BudgetTemplateEntryResponse] = []
     created_at: dt_type
     updated_at: Optional[dt_type] = None
@@ -238,26 +317,57 @@ class BudgetTemplateUpdate(BaseModel):
     total_budget: Optional[Decimal] = None
     entries: Optional[List[BudgetTemplateEntryCreate]] = None
 
+class BudgetCloneRequest(BaseModel):
+    """Copy one month's budget to every month from start to end (inclusive)"""
+    source_year: int
+    source_month: int
+    start_year: int
+    start_month: int
+    end_year: int
+    end_month: int
+    overwrite: bool = False  # Replace budgets that already exist in the range
+    carry_over_unspent: bool = False  # Add the source month's unspent amounts to the first target month
+
+class BudgetCloneResponse(BaseModel):
+    created: List[str]  # "YYYY-MM" of each budget created
+    skipped: List[str]  # Months that already had a budget (overwrite=False)
+
 class UserBudgetSettingsBase(BaseModel):
     monthly_income: Decimal
     monthly_savings_goal: Decimal
 
 class UserBudgetSettingsCreate(UserBudgetSettingsBase):
-    pass
+    alert_thresholds: Optional[List[int]] = None  # Percentages; defaults to [80, 100]
 
 class UserBudgetSettingsUpdate(UserBudgetSettingsBase):
     monthly_income: Optional[Decimal] = None
     monthly_savings_goal: Optional[Decimal] = None
+    alert_thresholds: Optional[List[int]] = None
 
 class UserBudgetSettingsResponse(UserBudgetSettingsBase):
     id: int
     user_id: int
+    alert_thresholds: List[int] = [80, 100]
     created_at: dt_type
     updated_at: Optional[dt_type] = None
     
     class Config:
         from_attributes = True
 
+class BudgetAlertResponse(BaseModel):
+    id: int
+    month: date  # First day of the month
+    template_id: Optional[int] = None
+    category_id: Optional[int] = None
+    subcategory_id: Optional[int] = None
+    threshold: int
+    budgeted_amount: Decimal
+    spent: Decimal
+    created_at: dt_type
+    
+    class Config:
+        from_attributes = True
+
 # Budget analytics schemas
 class BudgetComparisonResponse(BaseModel):
     """Shows actual spending vs budget for a category/subcategory"""
@@ -0,0 +1,174 @@
+"""Fast JSON response path.
+
+Instead of loading ORM objects, validating them through the from_attributes response
+models and encoding with the stdlib JSON encoder, the fast path selects plain rows,
+shapes them into dicts using field lists precomputed from the response schemas, and
+encodes them with orjson. The wire format matches the Pydantic output (Decimal as a
+string, ISO dates, UTC datetimes with a trailing Z).
+"""
+import typing
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+import orjson
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Query, Session, aliased
+
+from api.models import Transaction, Account, Category, Merchant, Subcategory
+from api.schemas import TransactionResponse, AccountResponse, CategoryResponse, SubcategoryResponse
+
+def orjson_default(obj: Any) -> Any:
+    """Encode types orjson doesn't handle natively"""
+    if isinstance(obj, Decimal):
+        # Pydantic serializes Decimal as a string - keep the same wire format
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson; content is encoded as-is without validation"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=orjson_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+def response_dict(model, obj) -> Dict[str, Any]:
+    """An ORM object as its response model's JSON-mode dict, for embedding in fast-path payloads"""
+    return model.model_validate(obj).model_dump(mode="json")
+
+def _is_date_field(annotation: Any) -> bool:
+    """True for fields typed date / Optional[date] (but not datetime)"""
+    if annotation is date:
+        return True
+    return date in typing.get_args(annotation)
+
+class _SchemaSpec:
+    """Scalar fields of a response schema, precomputed once at import time"""
+
+    def __init__(self, model, prefix: str, nested: Iterable[str] = (), sources: Optional[Dict[str, Any]] = None):
+        nested = set(nested)
+        self.prefix = prefix
+        # Fields read from another table's column instead of the entity's attribute
+        self.sources = sources or {}
+        self.fields = [name for name in model.model_fields if name not in nested]
+        self.labels = [(name, prefix + name) for name in self.fields]
+        self.date_fields = frozenset(
+            name for name in self.fields if _is_date_field(model.model_fields[name].annotation)
+        )
+        self.id_label = prefix + "id"
+
+    def columns(self, entity) -> list:
+        return [self.sources.get(name) or getattr(entity, name).label(label) for name, label in self.labels]
+
+    def extract(self, mapping) -> Optional[Dict[str, Any]]:
+        """Build the dict for one entity from a row mapping (None for an outer-join miss)"""
+        if self.prefix and mapping[self.id_label] is None:
+            return None
+        item = {}
+        for name, label in self.labels:
+            value = mapping[label]
+            # Date fields are stored as timestamps; the schema exposes only the date part
+            if name in self.date_fields and isinstance(value, datetime):
+                value = value.date()
+            item[name] = value
+        return item
+
+# Merchant details are stored once per merchant (see api/merchants.py)
+_merchant = aliased(Merchant, name="fast_merchant")
+MERCHANT_FIELDS = ("merchant_entity_id", "logo_url", "website")
+
+_TRANSACTION = _SchemaSpec(
+    TransactionResponse, "", nested=("account", "custom_category", "custom_subcategory"),
+    sources={field: getattr(_merchant, field) for field in MERCHANT_FIELDS}
+)
+_ACCOUNT = _SchemaSpec(AccountResponse, "account__")
+_CATEGORY = _SchemaSpec(CategoryResponse, "category__")
+_SUBCATEGORY = _SchemaSpec(SubcategoryResponse, "subcategory__", nested=("category",))
+_SUBCATEGORY_CATEGORY = _SchemaSpec(CategoryResponse, "subcategory_category__")
+
+# Aliases so the row query can be applied on top of filter joins that use the plain entities
+_account = aliased(Account, name="fast_account")
+_category = aliased(Category, name="fast_category")
+_subcategory = aliased(Subcategory, name="fast_subcategory")
+_subcategory_category = aliased(Category, name="fast_subcategory_category")
+
+_TRANSACTION_ROW_COLUMNS = (
+    _TRANSACTION.columns(Transaction)
+    + _ACCOUNT.columns(_account)
+    + _CATEGORY.columns(_category)
+    + _SUBCATEGORY.columns(_subcategory)
+    + _SUBCATEGORY_CATEGORY.columns(_subcategory_category)
+)
+
+def transaction_row_query(query: Query) -> Query:
+    """Turn a filtered Query over Transaction into a flat row query with its relationships joined"""
+    return query.with_entities(*_TRANSACTION_ROW_COLUMNS).outerjoin(
+        _account, Transaction.account_id == _account.id
+    ).outerjoin(
+        _category, Transaction.custom_category_id == _category.id
+    ).outerjoin(
+        _subcategory, Transaction.custom_subcategory_id == _subcategory.id
+    ).outerjoin(
+        _subcategory_category, _subcategory.category_id == _subcategory_category.id
+    ).outerjoin(
+        _merchant, Transaction.merchant_id == _merchant.id
+    )
+
+def transaction_row_to_dict(mapping) -> Dict[str, Any]:
+    """Shape one flat row mapping into the TransactionResponse structure"""
+    item = _TRANSACTION.extract(mapping)
+    item["account"] = _ACCOUNT.extract(mapping)
+    item["custom_category"] = _CATEGORY.extract(mapping)
+    subcategory = _SUBCATEGORY.extract(mapping)
+    if subcategory is not None:
+        subcategory["category"] = _SUBCATEGORY_CATEGORY.extract(mapping)
+    item["custom_subcategory"] = subcategory
+    return item
+
+def transaction_rows(query: Query) -> List[Dict[str, Any]]:
+    """Run a filtered Query over Transaction on the fast path, returning response dicts"""
+    return [transaction_row_to_dict(row._mapping) for row in transaction_row_query(query)]
+
+def related_response_dicts(db: Session, records: Iterable[Dict[str, Any]]):
+    """Account, category, subcategory and merchant dicts (by id) for transaction records that
+    were not loaded through transaction_row_query, e.g. archived ones - one query each"""
+    records = list(records)
+    account_ids = {record["account_id"] for record in records} - {None}
+    category_ids = {record["custom_category_id"] for record in records} - {None}
+    subcategory_ids = {record["custom_subcategory_id"] for record in records} - {None}
+    merchant_ids = {record["merchant_id"] for record in records} - {None}
+
+    accounts, categories, subcategories, merchants = {}, {}, {}, {}
+    if account_ids:
+        for row in db.query(*_ACCOUNT.columns(_account)).filter(_account.id.in_(account_ids)):
+            account = _ACCOUNT.extract(row._mapping)
+            accounts[account["id"]] = account
+    if category_ids:
+        for row in db.query(*_CATEGORY.columns(_category)).filter(_category.id.in_(category_ids)):
+            category = _CATEGORY.extract(row._mapping)
+            categories[category["id"]] = category
+    if subcategory_ids:
+        rows = db.query(
+            *_SUBCATEGORY.columns(_subcategory), *_SUBCATEGORY_CATEGORY.columns(_subcategory_category)
+        ).outerjoin(
+            _subcategory_category, _subcategory.category_id == _subcategory_category.id
+        ).filter(_subcategory.id.in_(subcategory_ids))
+        for row in rows:
+            subcategory = _SUBCATEGORY.extract(row._mapping)
+            subcategory["category"] = _SUBCATEGORY_CATEGORY.extract(row._mapping)
+            subcategories[subcategory["id"]] = subcategory
+    if merchant_ids:
+        rows = db.query(_merchant.id, *(getattr(_merchant, field) for field in MERCHANT_FIELDS)).filter(
+            _merchant.id.in_(merchant_ids)
+        )
+        merchants = {row.id: dict(row._mapping) for row in rows}
+    return accounts, categories, subcategories, merchants
+
+def transaction_record_to_dict(record: Dict[str, Any], accounts, categories, subcategories, merchants) -> Dict[str, Any]:
+    """Shape a dict of transactions column values into the TransactionResponse structure"""
+    # Records from before merchants existed carry the merchant fields themselves
+    merchant = merchants.get(record.get("merchant_id")) or record
+    item = _TRANSACTION.extract({**record, **{field: merchant.get(field) for field in MERCHANT_FIELDS}})
+    item["account"] = accounts.get(item["account_id"])
+    item["custom_category"] = categories.get(item["custom_category_id"])
+    item["custom_subcategory"] = subcategories.get(item["custom_subcategory_id"])
+    return item
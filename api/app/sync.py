@@ -0,0 +1,173 @@
+"""Delta sync: clients fetch only what changed since their last sync.
+
+Database triggers (migration 0012) give every write to a user's transactions,
+accounts, categories, subcategories, budgets and budget settings the next number of
+the user's change sequence (users.change_seq) and record it in change_log, one row
+per entity holding its latest change; deletes leave a tombstone row. Because the
+triggers sit on the tables, bulk deletes, purges and foreign-key cascades are
+logged like API writes.
+
+GET /sync?since=<seq> returns the entities whose latest change is after `since`, in
+the same shapes as their list endpoints, the ids deleted since then, and the `seq`
+to pass next time. Without a cursor - or with one older than the pruned tombstones
+or newer than the sequence itself - the response is a full snapshot (`full: true`)
+that replaces the client's copy.
+
+Only the user's own rows are logged: system categories come with full snapshots
+only, and other household members' transactions on shared accounts aren't synced at
+all (GET /transactions/?household=true lists them). Tombstones older
+than SYNC_TOMBSTONE_RETENTION_DAYS can be pruned from cron:
+
+    python -m api.sync prune
+"""
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from api.access import accessible_account_ids
+from api.archive import archived_transactions
+from api.database import SessionLocal
+from api.models import (
+    Account, BudgetTemplate, BudgetTemplateEntry, Category, ChangeLogEntry, Subcategory, Transaction,
+    User, UserBudgetSettings
+)
+from api.schemas import (
+    AccountResponse, BudgetTemplateResponse, CategoryResponse, SubcategoryResponse, UserBudgetSettingsResponse
+)
+from api.serialization import response_dict, transaction_rows
+
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "90"))
+
+SYNC_ENTITIES = ("transactions", "accounts", "categories", "subcategories", "budgets", "budget_settings")
+
+def _transactions(db: Session, user: User, ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+    query = db.query(Transaction).filter(Transaction.user_id == user.id)
+    if ids is not None:
+        return transaction_rows(query.filter(Transaction.id.in_(ids)).order_by(Transaction.date.desc()))
+    # Archived transactions are listed too, so they belong in the snapshot
+    rows = transaction_rows(query.order_by(Transaction.date.desc())) + archived_transactions(db, user)
+    rows.sort(key=lambda item: item["date"], reverse=True)
+    return rows
+
+def _accounts(db: Session, user: User, ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+    account_ids = accessible_account_ids(db, user)
+    if ids is not None:
+        account_ids = account_ids & set(ids)
+    if not account_ids:
+        return []
+    accounts = db.query(Account).filter(Account.id.in_(account_ids)).order_by(Account.id)
+    return [response_dict(AccountResponse, account) for account in accounts]
+
+def _categories(db: Session, user: User, ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+    query = db.query(Category)
+    if ids is not None:
+        query = query.filter(Category.id.in_(ids), Category.user_id == user.id)
+    else:
+        query = query.filter((Category.user_id == user.id) | (Category.is_system == True))
+    categories = query.order_by(Category.is_system.desc(), Category.name)
+    return [response_dict(CategoryResponse, category) for category in categories]
+
+def _subcategories(db: Session, user: User, ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+    query = db.query(Subcategory).options(joinedload(Subcategory.category))
+    if ids is not None:
+        query = query.filter(Subcategory.id.in_(ids), Subcategory.user_id == user.id)
+    else:
+        query = query.filter((Subcategory.user_id == user.id) | (Subcategory.is_system == True))
+    subcategories = query.order_by(Subcategory.is_system.desc(), Subcategory.name)
+    return [response_dict(SubcategoryResponse, subcategory) for subcategory in subcategories]
+
+def _budgets(db: Session, user: User, ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+    query = db.query(BudgetTemplate).options(
+        selectinload(BudgetTemplate.entries).joinedload(BudgetTemplateEntry.category),
+        selectinload(BudgetTemplate.entries).joinedload(BudgetTemplateEntry.subcategory).joinedload(Subcategory.category)
+    ).filter(BudgetTemplate.user_id == user.id)
+    if ids is not None:
+        query = query.filter(BudgetTemplate.id.in_(ids))
+    templates = query.order_by(BudgetTemplate.year, BudgetTemplate.month)
+    return [response_dict(BudgetTemplateResponse, template) for template in templates]
+
+def _budget_settings(db: Session, user: User, ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+    query = db.query(UserBudgetSettings).filter(UserBudgetSettings.user_id == user.id)
+    if ids is not None:
+        query = query.filter(UserBudgetSettings.id.in_(ids))
+    return [response_dict(UserBudgetSettingsResponse, settings) for settings in query]
+
+# Loader per entity: ids=None loads everything the user sees, a list loads those entities
+_LOADERS = {
+    "transactions": _transactions,
+    "accounts": _accounts,
+    "categories": _categories,
+    "subcategories": _subcategories,
+    "budgets": _budgets,
+    "budget_settings": _budget_settings,
+}
+
+def _changes(db: Session, user: User, since: int, seq: int) -> Dict[str, Dict[str, List[int]]]:
+    """{entity: {"changed": ids, "deleted": ids}} for changes after since, up to seq"""
+    changes = {entity: {"changed": [], "deleted": []} for entity in SYNC_ENTITIES}
+    rows = db.query(ChangeLogEntry.entity_type, ChangeLogEntry.entity_id, ChangeLogEntry.deleted).filter(
+        ChangeLogEntry.user_id == user.id,
+        ChangeLogEntry.seq > since,
+        ChangeLogEntry.seq <= seq
+    )
+    for entity_type, entity_id, deleted in rows:
+        if entity_type in changes:
+            changes[entity_type]["deleted" if deleted else "changed"].append(entity_id)
+    return changes
+
+def sync_payload(db: Session, user: User, since: Optional[int] = None) -> Dict[str, Any]:
+    """Entities changed after `since` plus tombstones, or a full snapshot when since can't be served"""
+    # Read the sequence first: entities read afterwards are at least that fresh
+    seq, min_seq = db.query(User.change_seq, User.sync_min_seq).filter(User.id == user.id).one()
+    full = not since or since < min_seq or since > seq
+    payload: Dict[str, Any] = {"seq": seq, "full": full}
+    if full:
+        for entity, load in _LOADERS.items():
+            payload[entity] = load(db, user, None)
+        payload["deleted"] = {entity: [] for entity in SYNC_ENTITIES}
+        return payload
+
+    changes = _changes(db, user, since, seq)
+    for entity, load in _LOADERS.items():
+        changed = changes[entity]["changed"]
+        payload[entity] = load(db, user, changed) if changed else []
+    payload["deleted"] = {entity: changes[entity]["deleted"] for entity in SYNC_ENTITIES}
+    return payload
+
+# Drop old tombstones and raise each affected user's sync floor past them
+_PRUNE_SQL = text("""
+    WITH pruned AS (
+        DELETE FROM change_log WHERE deleted AND changed_at < :before
+        RETURNING user_id, seq
+    )
+    UPDATE users SET sync_min_seq = GREATEST(users.sync_min_seq, pruned_users.max_seq)
+    FROM (SELECT user_id, MAX(seq) AS max_seq FROM pruned GROUP BY user_id) AS pruned_users
+    WHERE users.id = pruned_users.user_id
+""")
+
+def prune_tombstones(retention_days: int = SYNC_TOMBSTONE_RETENTION_DAYS) -> int:
+    """Delete tombstones older than the retention period. Returns the number of users affected."""
+    before = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    db = SessionLocal()
+    try:
+        users = db.execute(_PRUNE_SQL, {"before": before}).rowcount
+        db.commit()
+        return users
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the sync change log")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prune = commands.add_parser("prune", help="delete old tombstones")
+    prune.add_argument("--days", type=int, default=SYNC_TOMBSTONE_RETENTION_DAYS)
+    args = parser.parse_args()
+
+    print(f"Pruned tombstones of {prune_tombstones(args.days)} users")
+
+if __name__ == "__main__":
+    main()
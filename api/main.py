@@ -1,59 +1,113 @@
 import os
-import plaid
+import threading
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, BackgroundTasks, Depends, File, Header, HTTPException, Request, Response, UploadFile, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
 from decimal import Decimal
-from sqlalchemy import func, or_
-from plaid.api import plaid_api
-from plaid.model.transactions_get_request import TransactionsGetRequest
-from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
-from plaid.configuration import Configuration
-from plaid.api_client import ApiClient
-
-from api.database import get_db, engine
-from api.models import User, Account, Transaction, Category, Subcategory, UserBudgetSettings, BudgetTemplate, BudgetTemplateEntry
+from sqlalchemy import func, delete, exists, insert
+
+from api.database import get_db, engine, read_engines
+from api.models import User, RefreshToken, PurgeJob, PlaidItem, user_accounts, Account, Transaction, TransactionSplit, PlaidTransactionId, transaction_allocations, Category, Subcategory, UserBudgetSettings, BudgetTemplate
 from api.schemas import (
-    UserCreate, UserResponse, AccountCreate, AccountResponse, 
+    UserCreate, UserResponse, RefreshTokenRequest, AccountCreate, AccountResponse, 
     TransactionResponse, TransactionCreate, CategoryCreate, CategoryResponse,
     SubcategoryCreate, SubcategoryResponse,
-    TransactionUpdate, LinkTokenCreateRequest, LinkTokenCreateResponse, ExchangeTokenRequest, ExchangeTokenResponse,
+    TransactionUpdate, ReconciliationResponse, PlaidItemCreate, PlaidItemResponse, LinkTokenCreateRequest, LinkTokenCreateResponse, ExchangeTokenRequest, ExchangeTokenResponse,
     UserBudgetSettingsCreate, UserBudgetSettingsUpdate, UserBudgetSettingsResponse,
-    BudgetTemplateResponse, BudgetTemplateCreate, BudgetTemplateUpdate, BudgetTemplateEntryCreate,
-    BudgetComparisonResponse, MonthlyBudgetSummaryResponse
+    BudgetTemplateResponse, BudgetTemplateCreate, BudgetTemplateUpdate,
+    BudgetComparisonResponse, MonthlyBudgetSummaryResponse, BudgetCloneRequest, BudgetCloneResponse, PurgeJobResponse,
+    ArchivedMonthlyTotalResponse, BudgetAlertResponse, TransactionImportResponse, DuplicateClusterResponse,
+    TransactionSplitsUpdate, TransactionSplitResponse
+)
+from api.auth import (
+    get_current_user, get_stream_user_id, create_access_token, verify_password, get_password_hash,
+    create_refresh_token, rotate_refresh_token, revoke_refresh_token_family, hash_refresh_token
+)
+from api.plaid_service import plaid_service
+from api.serialization import FastJSONResponse, response_dict, transaction_rows
+from api.export import EXPORT_FORMATS, export_statement, stream_export
+from api.reconciliation import reconcile_pending_transactions
+from api.compression import CompressionMiddleware, COMPRESSION_MINIMUM_SIZE
+from api.budgets import (
+    BUDGET_CLONE_MAX_MONTHS, sync_template_entries, month_range, get_template, resolve_template,
+    materialize_template, clone_template, month_bounds
+)
+from api.access import (
+    accessible_account_ids, require_account_access, is_account_member, account_member_count,
+    invalidate_account_access
 )
-from api.auth import get_current_user, create_access_token, verify_password, get_password_hash
-from api.plaid_service import PlaidService
+from api.analytics import transaction_scope, spending_by_category, spending_by_merchant, household_spending_by_category
+from api.replicas import get_read_db, ReadYourWritesMiddleware
+from api.purge import delete_or_schedule, sole_member_account_ids, run_purge_jobs, resume_purge_jobs
+from api.partitions import ensure_future_partitions
+from api.archive import needs_archive, archived_transactions, archived_monthly_totals
+from api.merchants import resolve_merchant_id
+from api.sync import sync_payload
+from api.events import event_bus, event_stream, publish_event
+from api.alerts import DEFAULT_ALERT_THRESHOLDS, deliver_budget_alerts, list_budget_alerts, normalize_thresholds
+from api.plaid_sync import receive_webhook, resume_sync_jobs
+from api.importer import detect_format, import_statement
+from api.duplicates import (
+    DUPLICATE_WINDOW_DAYS, MAX_DUPLICATE_WINDOW_DAYS, duplicate_clusters, stored_duplicates, transaction_fingerprint
+)
+from api.bootstrap import build_bootstrap, current_month, etag_for, etag_matches, parse_sections, render_bootstrap
 
-# Create database tables
-from api.models import Base
-Base.metadata.create_all(bind=engine)
+# Database schema is managed by Alembic migrations (see migrations/), not at import time
 
-app = FastAPI(title="Plaid Transaction Categorization API", version="1.0.0")
+router = APIRouter()
 security = HTTPBearer()
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, replace with specific origins
-    allow_credentials=True,
-    allow_methods=["*"],  # Allows all HTTP methods including OPTIONS
-    allow_headers=["*"],
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup/shutdown hooks"""
+    # Finish account/user purges interrupted by a restart, without delaying startup
+    threading.Thread(target=resume_purge_jobs, name="purge-resume", daemon=True).start()
+    # Make sure the coming months have transaction partitions
+    threading.Thread(target=ensure_future_partitions, name="partitions-ensure", daemon=True).start()
+    # Run Plaid syncs queued before a restart
+    threading.Thread(target=resume_sync_jobs, name="plaid-sync-resume", daemon=True).start()
+    event_bus.start()
+    yield
+    event_bus.stop()
+    plaid_service.close()
+    # Release pooled database connections on shutdown
+    engine.dispose()
+    for read_engine in read_engines:
+        read_engine.dispose()
 
-# Initialize Plaid service
-plaid_service = PlaidService()
+def create_app() -> FastAPI:
+    """Build the FastAPI application"""
+    app = FastAPI(title="Plaid Transaction Categorization API", version="1.0.0", lifespan=lifespan)
+    
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # In production, replace with specific origins
+        allow_credentials=True,
+        allow_methods=["*"],  # Allows all HTTP methods including OPTIONS
+        allow_headers=["*"],
+    )
+    # Compress large responses (brotli when available and accepted, otherwise gzip)
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+    # Keep a user's reads on the primary right after they write (no-op without replicas)
+    app.add_middleware(ReadYourWritesMiddleware)
+    
+    app.include_router(router)
+    return app
 
-@app.get("/")
+@router.get("/")
 def root():
     return {"message": "Plaid Transaction Categorization API"}
 
 # User management endpoints
-@app.post("/users/", response_model=UserResponse)
+@router.post("/users/", response_model=UserResponse)
 def create_user(user: UserCreate, db: Session = Depends(get_db)):
     """Create a new user"""
     # Check if user already exists
@@ -74,14 +128,118 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
     db.refresh(db_user)
     return db_user
 
-@app.get("/me", response_model=UserResponse)
+@router.get("/me", response_model=UserResponse)
 def get_current_user_info(
     current_user: User = Depends(get_current_user)
 ):
     """Get the current authenticated user"""
     return current_user
 
-@app.post("/auth/login")
+@router.get("/bootstrap")
+def get_bootstrap(
+    sections: Optional[str] = None,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Everything the dashboard needs on first load in one response
+    
+    Returns user, accounts, categories, subcategories, budget_settings, budget (the
+    month's, falling back to the default) and transactions (the month's), each shaped
+    like its own endpoint's response. year/month default to the current UTC month;
+    sections is an optional comma-separated subset. Send the ETag back in If-None-Match
+    to get a 304 when nothing changed.
+    """
+    this_year, this_month = current_month()
+    year = this_year if year is None else year
+    month = this_month if month is None else month
+    if month < 1 or month > 12:
+        raise HTTPException(status_code=400, detail="Month must be between 1 and 12")
+    
+    body = render_bootstrap(build_bootstrap(db, current_user, parse_sections(sections), year, month))
+    etag = etag_for(body)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/sync")
+def sync_changes(
+    since: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Entities changed since a sync cursor
+    
+    Returns seq (the cursor for the next call), the transactions, accounts, categories,
+    subcategories, budgets and budget_settings changed after `since`, and the ids
+    deleted since then under `deleted`. Without since (or with one that can no longer
+    be served) the response is a full snapshot with full=true.
+    """
+    if since is not None and since < 0:
+        raise HTTPException(status_code=400, detail="since must not be negative")
+    return FastJSONResponse(sync_payload(db, current_user, since))
+
+@router.get("/events")
+def stream_events(request: Request, user_id: int = Depends(get_stream_user_id)):
+    """Server-sent events for the current user (transaction.created, transaction.updated, sync.completed, budget.threshold)
+    
+    EventSource can't send an Authorization header - pass the access token as access_token instead.
+    """
+    return StreamingResponse(
+        event_stream(request, user_id),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops nginx from holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/me")
+def delete_current_user(
+    response: Response,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete the current user with all their data, including accounts no other user shares"""
+    user_id = current_user.id
+    sole_account_ids = sole_member_account_ids(db, user_id)
+    
+    # Sign the user out everywhere and leave shared accounts straight away
+    db.query(RefreshToken).filter(RefreshToken.user_id == user_id).delete(synchronize_session=False)
+    db.execute(delete(user_accounts).where(user_accounts.c.user_id == user_id))
+    
+    jobs = [delete_or_schedule(db, "account", account_id, requested_by=user_id) for account_id in sole_account_ids]
+    jobs.append(delete_or_schedule(db, "user", user_id, requested_by=user_id))
+    jobs = [job for job in jobs if job is not None]
+    db.commit()
+    
+    if jobs:
+        background_tasks.add_task(run_purge_jobs, [job.id for job in jobs])
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"message": f"User {user_id} deletion scheduled", "purge_job_ids": [job.id for job in jobs]}
+    
+    return {"message": f"User {user_id} deleted successfully"}
+
+@router.get("/purge-jobs/{job_id}", response_model=PurgeJobResponse)
+def get_purge_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the progress of a background deletion"""
+    job = db.query(PurgeJob).filter(
+        PurgeJob.id == job_id,
+        PurgeJob.user_id == current_user.id
+    ).first()
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Purge job not found")
+    
+    return job
+
+@router.post("/auth/login")
 def login(email: str, password: str, db: Session = Depends(get_db)):
     """Authenticate user and return access token"""
     user = db.query(User).filter(User.email == email).first()
@@ -92,10 +250,39 @@ def login(email: str, password: str, db: Session = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token = create_access_token(data={"sub": user.email})
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = create_refresh_token(db, user.id)
+    db.commit()
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+@router.post("/auth/refresh")
+def refresh_access_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+    """Issue a new access token from a refresh token (the refresh token is rotated)"""
+    result = rotate_refresh_token(db, request.refresh_token)
+    # Commit even on failure so a reuse-triggered family revocation is persisted
+    db.commit()
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    email, refresh_token = result
+    access_token = create_access_token(data={"sub": email})
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+@router.post("/auth/logout")
+def logout(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+    """Revoke a refresh token and every token rotated from it"""
+    refresh_token = db.query(RefreshToken).filter(
+        RefreshToken.token_hash == hash_refresh_token(request.refresh_token)
+    ).first()
+    if refresh_token:
+        revoke_refresh_token_family(db, refresh_token.family_id)
+        db.commit()
+    return {"message": "Logged out successfully"}
 
 # Account management endpoints
-@app.post("/accounts/", response_model=AccountResponse)
+@router.post("/accounts/", response_model=AccountResponse)
 def create_account(
     account: AccountCreate,
     current_user: User = Depends(get_current_user),
@@ -120,22 +307,25 @@ def create_account(
     
     # Associate the account with the current user through the many-to-many relationship
     db_account.users.append(current_user)
+    invalidate_account_access(db, [current_user.id])
     
     db.commit()
     db.refresh(db_account)
     return db_account
 
-@app.get("/accounts/", response_model=List[AccountResponse])
+@router.get("/accounts/", response_model=List[AccountResponse])
 def get_accounts(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all accounts accessible to the current user (accounts they are associated with)"""
-    # Get accounts through the many-to-many relationship
-    accounts = db.query(Account).join(Account.users).filter(User.id == current_user.id).all()
-    return accounts
+    # Account ids come from the access cache
+    account_ids = accessible_account_ids(db, current_user)
+    if not account_ids:
+        return []
+    return db.query(Account).filter(Account.id.in_(account_ids)).all()
 
-@app.post("/accounts/{account_id}/users/{user_id}")
+@router.post("/accounts/{account_id}/users/{user_id}")
 def add_user_to_account(
     account_id: int,
     user_id: int,
@@ -144,57 +334,60 @@ def add_user_to_account(
 ):
     """Add a user to an account (requires current user to already have access to the account)"""
     # Verify current user has access to the account
-    account = db.query(Account).join(Account.users).filter(
-        Account.id == account_id,
-        User.id == current_user.id
-    ).first()
-    
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found or not accessible")
+    require_account_access(db, current_user, account_id)
     
     # Get the user to add
-    user_to_add = db.query(User).filter(User.id == user_id).first()
-    if not user_to_add:
+    user_exists = db.query(exists().where(User.id == user_id)).scalar()
+    if not user_exists:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check if user is already associated with the account
-    if user_to_add in account.users:
+    if is_account_member(db, account_id, user_id):
         raise HTTPException(status_code=400, detail="User is already associated with this account")
     
     # Add user to account
-    account.users.append(user_to_add)
+    db.execute(insert(user_accounts).values(user_id=user_id, account_id=account_id))
+    invalidate_account_access(db, [user_id])
     db.commit()
     
     return {"message": f"User {user_id} added to account {account_id}"}
 
-@app.delete("/accounts/{account_id}")
+@router.delete("/accounts/{account_id}")
 def delete_account(
     account_id: int,
+    response: Response,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Delete an account (only if current user is associated with it)"""
-    # Verify current user has access to the account
-    account = db.query(Account).join(Account.users).filter(
-        Account.id == account_id,
-        User.id == current_user.id
-    ).first()
+    # Remove the current user from the account; no row means no access
+    removed = db.execute(delete(user_accounts).where(
+        user_accounts.c.user_id == current_user.id,
+        user_accounts.c.account_id == account_id
+    )).rowcount
     
-    if not account:
+    if not removed:
         raise HTTPException(status_code=404, detail="Account not found or not accessible")
     
-    # Remove the current user from the account
-    account.users.remove(current_user)
+    invalidate_account_access(db, [current_user.id])
     
     # If this was the last user, delete the account entirely
-    if len(account.users) == 0:
-        db.delete(account)
+    job = None
+    if account_member_count(db, account_id) == 0:
+        job = delete_or_schedule(db, "account", account_id, requested_by=current_user.id)
     
     db.commit()
     
+    if job is not None:
+        # Large account: its transactions are deleted in the background
+        background_tasks.add_task(run_purge_jobs, [job.id])
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"message": f"Account {account_id} deletion scheduled", "purge_job_ids": [job.id]}
+    
     return {"message": f"Account {account_id} deleted successfully"}
 
-@app.delete("/accounts/{account_id}/users/{user_id}")
+@router.delete("/accounts/{account_id}/users/{user_id}")
 def remove_user_from_account(
     account_id: int,
     user_id: int,
@@ -203,40 +396,38 @@ def remove_user_from_account(
 ):
     """Remove a user from an account (requires current user to have access to the account)"""
     # Verify current user has access to the account
-    account = db.query(Account).join(Account.users).filter(
-        Account.id == account_id,
-        User.id == current_user.id
-    ).first()
-    
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found or not accessible")
+    require_account_access(db, current_user, account_id)
     
     # Get the user to remove
-    user_to_remove = db.query(User).filter(User.id == user_id).first()
-    if not user_to_remove:
+    user_exists = db.query(exists().where(User.id == user_id)).scalar()
+    if not user_exists:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check if user is associated with the account
-    if user_to_remove not in account.users:
+    if not is_account_member(db, account_id, user_id):
         raise HTTPException(status_code=400, detail="User is not associated with this account")
     
     # Prevent removing the last user from an account
-    if len(account.users) == 1:
+    if account_member_count(db, account_id) == 1:
         raise HTTPException(status_code=400, detail="Cannot remove the last user from an account")
     
     # Remove user from account
-    account.users.remove(user_to_remove)
+    db.execute(delete(user_accounts).where(
+        user_accounts.c.user_id == user_id,
+        user_accounts.c.account_id == account_id
+    ))
+    invalidate_account_access(db, [user_id])
     db.commit()
     
     return {"message": f"User {user_id} removed from account {account_id}"}
 
-@app.post("/plaid/link/token/create", response_model=LinkTokenCreateResponse)
+@router.post("/plaid/link/token/create", response_model=LinkTokenCreateResponse)
 def create_link_token(request: LinkTokenCreateRequest):
     """Create a link token for Plaid Link"""
     link_token = plaid_service.create_link_token(request.user_id)
     return LinkTokenCreateResponse(link_token=link_token)
 
-@app.post("/plaid/link/token/exchange", response_model=ExchangeTokenResponse)
+@router.post("/plaid/link/token/exchange", response_model=ExchangeTokenResponse)
 def exchange_public_token(request: ExchangeTokenRequest):
     """Exchange a public token for an access token"""
     result = plaid_service.exchange_public_token(request.public_token)
@@ -247,9 +438,49 @@ def exchange_public_token(request: ExchangeTokenRequest):
     )
 
 # Plaid integration endpoints
-# Note: PlaidItem model removed from schema - plaid_item_id stored directly on Account
+@router.post("/plaid/items/", response_model=PlaidItemResponse)
+def create_plaid_item(
+    item: PlaidItemCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Register a linked Plaid item so its webhooks can sync it"""
+    if db.query(PlaidItem).filter(PlaidItem.item_id == item.item_id).first():
+        raise HTTPException(status_code=400, detail="Plaid item already registered")
+    
+    db_item = PlaidItem(**item.model_dump(), user_id=current_user.id)
+    db.add(db_item)
+    db.commit()
+    db.refresh(db_item)
+    return db_item
+
+@router.get("/plaid/items/", response_model=List[PlaidItemResponse])
+def get_plaid_items(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the current user's Plaid items"""
+    return db.query(PlaidItem).filter(PlaidItem.user_id == current_user.id).order_by(PlaidItem.id).all()
 
-# @app.post("/plaid/sync/")
+@router.post("/plaid/webhook")
+async def plaid_webhook(
+    request: Request,
+    plaid_verification: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Receive a Plaid webhook and queue a sync of the item it names (see api/plaid_sync.py)"""
+    # The signature covers the raw body, so read it before anything parses it
+    body = await request.body()
+    return await run_in_threadpool(receive_webhook, db, body, plaid_verification)
+
+@router.get("/plaid/cache/metrics")
+def get_plaid_cache_metrics(current_user: User = Depends(get_current_user)):
+    """Hit/miss metrics of the Plaid institution and account metadata caches"""
+    return plaid_service.cache_metrics()
+
+# Note: accounts reference their item through plaid_item_id; the sync below is superseded by webhook-driven syncs
+
+# @router.post("/plaid/sync/")
 # def sync_plaid_data(
 #     item_id: str,
 #     current_user: User = Depends(get_current_user),
@@ -340,31 +571,27 @@ def exchange_public_token(request: ExchangeTokenRequest):
 #         raise HTTPException(status_code=500, detail=f"Failed to sync data: {str(e)}")
 
 # Transaction endpoints
-@app.get("/transactions/", response_model=List[TransactionResponse])
-def get_transactions(
+def build_transactions_query(
+    db: Session,
+    current_user: User,
     account_id: Optional[int] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     category_id: Optional[int] = None,
     subcategory_id: Optional[int] = None,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    household: bool = False
 ):
-    """Get transactions with optional filtering - only returns transactions for the current user"""
-    # Filter by current user first
-    query = db.query(Transaction).filter(Transaction.user_id == current_user.id)
+    """Build the filtered transaction query shared by listing and export - only the current user's transactions,
+    or with household=True all transactions on the accounts the user shares"""
+    # Filter by current user (or household) first
+    query = db.query(Transaction).filter(transaction_scope(db, current_user, household))
     
     # Use left join to include transactions without accounts
     query = query.outerjoin(Account)
     
     if account_id:
         # Verify account is accessible to current user (through many-to-many relationship)
-        account = db.query(Account).join(Account.users).filter(
-            Account.id == account_id,
-            User.id == current_user.id
-        ).first()
-        if not account:
-            raise HTTPException(status_code=404, detail="Account not found or not accessible")
+        require_account_access(db, current_user, account_id)
         query = query.filter(Transaction.account_id == account_id)
     if start_date:
         query = query.filter(Transaction.date >= start_date)
@@ -387,47 +614,141 @@ def get_transactions(
         ).first()
         if not category:
             raise HTTPException(status_code=404, detail="Category not found")
-        # Filter by category - can be direct custom_category_id or through subcategory relationship
-        query = query.outerjoin(Subcategory, Transaction.custom_subcategory_id == Subcategory.id).filter(
-            or_(
-                Transaction.custom_category_id == category_id,
-                Subcategory.category_id == category_id
-            )
+        # Filter by category - direct custom_category_id or through the subcategory, denormalized
+        query = query.filter(Transaction.effective_category_id == category_id)
+    
+    return query
+
+@router.get("/transactions/", response_model=List[TransactionResponse])
+def get_transactions(
+    account_id: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category_id: Optional[int] = None,
+    subcategory_id: Optional[int] = None,
+    fast: bool = False,
+    household: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Get transactions with optional filtering - only returns transactions for the current user
+    
+    Pass fast=true to opt into the fast response path: plain rows encoded with orjson,
+    skipping ORM object loading and response model validation. The JSON is identical.
+    Pass household=true to list every member's transactions on the accounts the user shares.
+    Ranges starting before the archive cutoff also include archived transactions.
+    """
+    query = build_transactions_query(
+        db, current_user, account_id, start_date, end_date, category_id, subcategory_id, household
+    ).order_by(Transaction.date.desc())
+    if needs_archive(start_date):
+        archived = archived_transactions(
+            db, current_user, account_id, start_date, end_date, category_id, subcategory_id, household
         )
+        if archived:
+            # Archived rows are already response dicts, so merge on the fast path
+            rows = transaction_rows(query) + archived
+            rows.sort(key=lambda item: item["date"], reverse=True)
+            return FastJSONResponse(rows)
+    if fast:
+        return FastJSONResponse(transaction_rows(query))
     
-    transactions = query.order_by(Transaction.date.desc()).all()
+    transactions = query.all()
     return transactions
 
-@app.post("/transactions/", response_model=TransactionResponse)
+@router.get("/transactions/export")
+def export_transactions(
+    format: str = "csv",
+    account_id: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category_id: Optional[int] = None,
+    subcategory_id: Optional[int] = None,
+    household: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Export transactions as CSV, Parquet or Arrow (IPC stream), streamed in chunks
+    
+    Rows are read through a server-side cursor EXPORT_CHUNK_SIZE at a time, so memory use
+    stays bounded regardless of the date range.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported export format '{format}'. Use one of: {', '.join(EXPORT_FORMATS)}"
+        )
+    
+    query = build_transactions_query(
+        db, current_user, account_id, start_date, end_date, category_id, subcategory_id, household
+    ).order_by(Transaction.date, Transaction.id)
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream_export(export_statement(query), format, bind=db.get_bind()),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions.{extension}"'}
+    )
+
+@router.get("/transactions/archive/monthly", response_model=List[ArchivedMonthlyTotalResponse])
+def get_archived_monthly_totals(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    account_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Monthly totals per category of the current user's archived transactions"""
+    if account_id:
+        require_account_access(db, current_user, account_id)
+    return archived_monthly_totals(db, current_user, start_date, end_date, account_id)
+
+@router.post("/transactions/", response_model=TransactionResponse)
 def create_transaction(
     transaction: TransactionCreate,
+    allow_duplicate: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Create a new transaction manually (independent of Plaid data)"""
+    """Create a new transaction manually (independent of Plaid data). A transaction with the
+    same account, day, amount and merchant as a stored one is refused unless allow_duplicate,
+    one with a Plaid transaction id already stored always."""
     # Verify that the account exists and is accessible to current user if account_id is provided
     if transaction.account_id is not None:
-        account = db.query(Account).join(Account.users).filter(
-            Account.id == transaction.account_id,
-            User.id == current_user.id
-        ).first()
-        if not account:
-            raise HTTPException(status_code=404, detail="Account not found or not accessible")
+        require_account_access(db, current_user, transaction.account_id)
+    
+    # Plaid ids are unique across all transactions and users (migration 0017)
+    if transaction.plaid_transaction_id is not None and db.get(PlaidTransactionId, transaction.plaid_transaction_id):
+        raise HTTPException(
+            status_code=409,
+            detail=f"A transaction with Plaid transaction id '{transaction.plaid_transaction_id}' already exists"
+        )
+    
+    fingerprint = transaction_fingerprint(
+        transaction.account_id, transaction.date, transaction.amount, transaction.name, transaction.merchant_name
+    )
+    if not allow_duplicate:
+        stored = stored_duplicates(db, current_user.id, [{"fingerprint": fingerprint, "date": transaction.date}])
+        if stored:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Transaction {stored[fingerprint][0]} has the same account, date, amount and merchant"
+            )
     
-    # Create the transaction
+    # Create the transaction, pointing at its normalized merchant
+    merchant_id = resolve_merchant_id(db, transaction.merchant_name, transaction.name)
     db_transaction = Transaction(
         user_id=current_user.id,
         account_id=transaction.account_id,
         plaid_transaction_id=transaction.plaid_transaction_id,
+        pending_transaction_id=transaction.pending_transaction_id,
         amount=transaction.amount,
         iso_currency_code=transaction.iso_currency_code,
         date=transaction.date,
         datetime=transaction.datetime,
         name=transaction.name,
         merchant_name=transaction.merchant_name,
-        merchant_entity_id=transaction.merchant_entity_id,
-        logo_url=transaction.logo_url,
-        website=transaction.website,
+        merchant_id=merchant_id,
         pending=transaction.pending,
         authorized_date=transaction.authorized_date,
         authorized_datetime=transaction.authorized_datetime,
@@ -435,15 +756,155 @@ def create_transaction(
         custom_category_id=transaction.custom_category_id,
         custom_subcategory_id=transaction.custom_subcategory_id,
         notes=transaction.notes,
-        tags=transaction.tags
+        tags=transaction.tags,
+        fingerprint=fingerprint
     )
     
     db.add(db_transaction)
+    db.flush()
+    
+    # A posted transaction may replace a pending one - merge them so it isn't counted twice
+    if not db_transaction.pending:
+        reconcile_pending_transactions(db, current_user.id, posted_ids=[db_transaction.id])
+    
     db.commit()
     db.refresh(db_transaction)
+    publish_event(current_user.id, "transaction.created", response_dict(TransactionResponse, db_transaction))
+    deliver_budget_alerts(db, current_user.id)
     return db_transaction
 
-@app.put("/transactions/{transaction_id}", response_model=TransactionResponse)
+@router.post("/transactions/reconcile", response_model=ReconciliationResponse)
+def reconcile_transactions(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Merge pending transactions into the posted transactions that replace them"""
+    merged = reconcile_pending_transactions(db, current_user.id)
+    db.commit()
+    return ReconciliationResponse(merged=merged)
+
+@router.post("/transactions/import", response_model=TransactionImportResponse)
+def import_transactions(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    account_id: Optional[int] = None,
+    date_format: Optional[str] = None,
+    invert_amounts: bool = False,
+    dry_run: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Import a CSV, OFX or QIF statement file (format defaults to the file extension).
+    dry_run reports what would be imported without saving anything."""
+    import_format = detect_format(file.filename, format)
+    if account_id is not None:
+        require_account_access(db, current_user, account_id)
+    
+    report = import_statement(
+        db, current_user.id, file.file, import_format, account_id=account_id,
+        date_format=date_format, invert_amounts=invert_amounts, dry_run=dry_run
+    )
+    if dry_run:
+        db.rollback()
+    else:
+        db.commit()
+        deliver_budget_alerts(db, current_user.id)
+    return TransactionImportResponse(format=import_format, dry_run=dry_run, **report)
+
+@router.get("/transactions/duplicates", response_model=List[DuplicateClusterResponse])
+def get_duplicate_transactions(
+    window_days: int = DUPLICATE_WINDOW_DAYS,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Clusters of likely duplicate transactions, most recent first: same merchant and amount
+    at most window_days apart, on the same account or with either unassigned"""
+    if window_days < 0 or window_days > MAX_DUPLICATE_WINDOW_DAYS:
+        raise HTTPException(status_code=400, detail=f"window_days must be between 0 and {MAX_DUPLICATE_WINDOW_DAYS}")
+    return duplicate_clusters(db, current_user.id, window_days, limit)
+
+def _transaction_splits(db: Session, transaction_id: int) -> List[TransactionSplit]:
+    return db.query(TransactionSplit).filter(
+        TransactionSplit.transaction_id == transaction_id
+    ).order_by(TransactionSplit.id).all()
+
+@router.get("/transactions/{transaction_id}/splits", response_model=List[TransactionSplitResponse])
+def get_transaction_splits(
+    transaction_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the splits of a transaction"""
+    transaction = db.query(Transaction.id).filter(
+        Transaction.id == transaction_id,
+        Transaction.user_id == current_user.id
+    ).first()
+    
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    
+    return _transaction_splits(db, transaction_id)
+
+@router.put("/transactions/{transaction_id}/splits", response_model=List[TransactionSplitResponse])
+def replace_transaction_splits(
+    transaction_id: int,
+    splits_update: TransactionSplitsUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Split a transaction across categories, replacing its splits. Whatever the splits
+    don't cover stays in the transaction's own category."""
+    # Locked so concurrent replacements don't interleave
+    transaction = db.query(Transaction).filter(
+        Transaction.id == transaction_id,
+        Transaction.user_id == current_user.id
+    ).with_for_update(of=Transaction).first()
+    
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    
+    splits = splits_update.splits
+    for split in splits:
+        if split.custom_category_id is None and split.custom_subcategory_id is None:
+            raise HTTPException(status_code=400, detail="Each split needs a category or subcategory")
+        if split.amount == 0 or (split.amount < 0) != (transaction.amount < 0):
+            raise HTTPException(status_code=400, detail="Split amounts must be non-zero with the sign of the transaction amount")
+    if abs(sum(split.amount for split in splits)) > abs(transaction.amount):
+        raise HTTPException(status_code=400, detail="Splits add up to more than the transaction amount")
+    
+    # Verify the categories belong to current user, one query per kind
+    category_ids = {split.custom_category_id for split in splits if split.custom_category_id is not None}
+    subcategory_ids = {split.custom_subcategory_id for split in splits if split.custom_subcategory_id is not None}
+    if category_ids and db.query(Category).filter(
+        Category.id.in_(category_ids),
+        (Category.user_id == current_user.id) | (Category.is_system == True)
+    ).count() != len(category_ids):
+        raise HTTPException(status_code=404, detail="Category not found")
+    if subcategory_ids and db.query(Subcategory).filter(
+        Subcategory.id.in_(subcategory_ids),
+        (Subcategory.user_id == current_user.id) | (Subcategory.is_system == True)
+    ).count() != len(subcategory_ids):
+        raise HTTPException(status_code=404, detail="Subcategory not found")
+    
+    db.execute(delete(TransactionSplit).where(TransactionSplit.transaction_id == transaction_id))
+    if splits:
+        db.execute(insert(TransactionSplit), [
+            {
+                **split.model_dump(),
+                "user_id": current_user.id,
+                "transaction_id": transaction_id,
+                "transaction_date": transaction.date
+            }
+            for split in splits
+        ])
+    db.commit()
+    db.refresh(transaction)
+    publish_event(current_user.id, "transaction.updated", response_dict(TransactionResponse, transaction))
+    deliver_budget_alerts(db, current_user.id)
+    return _transaction_splits(db, transaction_id)
+
+@router.put("/transactions/{transaction_id}", response_model=TransactionResponse)
 def update_transaction(
     transaction_id: int,
     transaction_update: TransactionUpdate,
@@ -470,10 +931,12 @@ def update_transaction(
     
     db.commit()
     db.refresh(transaction)
+    publish_event(current_user.id, "transaction.updated", response_dict(TransactionResponse, transaction))
+    deliver_budget_alerts(db, current_user.id)
     return transaction
 
 # Category management endpoints
-@app.get("/categories/", response_model=List[CategoryResponse])
+@router.get("/categories/", response_model=List[CategoryResponse])
 def get_categories(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -484,7 +947,7 @@ def get_categories(
     ).order_by(Category.is_system.desc(), Category.name).all()
     return categories
 
-@app.post("/categories/", response_model=CategoryResponse)
+@router.post("/categories/", response_model=CategoryResponse)
 def create_category(
     category: CategoryCreate,
     current_user: User = Depends(get_current_user),
@@ -515,7 +978,7 @@ def create_category(
     db.refresh(db_category)
     return db_category
 
-@app.put("/categories/{category_id}", response_model=CategoryResponse)
+@router.put("/categories/{category_id}", response_model=CategoryResponse)
 def update_category(
     category_id: int,
     category_update: CategoryCreate,
@@ -554,7 +1017,7 @@ def update_category(
     db.refresh(category)
     return category
 
-@app.delete("/categories/{category_id}")
+@router.delete("/categories/{category_id}")
 def delete_category(
     category_id: int,
     current_user: User = Depends(get_current_user),
@@ -585,7 +1048,7 @@ def delete_category(
     return {"message": "Category deleted successfully"}
 
 # Subcategory management endpoints
-@app.get("/subcategories/", response_model=List[SubcategoryResponse])
+@router.get("/subcategories/", response_model=List[SubcategoryResponse])
 def get_subcategories(
     category_id: Optional[int] = None,
     current_user: User = Depends(get_current_user),
@@ -602,7 +1065,7 @@ def get_subcategories(
     subcategories = query.order_by(Subcategory.is_system.desc(), Subcategory.name).all()
     return subcategories
 
-@app.post("/subcategories/", response_model=SubcategoryResponse)
+@router.post("/subcategories/", response_model=SubcategoryResponse)
 def create_subcategory(
     subcategory: SubcategoryCreate,
     category_id: int,
@@ -635,7 +1098,7 @@ def create_subcategory(
     db.refresh(db_subcategory)
     return db_subcategory
 
-@app.put("/subcategories/{subcategory_id}", response_model=SubcategoryResponse)
+@router.put("/subcategories/{subcategory_id}", response_model=SubcategoryResponse)
 def update_subcategory(
     subcategory_id: int,
     subcategory_update: SubcategoryCreate,
@@ -660,7 +1123,7 @@ def update_subcategory(
     db.refresh(subcategory)
     return subcategory
 
-@app.delete("/subcategories/{subcategory_id}")
+@router.delete("/subcategories/{subcategory_id}")
 def delete_subcategory(
     subcategory_id: int,
     current_user: User = Depends(get_current_user),
@@ -692,46 +1155,34 @@ def delete_subcategory(
     return {"message": "Subcategory deleted successfully"}
 
 # Analytics endpoints
-@app.get("/analytics/spending-by-category")
+@router.get("/analytics/spending-by-category")
 def get_spending_by_category(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    household: bool = False,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """Get spending breakdown by category (using transactions_as_category relationship)"""
-    # Filter by current user first, then use outerjoin to include transactions without accounts
-    query = db.query(Transaction).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.amount < 0  # Only expenses
-    ).outerjoin(Account)
-    
-    if start_date:
-        query = query.filter(Transaction.date >= start_date)
-    if end_date:
-        query = query.filter(Transaction.date <= end_date)
-    
-    transactions = query.all()
-    
-    # Group by category using the relationship
-    category_totals = {}
-    for transaction in transactions:
-        category_name = "Uncategorized"
-        if transaction.custom_subcategory_id:
-            subcategory = db.query(Subcategory).filter(Subcategory.id == transaction.custom_subcategory_id).first()
-            if subcategory and subcategory.category:
-                category_name = subcategory.category.name
-        
-        if category_name not in category_totals:
-            category_totals[category_name] = 0
-        category_totals[category_name] += abs(transaction.amount)
-    
-    return category_totals
+    """Get spending breakdown by category (household=true combines everyone sharing the user's accounts)"""
+    if household:
+        return household_spending_by_category(db, current_user, start_date, end_date)
+    return spending_by_category(db, transaction_scope(db, current_user, source=transaction_allocations.c), start_date, end_date)
+
+@router.get("/analytics/spending-by-merchant")
+def get_spending_by_merchant(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    household: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Get spending breakdown by normalized merchant (household=true combines everyone sharing the user's accounts)"""
+    return spending_by_merchant(db, transaction_scope(db, current_user, household), start_date, end_date)
 
 # Budget management endpoints
 
 # Budget Template endpoints - monthly budgets
-@app.post("/budget/monthly/", response_model=BudgetTemplateResponse)
+@router.post("/budget/monthly/", response_model=BudgetTemplateResponse)
 def create_monthly_budget(
     budget_create: BudgetTemplateCreate,
     current_user: User = Depends(get_current_user),
@@ -774,36 +1225,25 @@ def create_monthly_budget(
     db.add(template)
     db.flush()
     
-    # Create entries
-    for entry in budget_create.entries:
-        db_entry = BudgetTemplateEntry(
-            template_id=template.id,
-            category_id=entry.category_id,
-            subcategory_id=entry.subcategory_id,
-            budgeted_amount=entry.budgeted_amount
-        )
-        db.add(db_entry)
+    # Create entries in one bulk insert
+    sync_template_entries(db, template, budget_create.entries)
     
     db.commit()
     db.refresh(template)
     return template
 
-@app.get("/budget/monthly/{year}/{month}/", response_model=BudgetTemplateResponse)
+@router.get("/budget/monthly/{year}/{month}/", response_model=BudgetTemplateResponse)
 def get_monthly_budget(
     year: int,
     month: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get user's monthly budget for a specific month/year"""
+    """Get user's monthly budget for a specific month/year (falls back to the default budget)"""
     if month < 1 or month > 12:
         raise HTTPException(status_code=400, detail="Month must be between 1 and 12")
     
-    template = db.query(BudgetTemplate).filter(
-        BudgetTemplate.user_id == current_user.id,
-        BudgetTemplate.year == year,
-        BudgetTemplate.month == month
-    ).first()
+    template = resolve_template(db, current_user.id, year, month)
     
     if not template:
         raise HTTPException(
@@ -811,9 +1251,13 @@ def get_monthly_budget(
             detail=f"Budget not found for {year}-{month:02d}. Please create it first."
         )
     
+    if (template.year, template.month) != (year, month):
+        # Default budget standing in for this month - it is copied into the month on first update
+        return BudgetTemplateResponse.model_validate(template).model_copy(update={"year": year, "month": month})
+    
     return template
 
-@app.put("/budget/monthly/{year}/{month}/", response_model=BudgetTemplateResponse)
+@router.put("/budget/monthly/{year}/{month}/", response_model=BudgetTemplateResponse)
 def update_monthly_budget(
     year: int,
     month: int,
@@ -825,12 +1269,8 @@ def update_monthly_budget(
     if month < 1 or month > 12:
         raise HTTPException(status_code=400, detail="Month must be between 1 and 12")
     
-    # Get existing template
-    template = db.query(BudgetTemplate).filter(
-        BudgetTemplate.user_id == current_user.id,
-        BudgetTemplate.year == year,
-        BudgetTemplate.month == month
-    ).first()
+    # Get existing template, copying the default budget into this month if it has none yet
+    template = materialize_template(db, current_user.id, year, month)
     
     if not template:
         raise HTTPException(
@@ -853,24 +1293,81 @@ def update_monthly_budget(
                     detail="Each budget entry must have either category_id or subcategory_id"
                 )
         
-        # Delete existing entries
-        db.query(BudgetTemplateEntry).filter(BudgetTemplateEntry.template_id == template.id).delete()
-        
-        # Create new entries
-        for entry in template_update.entries:
-            db_entry = BudgetTemplateEntry(
-                template_id=template.id,
-                category_id=entry.category_id,
-                subcategory_id=entry.subcategory_id,
-                budgeted_amount=entry.budgeted_amount
-            )
-            db.add(db_entry)
+        # Only insert/update/delete the entries that changed
+        sync_template_entries(db, template, template_update.entries)
+    
+    db.flush()
+    # Reload only the template's own columns; entries were set by the upsert
+    db.refresh(template, attribute_names=["total_budget", "updated_at"])
+    # Build the response from the session state before commit expires it
+    response = BudgetTemplateResponse.model_validate(template)
+    db.commit()
+    return response
+
+@router.put("/budget/monthly/{year}/{month}/default", response_model=BudgetTemplateResponse)
+def set_default_monthly_budget(
+    year: int,
+    month: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Use this month's budget for every month that doesn't have its own"""
+    template = get_template(db, current_user.id, year, month)
+    
+    if not template:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Budget not found for {year}-{month:02d}. Please create it first."
+        )
+    
+    # Unset the previous default first - at most one is allowed
+    db.query(BudgetTemplate).filter(
+        BudgetTemplate.user_id == current_user.id,
+        BudgetTemplate.is_default == True,
+        BudgetTemplate.id != template.id
+    ).update({BudgetTemplate.is_default: False}, synchronize_session=False)
+    template.is_default = True
     
     db.commit()
     db.refresh(template)
     return template
 
-@app.get("/budget/monthly/", response_model=List[BudgetTemplateResponse])
+@router.post("/budget/monthly/clone", response_model=BudgetCloneResponse)
+def clone_monthly_budget(
+    clone: BudgetCloneRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Copy a month's budget to a range of months, optionally carrying unspent amounts forward"""
+    for check_month in (clone.source_month, clone.start_month, clone.end_month):
+        if check_month < 1 or check_month > 12:
+            raise HTTPException(status_code=400, detail="Month must be between 1 and 12")
+    
+    targets = month_range(clone.start_year, clone.start_month, clone.end_year, clone.end_month)
+    if not targets:
+        raise HTTPException(status_code=400, detail="End month must not be before start month")
+    if len(targets) > BUDGET_CLONE_MAX_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Cannot clone to more than {BUDGET_CLONE_MAX_MONTHS} months at once")
+    
+    source = resolve_template(db, current_user.id, clone.source_year, clone.source_month)
+    if not source:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Budget not found for {clone.source_year}-{clone.source_month:02d}. Please create it first."
+        )
+    
+    carry_over_from = (clone.source_year, clone.source_month) if clone.carry_over_unspent else None
+    created = clone_template(db, source, targets, overwrite=clone.overwrite, carry_over_from=carry_over_from)
+    db.commit()
+    
+    # Months left out: those that already had a budget, and the source month itself
+    skipped = [target for target in targets if target not in set(created) and target != (source.year, source.month)]
+    return BudgetCloneResponse(
+        created=[f"{year}-{month:02d}" for year, month in created],
+        skipped=[f"{year}-{month:02d}" for year, month in skipped]
+    )
+
+@router.get("/budget/monthly/", response_model=List[BudgetTemplateResponse])
 def list_monthly_budgets(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -882,28 +1379,33 @@ def list_monthly_budgets(
     
     return templates
 
-@app.post("/budget/settings/", response_model=UserBudgetSettingsResponse)
+@router.post("/budget/settings/", response_model=UserBudgetSettingsResponse)
 def create_or_update_budget_settings(
     settings: UserBudgetSettingsCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Create or update user's budget settings (monthly income and savings goal)"""
+    """Create or update user's budget settings (monthly income, savings goal and budget alert thresholds)"""
     # Check if settings already exist
     db_settings = db.query(UserBudgetSettings).filter(
         UserBudgetSettings.user_id == current_user.id
     ).first()
     
+    alert_thresholds = normalize_thresholds(settings.alert_thresholds) if settings.alert_thresholds is not None else None
+    
     if db_settings:
         # Update existing settings
         db_settings.monthly_income = settings.monthly_income
         db_settings.monthly_savings_goal = settings.monthly_savings_goal
+        if alert_thresholds is not None:
+            db_settings.alert_thresholds = alert_thresholds
     else:
         # Create new settings
         db_settings = UserBudgetSettings(
             user_id=current_user.id,
             monthly_income=settings.monthly_income,
-            monthly_savings_goal=settings.monthly_savings_goal
+            monthly_savings_goal=settings.monthly_savings_goal,
+            alert_thresholds=alert_thresholds or DEFAULT_ALERT_THRESHOLDS
         )
         db.add(db_settings)
     
@@ -911,7 +1413,7 @@ def create_or_update_budget_settings(
     db.refresh(db_settings)
     return db_settings
 
-@app.get("/budget/settings/", response_model=UserBudgetSettingsResponse)
+@router.get("/budget/settings/", response_model=UserBudgetSettingsResponse)
 def get_budget_settings(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -926,7 +1428,7 @@ def get_budget_settings(
     
     return settings
 
-@app.put("/budget/settings/", response_model=UserBudgetSettingsResponse)
+@router.put("/budget/settings/", response_model=UserBudgetSettingsResponse)
 def update_budget_settings(
     settings_update: UserBudgetSettingsUpdate,
     current_user: User = Depends(get_current_user),
@@ -944,28 +1446,38 @@ def update_budget_settings(
         db_settings.monthly_income = settings_update.monthly_income
     if settings_update.monthly_savings_goal is not None:
         db_settings.monthly_savings_goal = settings_update.monthly_savings_goal
+    if settings_update.alert_thresholds is not None:
+        db_settings.alert_thresholds = normalize_thresholds(settings_update.alert_thresholds)
     
     db.commit()
     db.refresh(db_settings)
     return db_settings
 
-@app.get("/budget/monthly/{year}/{month}/summary", response_model=MonthlyBudgetSummaryResponse)
+@router.get("/budget/alerts", response_model=List[BudgetAlertResponse])
+def get_budget_alerts(
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Budget alerts fired when spending crossed an alert threshold, newest first (optionally for a year or month)"""
+    if month is not None and (year is None or month < 1 or month > 12):
+        raise HTTPException(status_code=400, detail="month requires year and must be between 1 and 12")
+    return list_budget_alerts(db, current_user.id, year, month)
+
+@router.get("/budget/monthly/{year}/{month}/summary", response_model=MonthlyBudgetSummaryResponse)
 def get_monthly_budget_summary(
     year: int,
     month: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get comprehensive budget summary for a month - compares transactions against monthly budget"""
     if month < 1 or month > 12:
         raise HTTPException(status_code=400, detail="Month must be between 1 and 12")
     
-    # Get user's monthly budget template for the specific month/year
-    budget_template = db.query(BudgetTemplate).filter(
-        BudgetTemplate.user_id == current_user.id,
-        BudgetTemplate.year == year,
-        BudgetTemplate.month == month
-    ).first()
+    # Get user's monthly budget template for the specific month/year (or the default budget)
+    budget_template = resolve_template(db, current_user.id, year, month)
     
     if not budget_template or not budget_template.entries:
         raise HTTPException(
@@ -981,40 +1493,38 @@ def get_monthly_budget_summary(
     if not budget_settings:
         raise HTTPException(status_code=404, detail="Budget settings not found")
     
-    # Calculate date range for the month
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-    
-    # Get all transactions for this month (expenses only, negative amounts) for the current user
-    # Use outerjoin to include transactions without accounts
-    transactions = db.query(Transaction).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.date >= start_date,
-        Transaction.date < end_date,
-        Transaction.amount < 0  # Only expenses
-    ).outerjoin(Account).all()
+    # Calculate date range for the month (constant UTC bounds, so only its partition is scanned)
+    start_date, end_date = month_bounds(year, month)
+    
+    # Categorized spending for this month (expenses only, negative amounts), grouped in the
+    # database over the allocations so split transactions count in each of their categories
+    allocations = transaction_allocations.c
+    spending = db.query(
+        allocations.category_id,
+        allocations.subcategory_id,
+        func.sum(func.abs(allocations.amount))
+    ).filter(
+        allocations.user_id == current_user.id,
+        allocations.category_id.isnot(None),
+        allocations.date >= start_date,
+        allocations.date < end_date,
+        allocations.amount < 0  # Only expenses
+    ).group_by(allocations.category_id, allocations.subcategory_id).all()
     
     # Build comparison data
     comparisons = []
     total_budgeted = Decimal('0')
     total_spent = Decimal('0')
     
-    # Group transactions by category/subcategory
+    # Totals by category (direct or through a subcategory) and by subcategory
+    spending_by_category = {}
     spending_by_subcategory = {}
     
-    for transaction in transactions:
-        if transaction.custom_subcategory_id:
-            subcategory = db.query(Subcategory).filter(
-                Subcategory.id == transaction.custom_subcategory_id
-            ).first()
-            if subcategory:
-                if subcategory.id not in spending_by_subcategory:
-                    spending_by_subcategory[subcategory.id] = Decimal('0')
-                spending_by_subcategory[subcategory.id] += abs(transaction.amount)
-                total_spent += abs(transaction.amount)
+    for category_id, subcategory_id, amount in spending:
+        spending_by_category[category_id] = spending_by_category.get(category_id, Decimal('0')) + amount
+        if subcategory_id:
+            spending_by_subcategory[subcategory_id] = spending_by_subcategory.get(subcategory_id, Decimal('0')) + amount
+        total_spent += amount
     
     # Process budget entries from template
     for entry in budget_template.entries:
@@ -1027,20 +1537,15 @@ def get_monthly_budget_summary(
         
         if entry.subcategory_id:
             actual_amount = spending_by_subcategory.get(entry.subcategory_id, Decimal('0'))
-            subcategory = db.query(Subcategory).filter(Subcategory.id == entry.subcategory_id).first()
-            if subcategory:
-                subcategory_name = subcategory.name
-                category = db.query(Category).filter(Category.id == subcategory.category_id).first()
-                if category:
-                    category_name = category.name
+            if entry.subcategory:
+                subcategory_name = entry.subcategory.name
+                if entry.subcategory.category:
+                    category_name = entry.subcategory.category.name
         elif entry.category_id:
-            # Sum all subcategories under this category
-            category = db.query(Category).filter(Category.id == entry.category_id).first()
-            if category:
-                category_name = category.name
-                for subcategory in category.subcategories:
-                    if subcategory.id in spending_by_subcategory:
-                        actual_amount += spending_by_subcategory[subcategory.id]
+            # Everything in this category, whether assigned directly or through a subcategory
+            actual_amount = spending_by_category.get(entry.category_id, Decimal('0'))
+            if entry.category:
+                category_name = entry.category.name
         
         difference = actual_amount - budgeted_amount
         percentage_used = (actual_amount / budgeted_amount * 100) if budgeted_amount > 0 else Decimal('0')
@@ -1070,6 +1575,8 @@ def get_monthly_budget_summary(
         savings_progress=savings_progress
     )
 
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
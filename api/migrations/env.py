@@ -0,0 +1,59 @@
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+from api.database import Base, DATABASE_URL
+import api.models  # noqa: F401 - registers the models on Base.metadata
+from api.partitions import DEFAULT_PARTITION, partition_range
+
+config = context.config
+config.set_main_option("sqlalchemy.url", DATABASE_URL)
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+def include_name(name, type_, parent_names):
+    """Leave the transactions partitions (and their indexes) out of autogenerate"""
+    if type_ == "table":
+        return name != DEFAULT_PARTITION and partition_range(name) is None
+    return True
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Leave views mapped as tables (info={"is_view": True}) out of autogenerate"""
+    return not (type_ == "table" and object.info.get("is_view"))
+
+def run_migrations_offline():
+    """Run migrations in 'offline' mode (emit SQL without a database connection)"""
+    context.configure(
+        url=DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    """Run migrations against the database"""
+    connectable = engine_from_config(
+        config.get_section(config.config_ini_section, {}),
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+    
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection, target_metadata=target_metadata, include_name=include_name, include_object=include_object
+        )
+        
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
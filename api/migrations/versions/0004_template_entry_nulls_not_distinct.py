@@ -0,0 +1,30 @@
+"""template entry nulls not distinct
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 10:49:02.418207
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # NULLs were distinct, so duplicate category-level entries may exist - keep the newest of each
+    op.execute("""
+        DELETE FROM budget_template_entries AS older
+        USING budget_template_entries AS newer
+        WHERE older.template_id = newer.template_id
+          AND older.category_id IS NOT DISTINCT FROM newer.category_id
+          AND older.subcategory_id IS NOT DISTINCT FROM newer.subcategory_id
+          AND older.id < newer.id
+    """)
+    op.drop_constraint('uq_template_entry', 'budget_template_entries', type_='unique')
+    op.create_unique_constraint('uq_template_entry', 'budget_template_entries', ['template_id', 'category_id', 'subcategory_id'], postgresql_nulls_not_distinct=True)
+
+def downgrade():
+    op.drop_constraint('uq_template_entry', 'budget_template_entries', type_='unique')
+    op.create_unique_constraint('uq_template_entry', 'budget_template_entries', ['template_id', 'category_id', 'subcategory_id'])
@@ -0,0 +1,80 @@
+"""transaction effective category
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 10:51:49.294764
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 50000
+
+def upgrade():
+    op.add_column('transactions', sa.Column('effective_category_id', sa.Integer(), nullable=True))
+
+    # Backfill in id ranges so no single statement rewrites the whole table
+    connection = op.get_bind()
+    max_id = connection.execute(sa.text("SELECT COALESCE(MAX(id), 0) FROM transactions")).scalar()
+    for start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+        connection.execute(sa.text("""
+            UPDATE transactions AS t
+            SET effective_category_id = COALESCE(
+                t.custom_category_id,
+                (SELECT category_id FROM subcategories WHERE id = t.custom_subcategory_id)
+            )
+            WHERE t.id >= :start AND t.id < :end
+              AND (t.custom_category_id IS NOT NULL OR t.custom_subcategory_id IS NOT NULL)
+        """), {"start": start, "end": start + BACKFILL_BATCH_SIZE})
+
+    # Keep the column current on every write, including FK SET NULL actions
+    op.execute("""
+        CREATE OR REPLACE FUNCTION transactions_set_effective_category()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.effective_category_id = COALESCE(
+                NEW.custom_category_id,
+                (SELECT category_id FROM subcategories WHERE id = NEW.custom_subcategory_id)
+            );
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_transactions_effective_category
+        BEFORE INSERT OR UPDATE OF custom_category_id, custom_subcategory_id ON transactions
+        FOR EACH ROW EXECUTE FUNCTION transactions_set_effective_category()
+    """)
+
+    # Moving a subcategory to another category moves its transactions with it
+    op.execute("""
+        CREATE OR REPLACE FUNCTION subcategories_propagate_category()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            UPDATE transactions
+            SET effective_category_id = NEW.category_id
+            WHERE custom_subcategory_id = NEW.id AND custom_category_id IS NULL;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_subcategories_propagate_category
+        AFTER UPDATE OF category_id ON subcategories
+        FOR EACH ROW WHEN (OLD.category_id IS DISTINCT FROM NEW.category_id)
+        EXECUTE FUNCTION subcategories_propagate_category()
+    """)
+
+    op.create_index('ix_transactions_user_effective_category_date', 'transactions', ['user_id', 'effective_category_id', 'date'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_transactions_user_effective_category_date', table_name='transactions')
+    op.execute("DROP TRIGGER IF EXISTS trg_subcategories_propagate_category ON subcategories")
+    op.execute("DROP FUNCTION IF EXISTS subcategories_propagate_category()")
+    op.execute("DROP TRIGGER IF EXISTS trg_transactions_effective_category ON transactions")
+    op.execute("DROP FUNCTION IF EXISTS transactions_set_effective_category()")
+    op.drop_column('transactions', 'effective_category_id')
@@ -0,0 +1,47 @@
+"""account data version
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 10:54:30.941680
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+# Statement-level triggers see the changed rows through transition tables, so a bulk
+# insert bumps each affected account once rather than once per row. A trigger may only
+# have transition tables for a single event, hence one trigger per event.
+TRIGGERS = {
+    'INSERT': 'REFERENCING NEW TABLE AS changed_rows',
+    'UPDATE': 'REFERENCING NEW TABLE AS changed_rows',
+    'DELETE': 'REFERENCING OLD TABLE AS changed_rows',
+}
+
+def upgrade():
+    op.add_column('accounts', sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+    op.execute("""
+        CREATE OR REPLACE FUNCTION accounts_bump_data_version()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            UPDATE accounts SET data_version = data_version + 1
+            WHERE id IN (SELECT DISTINCT account_id FROM changed_rows WHERE account_id IS NOT NULL);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for event, referencing in TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER trg_transactions_account_version_{event.lower()}
+            AFTER {event} ON transactions {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION accounts_bump_data_version()
+        """)
+
+def downgrade():
+    for event in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS trg_transactions_account_version_{event.lower()} ON transactions")
+    op.execute("DROP FUNCTION IF EXISTS accounts_bump_data_version()")
+    op.drop_column('accounts', 'data_version')
@@ -0,0 +1,141 @@
+"""partition transactions by date
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 10:59:01.295504
+"""
+import os
+from datetime import date, datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+COPY_BATCH_SIZE = 50000
+
+# Frozen copy of the partition layout in api/partitions.py at the time of this
+# revision, so later changes to that module don't change what this migration does
+TRANSACTION_PARTITION_INTERVAL = os.getenv("TRANSACTION_PARTITION_INTERVAL", "month")
+TRANSACTION_PARTITIONS_AHEAD = int(os.getenv("TRANSACTION_PARTITIONS_AHEAD", "3"))
+INTERVALS = ("month", "year")
+
+def period_start(day, interval):
+    return date(day.year, day.month, 1) if interval == "month" else date(day.year, 1, 1)
+
+def next_period(start, interval, count=1):
+    if interval == "year":
+        return date(start.year + count, 1, 1)
+    months = start.year * 12 + start.month - 1 + count
+    return date(months // 12, months % 12 + 1, 1)
+
+def _partition_name(start, interval):
+    if interval == "month":
+        return f"transactions_p{start.year:04d}_{start.month:02d}"
+    return f"transactions_p{start.year:04d}"
+
+def _create_partitions(first, last, interval):
+    """Partitions for the periods from first through last, plus the default partition.
+    The table is still empty, so no rows need to move."""
+    start = period_start(first, interval)
+    while start <= last:
+        end = next_period(start, interval)
+        op.execute(
+            f"CREATE TABLE {_partition_name(start, interval)} PARTITION OF transactions "
+            f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+        )
+        start = end
+    op.execute("CREATE TABLE transactions_default PARTITION OF transactions DEFAULT")
+
+FOREIGN_KEYS = [
+    ('transactions_user_id_fkey', 'users', 'user_id', 'CASCADE'),
+    ('transactions_account_id_fkey', 'accounts', 'account_id', 'CASCADE'),
+    ('transactions_custom_category_id_fkey', 'categories', 'custom_category_id', 'SET NULL'),
+    ('transactions_custom_subcategory_id_fkey', 'subcategories', 'custom_subcategory_id', 'SET NULL'),
+]
+
+DATA_VERSION_TRIGGERS = {
+    'INSERT': 'REFERENCING NEW TABLE AS changed_rows',
+    'UPDATE': 'REFERENCING NEW TABLE AS changed_rows',
+    'DELETE': 'REFERENCING OLD TABLE AS changed_rows',
+}
+
+def _rebuild(partition_by):
+    """Rename transactions to transactions_old and create an empty copy of its columns"""
+    # Keep the id sequence (and so the ids) when the old table is dropped
+    op.execute("ALTER SEQUENCE transactions_id_seq OWNED BY NONE")
+    op.execute("ALTER TABLE transactions RENAME TO transactions_old")
+    op.execute(f"CREATE TABLE transactions (LIKE transactions_old INCLUDING DEFAULTS INCLUDING CONSTRAINTS) {partition_by}")
+
+def _copy_rows():
+    """Copy transactions_old into the new table in id ranges, then drop it"""
+    connection = op.get_bind()
+    max_id = connection.execute(sa.text("SELECT COALESCE(MAX(id), 0) FROM transactions_old")).scalar()
+    for start in range(0, max_id + 1, COPY_BATCH_SIZE):
+        connection.execute(sa.text(
+            "INSERT INTO transactions SELECT * FROM transactions_old WHERE id >= :start AND id < :end"
+        ), {"start": start, "end": start + COPY_BATCH_SIZE})
+    op.execute("DROP TABLE transactions_old")
+    op.execute("ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id")
+
+def _create_constraints_and_triggers():
+    """Foreign keys, secondary indexes and the triggers from 0006 and 0008.
+
+    Indexes created on a partitioned table are created on every partition, current
+    and future.
+    """
+    for name, referent, column, ondelete in FOREIGN_KEYS:
+        op.create_foreign_key(name, 'transactions', referent, [column], ['id'], ondelete=ondelete)
+    op.create_index('ix_transactions_account_id', 'transactions', ['account_id'], unique=False)
+    op.create_index('ix_transactions_pending_transaction_id', 'transactions', ['pending_transaction_id'], unique=False)
+    op.create_index('ix_transactions_pending_lookup', 'transactions', ['user_id', 'account_id', 'date'], unique=False, postgresql_where=sa.text('pending = true'))
+    op.create_index('ix_transactions_user_date', 'transactions', ['user_id', 'date'], unique=False)
+    op.create_index('ix_transactions_user_effective_category_date', 'transactions', ['user_id', 'effective_category_id', 'date'], unique=False)
+
+    op.execute("""
+        CREATE TRIGGER trg_transactions_effective_category
+        BEFORE INSERT OR UPDATE OF custom_category_id, custom_subcategory_id ON transactions
+        FOR EACH ROW EXECUTE FUNCTION transactions_set_effective_category()
+    """)
+    for event, referencing in DATA_VERSION_TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER trg_transactions_account_version_{event.lower()}
+            AFTER {event} ON transactions {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION accounts_bump_data_version()
+        """)
+
+def upgrade():
+    interval = TRANSACTION_PARTITION_INTERVAL
+    if interval not in INTERVALS:
+        raise ValueError(f"TRANSACTION_PARTITION_INTERVAL must be one of {INTERVALS}, got {interval!r}")
+
+    _rebuild("PARTITION BY RANGE (date)")
+
+    # Partitions from the oldest transaction through the periods ahead; anything outside
+    # (e.g. a stray far-future date) goes to the default partition
+    connection = op.get_bind()
+    today = datetime.now(timezone.utc).date()
+    oldest = connection.execute(sa.text("SELECT MIN(date) FROM transactions_old")).scalar()
+    first = min(oldest.astimezone(timezone.utc).date(), today) if oldest else today
+    last = next_period(period_start(today, interval), interval, TRANSACTION_PARTITIONS_AHEAD)
+    _create_partitions(first, last, interval)
+
+    _copy_rows()
+
+    # The partition key must be part of every unique constraint
+    op.create_primary_key('transactions_pkey', 'transactions', ['id', 'date'])
+    op.create_unique_constraint('uq_transactions_plaid_transaction_id_date', 'transactions', ['plaid_transaction_id', 'date'])
+    _create_constraints_and_triggers()
+
+def downgrade():
+    # Partitions detached with `python -m api.partitions detach` are not copied back
+    _rebuild("")
+    _copy_rows()
+
+    op.create_primary_key('transactions_pkey', 'transactions', ['id'])
+    op.create_unique_constraint(op.f('transactions_plaid_transaction_id_key'), 'transactions', ['plaid_transaction_id'])
+    op.create_index(op.f('ix_transactions_id'), 'transactions', ['id'], unique=False)
+    _create_constraints_and_triggers()
@@ -0,0 +1,147 @@
+"""merchants
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19 11:05:59.992120
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Frozen copy of the merchant normalization in api/merchants.py at the time of this
+# revision, so later changes to it don't change what this migration does
+_PROCESSOR_PREFIX = re.compile(
+    r"^(?:(?:sq|tst|sp|py|pp|paypal|ic|cke|zettle|sumup)\s*\*|(?:pos(?: debit)?|debit card purchase|checkcard)\b)\s*",
+    re.IGNORECASE
+)
+_REFERENCE_SUFFIX = re.compile(r"\*\s*\w*\d\w*\s*$")
+_STORE_NUMBER = re.compile(r"#\s*\d+|\b(?:store|str|no\.?|loc)\s*\d+\b|\b\d{3,}\b", re.IGNORECASE)
+_NON_WORD = re.compile(r"[^\w&']+")
+
+def _clean_merchant_name(raw):
+    if not raw:
+        return None
+    name = raw.strip()
+    while True:
+        stripped = _PROCESSOR_PREFIX.sub("", name, count=1)
+        if stripped == name:
+            break
+        name = stripped
+    name = _REFERENCE_SUFFIX.sub("", name)
+    name = _STORE_NUMBER.sub(" ", name)
+    name = " ".join(_NON_WORD.sub(" ", name).split())
+    return name[:255] or None
+
+_BATCH_SQL = sa.text("""
+    SELECT id, merchant_name, name, plaid_transaction_id, merchant_entity_id, logo_url, website
+    FROM transactions
+    WHERE merchant_id IS NULL AND id > :after
+    ORDER BY id
+    LIMIT :limit
+""")
+
+# Merchants are shared by all users: details are taken only from Plaid rows, the first
+# non-empty value wins and is never overwritten
+_MERCHANTS_SQL = sa.text("""
+    INSERT INTO merchants AS m (normalized_name, display_name, merchant_entity_id, logo_url, website)
+    SELECT normalized_name, (array_agg(display_name ORDER BY position))[1],
+           (array_agg(merchant_entity_id ORDER BY position) FILTER (WHERE merchant_entity_id IS NOT NULL))[1],
+           (array_agg(logo_url ORDER BY position) FILTER (WHERE logo_url IS NOT NULL))[1],
+           (array_agg(website ORDER BY position) FILTER (WHERE website IS NOT NULL))[1]
+    FROM unnest(
+        CAST(:keys AS text[]), CAST(:display_names AS text[]), CAST(:entity_ids AS text[]),
+        CAST(:logo_urls AS text[]), CAST(:websites AS text[])
+    ) WITH ORDINALITY AS row(normalized_name, display_name, merchant_entity_id, logo_url, website, position)
+    GROUP BY normalized_name
+    ON CONFLICT (normalized_name) DO UPDATE SET
+        merchant_entity_id = COALESCE(m.merchant_entity_id, EXCLUDED.merchant_entity_id),
+        logo_url = COALESCE(m.logo_url, EXCLUDED.logo_url),
+        website = COALESCE(m.website, EXCLUDED.website)
+""")
+
+_ASSIGN_SQL = sa.text("""
+    UPDATE transactions AS t SET merchant_id = m.id
+    FROM unnest(CAST(:ids AS integer[]), CAST(:keys AS text[])) AS assigned(id, normalized_name)
+    JOIN merchants AS m ON m.normalized_name = assigned.normalized_name
+    WHERE t.id = assigned.id
+""")
+
+def _backfill_merchants():
+    """Create the merchants of the existing rows and point the rows at them, in id order and batches"""
+    connection = op.get_bind()
+    after = 0
+    while True:
+        rows = connection.execute(_BATCH_SQL, {"after": after, "limit": BACKFILL_BATCH_SIZE}).mappings().all()
+        if not rows:
+            return
+        after = rows[-1]["id"]
+        named = []
+        for row in rows:
+            display_name = _clean_merchant_name(row["merchant_name"] or row["name"])
+            if display_name is not None:
+                named.append((row, display_name))
+        if not named:
+            continue
+        details = [
+            (row["merchant_entity_id"], row["logo_url"], row["website"]) if row["plaid_transaction_id"] else (None, None, None)
+            for row, _ in named
+        ]
+        keys = [display_name.lower() for _, display_name in named]
+        connection.execute(_MERCHANTS_SQL, {
+            "keys": keys,
+            "display_names": [display_name for _, display_name in named],
+            "entity_ids": [entity_id for entity_id, _, _ in details],
+            "logo_urls": [logo_url for _, logo_url, _ in details],
+            "websites": [website for _, _, website in details],
+        })
+        connection.execute(_ASSIGN_SQL, {"ids": [row["id"] for row, _ in named], "keys": keys})
+
+def upgrade():
+    op.create_table('merchants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('normalized_name', sa.String(length=255), nullable=False),
+    sa.Column('display_name', sa.String(length=255), nullable=False),
+    sa.Column('merchant_entity_id', sa.String(length=255), nullable=True),
+    sa.Column('logo_url', sa.String(length=500), nullable=True),
+    sa.Column('website', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('normalized_name')
+    )
+    op.create_index(op.f('ix_merchants_merchant_entity_id'), 'merchants', ['merchant_entity_id'], unique=False)
+    op.add_column('transactions', sa.Column('merchant_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('transactions_merchant_id_fkey', 'transactions', 'merchants', ['merchant_id'], ['id'], ondelete='SET NULL')
+
+    # Create the merchants from the existing rows (with their entity id, logo and website)
+    # before those columns are dropped
+    _backfill_merchants()
+
+    op.create_index('ix_transactions_user_merchant_date', 'transactions', ['user_id', 'merchant_id', 'date'], unique=False)
+    op.drop_column('transactions', 'logo_url')
+    op.drop_column('transactions', 'website')
+    op.drop_column('transactions', 'merchant_entity_id')
+
+def downgrade():
+    op.add_column('transactions', sa.Column('merchant_entity_id', sa.VARCHAR(length=255), autoincrement=False, nullable=True))
+    op.add_column('transactions', sa.Column('website', sa.VARCHAR(length=500), autoincrement=False, nullable=True))
+    op.add_column('transactions', sa.Column('logo_url', sa.VARCHAR(length=500), autoincrement=False, nullable=True))
+    op.execute("""
+        UPDATE transactions AS t
+        SET merchant_entity_id = m.merchant_entity_id, logo_url = m.logo_url, website = m.website
+        FROM merchants AS m
+        WHERE m.id = t.merchant_id
+          AND (m.merchant_entity_id IS NOT NULL OR m.logo_url IS NOT NULL OR m.website IS NOT NULL)
+    """)
+    op.drop_constraint('transactions_merchant_id_fkey', 'transactions', type_='foreignkey')
+    op.drop_index('ix_transactions_user_merchant_date', table_name='transactions')
+    op.drop_column('transactions', 'merchant_id')
+    op.drop_index(op.f('ix_merchants_merchant_entity_id'), table_name='merchants')
+    op.drop_table('merchants')
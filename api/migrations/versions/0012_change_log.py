@@ -0,0 +1,193 @@
+"""change log
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19 11:13:43.276518
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+# Transactions are written in bulk (imports, purges, FK SET NULL actions), so they are
+# logged by statement-level triggers - one per event, as in 0008. The other tables
+# change a row at a time and use row-level triggers.
+TRANSACTION_TRIGGERS = {
+    'INSERT': 'REFERENCING NEW TABLE AS changed_rows',
+    'UPDATE': 'REFERENCING NEW TABLE AS changed_rows',
+    'DELETE': 'REFERENCING OLD TABLE AS changed_rows',
+}
+
+# Tables with id and user_id columns -> entity type in the change log
+OWNED_TABLES = {
+    'categories': 'categories',
+    'subcategories': 'subcategories',
+    'budget_templates': 'budgets',
+    'user_budget_settings': 'budget_settings',
+}
+
+def upgrade():
+    op.create_table('change_log',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('entity_type', sa.String(length=32), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.BigInteger(), nullable=False),
+    sa.Column('deleted', sa.Boolean(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'entity_type', 'entity_id')
+    )
+    op.create_index('ix_change_log_user_seq', 'change_log', ['user_id', 'seq'], unique=False)
+    op.add_column('users', sa.Column('change_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('sync_min_seq', sa.BigInteger(), server_default='0', nullable=False))
+
+    # Takes the next sequence number by updating the user's row, whose lock is held until
+    # commit: a user's writes commit in sequence order, so a reader that sees seq N has
+    # also seen every change before it. Users deleted in the same transaction (cascades)
+    # have no row left and nothing is logged.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION change_log_record(changed_user_id integer, changed_entity text, changed_ids integer[], is_deleted boolean)
+        RETURNS void AS $$
+        BEGIN
+            -- Archive moves (api/archive.py) switch logging off: the rows are still listed
+            IF changed_user_id IS NULL OR current_setting('app.change_log', true) = 'off' THEN
+                RETURN;
+            END IF;
+            WITH bumped AS (
+                UPDATE users SET change_seq = change_seq + 1 WHERE id = changed_user_id
+                RETURNING id, change_seq
+            )
+            INSERT INTO change_log (user_id, entity_type, entity_id, seq, deleted, changed_at)
+            SELECT bumped.id, changed_entity, ids.entity_id, bumped.change_seq, is_deleted, now()
+            FROM bumped, (SELECT DISTINCT unnest(changed_ids) AS entity_id) AS ids
+            ON CONFLICT (user_id, entity_type, entity_id) DO UPDATE
+            SET seq = EXCLUDED.seq, deleted = EXCLUDED.deleted, changed_at = EXCLUDED.changed_at;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION transactions_log_changes()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            changed record;
+        BEGIN
+            FOR changed IN
+                SELECT user_id, array_agg(id) AS ids FROM changed_rows GROUP BY user_id ORDER BY user_id
+            LOOP
+                PERFORM change_log_record(changed.user_id, 'transactions', changed.ids, TG_OP = 'DELETE');
+            END LOOP;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION owned_rows_log_change()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM change_log_record(OLD.user_id, TG_ARGV[0], ARRAY[OLD.id], true);
+            ELSE
+                PERFORM change_log_record(NEW.user_id, TG_ARGV[0], ARRAY[NEW.id], false);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # An entry change is a change to its budget; a budget's own deletion is logged by its
+    # trigger (the cascaded entry deletes no longer find the budget)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION budget_entries_log_change()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            changed_template_id integer;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                changed_template_id := OLD.template_id;
+            ELSE
+                changed_template_id := NEW.template_id;
+            END IF;
+            PERFORM change_log_record(t.user_id, 'budgets', ARRAY[t.id], false)
+            FROM budget_templates AS t WHERE t.id = changed_template_id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # Accounts are logged for every member: joining or leaving an account is a change
+    # (or a tombstone) for that member, including the cascade when the account is deleted
+    op.execute("""
+        CREATE OR REPLACE FUNCTION user_accounts_log_change()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM change_log_record(OLD.user_id, 'accounts', ARRAY[OLD.account_id], true);
+            ELSE
+                PERFORM change_log_record(NEW.user_id, 'accounts', ARRAY[NEW.account_id], false);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION accounts_log_change()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            PERFORM change_log_record(m.user_id, 'accounts', ARRAY[NEW.id], false)
+            FROM user_accounts AS m WHERE m.account_id = NEW.id;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+
+    for event, referencing in TRANSACTION_TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER trg_transactions_change_log_{event.lower()}
+            AFTER {event} ON transactions {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION transactions_log_changes()
+        """)
+    for table, entity in OWNED_TABLES.items():
+        op.execute(f"""
+            CREATE TRIGGER trg_{table}_change_log
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION owned_rows_log_change('{entity}')
+        """)
+    op.execute("""
+        CREATE TRIGGER trg_budget_template_entries_change_log
+        AFTER INSERT OR UPDATE OR DELETE ON budget_template_entries
+        FOR EACH ROW EXECUTE FUNCTION budget_entries_log_change()
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_user_accounts_change_log
+        AFTER INSERT OR DELETE ON user_accounts
+        FOR EACH ROW EXECUTE FUNCTION user_accounts_log_change()
+    """)
+    # Every transaction write bumps data_version (0008); that alone is not an account change
+    op.execute("""
+        CREATE TRIGGER trg_accounts_change_log
+        AFTER UPDATE ON accounts
+        FOR EACH ROW
+        WHEN ((to_jsonb(OLD) - 'data_version') IS DISTINCT FROM (to_jsonb(NEW) - 'data_version'))
+        EXECUTE FUNCTION accounts_log_change()
+    """)
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS trg_accounts_change_log ON accounts")
+    op.execute("DROP TRIGGER IF EXISTS trg_user_accounts_change_log ON user_accounts")
+    op.execute("DROP TRIGGER IF EXISTS trg_budget_template_entries_change_log ON budget_template_entries")
+    for table in OWNED_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS trg_{table}_change_log ON {table}")
+    for event in TRANSACTION_TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS trg_transactions_change_log_{event.lower()} ON transactions")
+    for function in (
+        'accounts_log_change', 'user_accounts_log_change', 'budget_entries_log_change',
+        'owned_rows_log_change', 'transactions_log_changes'
+    ):
+        op.execute(f"DROP FUNCTION IF EXISTS {function}()")
+    op.execute("DROP FUNCTION IF EXISTS change_log_record(integer, text, integer[], boolean)")
+
+    op.drop_column('users', 'sync_min_seq')
+    op.drop_column('users', 'change_seq')
+    op.drop_index('ix_change_log_user_seq', table_name='change_log')
+    op.drop_table('change_log')
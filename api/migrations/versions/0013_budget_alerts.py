@@ -0,0 +1,183 @@
+"""budget alerts
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19 11:19:33.984669
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+# One trigger per event, as in 0008/0012; UPDATE needs both transition tables to
+# subtract the old contribution and add the new one
+TRIGGERS = {
+    'INSERT': 'REFERENCING NEW TABLE AS new_rows',
+    'UPDATE': 'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'DELETE': 'REFERENCING OLD TABLE AS old_rows',
+}
+
+# A transition table's expense contributions, as the summary endpoint counts them
+_CONTRIBUTIONS = """
+    SELECT user_id, CAST(date_trunc('month', date AT TIME ZONE 'UTC') AS date) AS month,
+           effective_category_id AS category_id, custom_subcategory_id AS subcategory_id, {sign}amount AS amount
+    FROM {rows}
+    WHERE amount < 0 AND effective_category_id IS NOT NULL
+"""
+
+def _deltas(*parts):
+    """Statement collecting the net spend change per key into the deltas variable"""
+    union = " UNION ALL ".join(_CONTRIBUTIONS.format(rows=rows, sign=sign) for rows, sign in parts)
+    return f"""
+        SELECT array_agg(ROW(user_id, month, category_id, subcategory_id, total)::budget_spend_delta) INTO deltas
+        FROM (
+            SELECT user_id, month, category_id, subcategory_id, SUM(amount) AS total
+            FROM ({union}) AS contributions
+            GROUP BY user_id, month, category_id, subcategory_id
+            HAVING SUM(amount) <> 0
+        ) AS grouped;
+    """
+
+def upgrade():
+    op.create_table('budget_spend',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('subcategory_id', sa.Integer(), nullable=True),
+    sa.Column('spent', sa.DECIMAL(precision=15, scale=2), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'month', 'category_id', 'subcategory_id', name='uq_budget_spend', postgresql_nulls_not_distinct=True)
+    )
+    op.create_table('budget_alerts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('template_id', sa.Integer(), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('subcategory_id', sa.Integer(), nullable=True),
+    sa.Column('threshold', sa.Integer(), nullable=False),
+    sa.Column('budgeted_amount', sa.DECIMAL(precision=15, scale=2), nullable=False),
+    sa.Column('spent', sa.DECIMAL(precision=15, scale=2), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('notified_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['template_id'], ['budget_templates.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'month', 'category_id', 'subcategory_id', 'threshold', name='uq_budget_alert', postgresql_nulls_not_distinct=True)
+    )
+    op.create_index('ix_budget_alerts_undelivered', 'budget_alerts', ['user_id'], unique=False, postgresql_where=sa.text('notified_at IS NULL'))
+    op.add_column('user_budget_settings', sa.Column('alert_thresholds', sa.ARRAY(sa.Integer()), server_default='{80,100}', nullable=False))
+
+    op.execute("""
+        INSERT INTO budget_spend (user_id, month, category_id, subcategory_id, spent)
+        SELECT user_id, CAST(date_trunc('month', date AT TIME ZONE 'UTC') AS date),
+               effective_category_id, custom_subcategory_id, SUM(-amount)
+        FROM transactions
+        WHERE amount < 0 AND effective_category_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """)
+
+    op.execute("CREATE TYPE budget_spend_delta AS (user_id integer, month date, category_id integer, subcategory_id integer, amount numeric)")
+    # Adds the deltas to the running totals, then checks the budget entries they touch in
+    # the current month against the user's thresholds. Each check is a handful of index
+    # lookups however many transactions the month has; the unique constraint dedupes.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION budget_spend_apply(deltas budget_spend_delta[])
+        RETURNS void AS $$
+        DECLARE
+            current_month date := CAST(date_trunc('month', now() AT TIME ZONE 'UTC') AS date);
+        BEGIN
+            IF deltas IS NULL THEN
+                RETURN;
+            END IF;
+            INSERT INTO budget_spend (user_id, month, category_id, subcategory_id, spent)
+            SELECT user_id, month, category_id, subcategory_id, amount FROM unnest(deltas)
+            ON CONFLICT ON CONSTRAINT uq_budget_spend DO UPDATE SET spent = budget_spend.spent + EXCLUDED.spent;
+
+            WITH touched AS (
+                SELECT DISTINCT user_id, category_id, subcategory_id
+                FROM unnest(deltas)
+                WHERE month = current_month AND amount > 0
+            ), entries AS (
+                SELECT DISTINCT touched.user_id, template.id AS template_id, entry.category_id, entry.subcategory_id, entry.budgeted_amount
+                FROM touched
+                CROSS JOIN LATERAL (
+                    -- The month's own budget, else the default one
+                    SELECT bt.id FROM budget_templates AS bt
+                    WHERE bt.user_id = touched.user_id
+                      AND ((bt.year = EXTRACT(YEAR FROM current_month) AND bt.month = EXTRACT(MONTH FROM current_month)) OR bt.is_default)
+                    ORDER BY (bt.year = EXTRACT(YEAR FROM current_month) AND bt.month = EXTRACT(MONTH FROM current_month)) DESC
+                    LIMIT 1
+                ) AS template
+                JOIN budget_template_entries AS entry ON entry.template_id = template.id AND (
+                    entry.subcategory_id = touched.subcategory_id
+                    OR (entry.subcategory_id IS NULL AND entry.category_id = touched.category_id)
+                )
+                WHERE entry.budgeted_amount > 0
+            ), spending AS (
+                SELECT entries.*, (
+                    SELECT COALESCE(SUM(spend.spent), 0) FROM budget_spend AS spend
+                    WHERE spend.user_id = entries.user_id AND spend.month = current_month
+                      AND CASE WHEN entries.subcategory_id IS NOT NULL
+                               THEN spend.subcategory_id = entries.subcategory_id
+                               ELSE spend.category_id = entries.category_id END
+                ) AS spent
+                FROM entries
+            )
+            INSERT INTO budget_alerts (user_id, month, template_id, category_id, subcategory_id, threshold, budgeted_amount, spent)
+            SELECT spending.user_id, current_month, spending.template_id, spending.category_id, spending.subcategory_id,
+                   threshold, spending.budgeted_amount, spending.spent
+            FROM spending
+            CROSS JOIN LATERAL unnest(COALESCE(
+                (SELECT alert_thresholds FROM user_budget_settings WHERE user_id = spending.user_id),
+                ARRAY[80, 100]
+            )) AS threshold
+            WHERE spending.spent * 100 >= spending.budgeted_amount * threshold
+            ON CONFLICT ON CONSTRAINT uq_budget_alert DO NOTHING;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION transactions_track_budget_spend()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            deltas budget_spend_delta[];
+        BEGIN
+            -- Archive moves don't change what was spent
+            IF current_setting('app.change_log', true) = 'off' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' THEN
+                {_deltas(('new_rows', '-'))}
+            ELSIF TG_OP = 'UPDATE' THEN
+                {_deltas(('new_rows', '-'), ('old_rows', ''))}
+            ELSE
+                {_deltas(('old_rows', ''))}
+            END IF;
+            PERFORM budget_spend_apply(deltas);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for event, referencing in TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER trg_transactions_budget_spend_{event.lower()}
+            AFTER {event} ON transactions {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION transactions_track_budget_spend()
+        """)
+
+def downgrade():
+    for event in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS trg_transactions_budget_spend_{event.lower()} ON transactions")
+    op.execute("DROP FUNCTION IF EXISTS transactions_track_budget_spend()")
+    op.execute("DROP FUNCTION IF EXISTS budget_spend_apply(budget_spend_delta[])")
+    op.execute("DROP TYPE IF EXISTS budget_spend_delta")
+    op.drop_column('user_budget_settings', 'alert_thresholds')
+    op.drop_index('ix_budget_alerts_undelivered', table_name='budget_alerts')
+    op.drop_table('budget_alerts')
+    op.drop_table('budget_spend')
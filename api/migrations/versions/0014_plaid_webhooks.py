@@ -0,0 +1,68 @@
+"""plaid webhooks
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19 11:24:17.590975
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('plaid_items',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.String(length=255), nullable=False),
+    sa.Column('access_token', sa.String(length=255), nullable=False),
+    sa.Column('institution_id', sa.String(length=255), nullable=True),
+    sa.Column('institution_name', sa.String(length=255), nullable=True),
+    sa.Column('webhook_url', sa.String(length=500), nullable=True),
+    sa.Column('available_products', sa.ARRAY(sa.String()), nullable=True),
+    sa.Column('billed_products', sa.ARRAY(sa.String()), nullable=True),
+    sa.Column('transactions_cursor', sa.Text(), nullable=True),
+    sa.Column('error_code', sa.String(length=100), nullable=True),
+    sa.Column('last_synced_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('item_id')
+    )
+    op.create_index(op.f('ix_plaid_items_id'), 'plaid_items', ['id'], unique=False)
+    op.create_index(op.f('ix_plaid_items_user_id'), 'plaid_items', ['user_id'], unique=False)
+    op.create_table('plaid_sync_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('plaid_item_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('webhook_code', sa.String(length=50), nullable=True),
+    sa.Column('webhook_count', sa.Integer(), nullable=False),
+    sa.Column('added', sa.Integer(), nullable=False),
+    sa.Column('modified', sa.Integer(), nullable=False),
+    sa.Column('removed', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['plaid_item_id'], ['plaid_items.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_plaid_sync_jobs_id'), 'plaid_sync_jobs', ['id'], unique=False)
+    op.create_index('ix_plaid_sync_jobs_item_status', 'plaid_sync_jobs', ['plaid_item_id', 'status'], unique=False)
+    op.create_index('uq_plaid_sync_jobs_pending', 'plaid_sync_jobs', ['plaid_item_id'], unique=True, postgresql_where=sa.text("status = 'pending'"))
+    op.add_column('accounts', sa.Column('plaid_account_id', sa.String(length=255), nullable=True))
+    op.create_unique_constraint('accounts_plaid_account_id_key', 'accounts', ['plaid_account_id'])
+
+def downgrade():
+    op.drop_constraint('accounts_plaid_account_id_key', 'accounts', type_='unique')
+    op.drop_column('accounts', 'plaid_account_id')
+    op.drop_index('uq_plaid_sync_jobs_pending', table_name='plaid_sync_jobs', postgresql_where=sa.text("status = 'pending'"))
+    op.drop_index('ix_plaid_sync_jobs_item_status', table_name='plaid_sync_jobs')
+    op.drop_index(op.f('ix_plaid_sync_jobs_id'), table_name='plaid_sync_jobs')
+    op.drop_table('plaid_sync_jobs')
+    op.drop_index(op.f('ix_plaid_items_user_id'), table_name='plaid_items')
+    op.drop_index(op.f('ix_plaid_items_id'), table_name='plaid_items')
+    op.drop_table('plaid_items')
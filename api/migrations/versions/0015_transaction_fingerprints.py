@@ -0,0 +1,92 @@
+"""transaction fingerprints
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-19 11:38:16.295870
+"""
+import hashlib
+import re
+from datetime import timezone
+from decimal import Decimal
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Frozen copy of the fingerprint in api/duplicates.py and the merchant normalization in
+# api/merchants.py at the time of this revision, so later changes to them don't change
+# what this migration does
+_PROCESSOR_PREFIX = re.compile(
+    r"^(?:(?:sq|tst|sp|py|pp|paypal|ic|cke|zettle|sumup)\s*\*|(?:pos(?: debit)?|debit card purchase|checkcard)\b)\s*",
+    re.IGNORECASE
+)
+_REFERENCE_SUFFIX = re.compile(r"\*\s*\w*\d\w*\s*$")
+_STORE_NUMBER = re.compile(r"#\s*\d+|\b(?:store|str|no\.?|loc)\s*\d+\b|\b\d{3,}\b", re.IGNORECASE)
+_NON_WORD = re.compile(r"[^\w&']+")
+
+def _name_key(merchant_name, name):
+    source = merchant_name or name
+    if not source:
+        return ""
+    cleaned = source.strip()
+    while True:
+        stripped = _PROCESSOR_PREFIX.sub("", cleaned, count=1)
+        if stripped == cleaned:
+            break
+        cleaned = stripped
+    cleaned = _REFERENCE_SUFFIX.sub("", cleaned)
+    cleaned = _STORE_NUMBER.sub(" ", cleaned)
+    cleaned = " ".join(_NON_WORD.sub(" ", cleaned).split())[:255]
+    return cleaned.lower() or source.strip().lower()
+
+def _fingerprint(row):
+    day = row["date"].astimezone(timezone.utc).date()
+    key = f"{row['account_id'] or ''}|{day.isoformat()}|{Decimal(str(row['amount'])):.2f}|{_name_key(row['merchant_name'], row['name'])}"
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+_BATCH_SQL = sa.text("""
+    SELECT id, account_id, date, amount, name, merchant_name
+    FROM transactions
+    WHERE fingerprint IS NULL AND id > :after
+    ORDER BY id
+    LIMIT :limit
+""")
+
+_ASSIGN_SQL = sa.text("""
+    UPDATE transactions AS t SET fingerprint = assigned.fingerprint
+    FROM unnest(CAST(:ids AS integer[]), CAST(:fingerprints AS bytea[])) AS assigned(id, fingerprint)
+    WHERE t.id = assigned.id
+""")
+
+def _backfill_fingerprints():
+    connection = op.get_bind()
+    # A fingerprint isn't a change clients sync or a change in spending
+    previous = connection.execute(sa.text("SELECT current_setting('app.change_log', true)")).scalar() or ""
+    connection.execute(sa.text("SELECT set_config('app.change_log', 'off', true)"))
+    after = 0
+    while True:
+        rows = connection.execute(_BATCH_SQL, {"after": after, "limit": BACKFILL_BATCH_SIZE}).mappings().all()
+        if not rows:
+            break
+        after = rows[-1]["id"]
+        connection.execute(_ASSIGN_SQL, {
+            "ids": [row["id"] for row in rows],
+            "fingerprints": [_fingerprint(row) for row in rows],
+        })
+    connection.execute(sa.text("SELECT set_config('app.change_log', :previous, true)"), {"previous": previous})
+
+def upgrade():
+    op.add_column('transactions', sa.Column('fingerprint', sa.LargeBinary(), nullable=True))
+    # Fill in before indexing: one index build instead of an index update per row
+    _backfill_fingerprints()
+    op.create_index('ix_transactions_user_fingerprint', 'transactions', ['user_id', 'fingerprint'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_transactions_user_fingerprint', table_name='transactions')
+    op.drop_column('transactions', 'fingerprint')
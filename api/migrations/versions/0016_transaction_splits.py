@@ -0,0 +1,230 @@
+"""transaction splits
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19 11:45:07.148985
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+# One trigger per event, as in 0008/0012/0013
+TRIGGERS = {
+    'INSERT': 'REFERENCING NEW TABLE AS new_rows',
+    'UPDATE': 'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'DELETE': 'REFERENCING OLD TABLE AS old_rows',
+}
+
+# Expense contributions of a transition table to budget_spend (see 0013). A transaction
+# contributes the part of its amount not split off; its splits contribute themselves.
+_TRANSACTION_CONTRIBUTIONS = """
+    SELECT user_id, CAST(date_trunc('month', date AT TIME ZONE 'UTC') AS date) AS month,
+           effective_category_id AS category_id, custom_subcategory_id AS subcategory_id, {sign}({amount}) AS amount
+    FROM {rows}
+    WHERE {amount} < 0 AND effective_category_id IS NOT NULL
+"""
+_SPLIT_CONTRIBUTIONS = """
+    SELECT user_id, CAST(date_trunc('month', transaction_date AT TIME ZONE 'UTC') AS date) AS month,
+           effective_category_id AS category_id, custom_subcategory_id AS subcategory_id, {sign}({amount}) AS amount
+    FROM {rows}
+    WHERE {amount} < 0 AND effective_category_id IS NOT NULL
+"""
+
+def _deltas(contributions, amount, *parts):
+    """Statement collecting the net spend change per key into the deltas variable"""
+    union = " UNION ALL ".join(contributions.format(rows=rows, sign=sign, amount=amount) for rows, sign in parts)
+    return f"""
+        SELECT array_agg(ROW(user_id, month, category_id, subcategory_id, total)::budget_spend_delta) INTO deltas
+        FROM (
+            SELECT user_id, month, category_id, subcategory_id, SUM(amount) AS total
+            FROM ({union}) AS contributions
+            GROUP BY user_id, month, category_id, subcategory_id
+            HAVING SUM(amount) <> 0
+        ) AS grouped;
+    """
+
+def _track_function(name, contributions, amount, prologue=""):
+    return f"""
+        CREATE OR REPLACE FUNCTION {name}()
+        RETURNS TRIGGER AS $$
+        DECLARE
+            deltas budget_spend_delta[];
+        BEGIN
+            {prologue}
+            -- Archive moves don't change what was spent
+            IF current_setting('app.change_log', true) = 'off' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP = 'INSERT' THEN
+                {_deltas(contributions, amount, ('new_rows', '-'))}
+            ELSIF TG_OP = 'UPDATE' THEN
+                {_deltas(contributions, amount, ('new_rows', '-'), ('old_rows', ''))}
+            ELSE
+                {_deltas(contributions, amount, ('old_rows', ''))}
+            END IF;
+            PERFORM budget_spend_apply(deltas);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+
+# Recompute split_amount of the transactions whose splits changed. It touches them even
+# when the sum stays the same, so the change reaches the change log and data_version.
+_SPLIT_AMOUNTS = """
+    UPDATE transactions AS t
+    SET split_amount = (SELECT SUM(s.amount) FROM transaction_splits AS s WHERE s.transaction_id = t.id)
+    FROM (
+        {changed}
+    ) AS changed
+    WHERE t.id = changed.transaction_id AND t.date = changed.transaction_date;
+"""
+
+def _split_amounts():
+    changed = {
+        'INSERT': "SELECT DISTINCT transaction_id, transaction_date FROM new_rows",
+        'UPDATE': "SELECT transaction_id, transaction_date FROM new_rows UNION SELECT transaction_id, transaction_date FROM old_rows",
+        'DELETE': "SELECT DISTINCT transaction_id, transaction_date FROM old_rows",
+    }
+    return f"""
+            IF TG_OP = 'INSERT' THEN
+                {_SPLIT_AMOUNTS.format(changed=changed['INSERT'])}
+            ELSIF TG_OP = 'UPDATE' THEN
+                {_SPLIT_AMOUNTS.format(changed=changed['UPDATE'])}
+            ELSE
+                {_SPLIT_AMOUNTS.format(changed=changed['DELETE'])}
+            END IF;
+    """
+
+_PROPAGATE_CATEGORY = """
+    CREATE OR REPLACE FUNCTION subcategories_propagate_category()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE transactions
+        SET effective_category_id = NEW.category_id
+        WHERE custom_subcategory_id = NEW.id AND custom_category_id IS NULL;{splits}
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+def upgrade():
+    op.create_table('transaction_splits',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('transaction_id', sa.Integer(), nullable=False),
+    sa.Column('transaction_date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('amount', sa.DECIMAL(precision=15, scale=2), nullable=False),
+    sa.Column('custom_category_id', sa.Integer(), nullable=True),
+    sa.Column('custom_subcategory_id', sa.Integer(), nullable=True),
+    sa.Column('effective_category_id', sa.Integer(), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['custom_category_id'], ['categories.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['custom_subcategory_id'], ['subcategories.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_transaction_splits_transaction_id'), 'transaction_splits', ['transaction_id'], unique=False)
+    op.create_index('ix_transaction_splits_user_date', 'transaction_splits', ['user_id', 'transaction_date'], unique=False)
+    op.add_column('transactions', sa.Column('split_amount', sa.DECIMAL(precision=15, scale=2), nullable=True))
+
+    # Splits resolve their category like transactions do (0006)
+    op.execute("""
+        CREATE TRIGGER trg_transaction_splits_effective_category
+        BEFORE INSERT OR UPDATE OF custom_category_id, custom_subcategory_id ON transaction_splits
+        FOR EACH ROW EXECUTE FUNCTION transactions_set_effective_category()
+    """)
+    op.execute(_PROPAGATE_CATEGORY.format(splits="""
+        UPDATE transaction_splits
+        SET effective_category_id = NEW.category_id
+        WHERE custom_subcategory_id = NEW.id AND custom_category_id IS NULL;"""))
+
+    # Splits follow their transaction: deleted with it, moved with its date. Partition
+    # maintenance writes to the partitions directly and leaves them alone.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION transactions_cascade_splits()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                IF EXISTS (SELECT 1 FROM old_rows WHERE split_amount IS NOT NULL) THEN
+                    DELETE FROM transaction_splits AS s
+                    USING old_rows AS o
+                    WHERE o.split_amount IS NOT NULL AND s.transaction_id = o.id;
+                END IF;
+            ELSIF EXISTS (SELECT 1 FROM new_rows WHERE split_amount IS NOT NULL) THEN
+                UPDATE transaction_splits AS s SET transaction_date = n.date
+                FROM new_rows AS n
+                JOIN old_rows AS o ON o.id = n.id
+                WHERE n.split_amount IS NOT NULL AND o.date <> n.date AND s.transaction_id = n.id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for event in ('UPDATE', 'DELETE'):
+        op.execute(f"""
+            CREATE TRIGGER trg_transactions_cascade_splits_{event.lower()}
+            AFTER {event} ON transactions {TRIGGERS[event]}
+            FOR EACH STATEMENT EXECUTE FUNCTION transactions_cascade_splits()
+        """)
+
+    # budget_spend counts each transaction's unsplit remainder and each split on its own
+    op.execute(_track_function(
+        'transactions_track_budget_spend', _TRANSACTION_CONTRIBUTIONS, 'amount - COALESCE(split_amount, 0)'
+    ))
+    op.execute(_track_function(
+        'transaction_splits_changed', _SPLIT_CONTRIBUTIONS, 'amount', prologue=_split_amounts()
+    ))
+    for event, referencing in TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER trg_transaction_splits_changed_{event.lower()}
+            AFTER {event} ON transaction_splits {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION transaction_splits_changed()
+        """)
+
+    # What aggregations group over: unsplit transactions, the remainders of split ones
+    # and the splits, each with its own category and amount
+    op.execute("""
+        CREATE VIEW transaction_allocations AS
+        SELECT t.id AS transaction_id, CAST(NULL AS integer) AS split_id, t.user_id, t.account_id, t.date, t.pending,
+               t.effective_category_id AS category_id, t.custom_subcategory_id AS subcategory_id,
+               t.amount - COALESCE(t.split_amount, 0) AS amount
+        FROM transactions AS t
+        WHERE t.split_amount IS NULL OR t.split_amount <> t.amount
+        UNION ALL
+        SELECT t.id, s.id, t.user_id, t.account_id, t.date, t.pending,
+               s.effective_category_id, s.custom_subcategory_id, s.amount
+        FROM transaction_splits AS s
+        JOIN transactions AS t ON t.id = s.transaction_id AND t.date = s.transaction_date AND t.user_id = s.user_id
+    """)
+
+def downgrade():
+    op.execute("DROP VIEW IF EXISTS transaction_allocations")
+    for event in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS trg_transaction_splits_changed_{event.lower()} ON transaction_splits")
+    op.execute("DROP FUNCTION IF EXISTS transaction_splits_changed()")
+    op.execute(_track_function('transactions_track_budget_spend', _TRANSACTION_CONTRIBUTIONS, 'amount'))
+    for event in ('UPDATE', 'DELETE'):
+        op.execute(f"DROP TRIGGER IF EXISTS trg_transactions_cascade_splits_{event.lower()} ON transactions")
+    op.execute("DROP FUNCTION IF EXISTS transactions_cascade_splits()")
+    op.execute(_PROPAGATE_CATEGORY.format(splits=""))
+    op.execute("DROP TRIGGER IF EXISTS trg_transaction_splits_effective_category ON transaction_splits")
+
+    # Splitting moved spending between categories; recount it from whole transactions
+    op.execute("DELETE FROM budget_spend")
+    op.execute("""
+        INSERT INTO budget_spend (user_id, month, category_id, subcategory_id, spent)
+        SELECT user_id, CAST(date_trunc('month', date AT TIME ZONE 'UTC') AS date),
+               effective_category_id, custom_subcategory_id, SUM(-amount)
+        FROM transactions
+        WHERE amount < 0 AND effective_category_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """)
+    op.drop_column('transactions', 'split_amount')
+    op.drop_index('ix_transaction_splits_user_date', table_name='transaction_splits')
+    op.drop_index(op.f('ix_transaction_splits_transaction_id'), table_name='transaction_splits')
+    op.drop_table('transaction_splits')
@@ -0,0 +1,119 @@
+"""plaid transaction ids
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-19 12:13:12.626649
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0017'
+down_revision = '0016'
+branch_labels = None
+depends_on = None
+
+# One trigger per event, as in 0008/0012/0013
+TRIGGERS = {
+    'INSERT': 'REFERENCING NEW TABLE AS new_rows',
+    'UPDATE': 'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'DELETE': 'REFERENCING OLD TABLE AS old_rows',
+}
+
+# Rows of new_rows claiming a Plaid id, and for updates only those whose Plaid id or
+# date changed
+_CLAIMED = {
+    'INSERT': "SELECT plaid_transaction_id, id, date, user_id FROM new_rows WHERE plaid_transaction_id IS NOT NULL",
+    'UPDATE': """
+        SELECT n.plaid_transaction_id, n.id, n.date, n.user_id
+        FROM new_rows AS n
+        JOIN old_rows AS o ON o.id = n.id
+        WHERE n.plaid_transaction_id IS NOT NULL
+          AND (n.plaid_transaction_id IS DISTINCT FROM o.plaid_transaction_id OR n.date <> o.date)
+    """,
+}
+
+def _claim(claimed):
+    """Map the claimed Plaid ids to their transactions, failing when one belongs to another.
+    A transaction re-inserted by partition maintenance or an archive restore keeps its own."""
+    return f"""
+        IF EXISTS (
+            SELECT 1 FROM ({claimed}) AS claimed
+            GROUP BY plaid_transaction_id HAVING COUNT(*) > 1
+        ) THEN
+            RAISE EXCEPTION 'duplicate Plaid transaction id' USING ERRCODE = 'unique_violation';
+        END IF;
+        INSERT INTO plaid_transaction_ids (plaid_transaction_id, transaction_id, transaction_date, user_id)
+        SELECT * FROM ({claimed}) AS claimed
+        ON CONFLICT (plaid_transaction_id) DO UPDATE SET transaction_date = EXCLUDED.transaction_date
+        WHERE plaid_transaction_ids.transaction_id = EXCLUDED.transaction_id;
+        -- Checked afterwards so a concurrent claim committed meanwhile is seen too
+        IF EXISTS (
+            SELECT 1
+            FROM ({claimed}) AS claimed
+            JOIN plaid_transaction_ids AS p USING (plaid_transaction_id)
+            WHERE p.transaction_id <> claimed.id
+        ) THEN
+            RAISE EXCEPTION 'duplicate Plaid transaction id' USING ERRCODE = 'unique_violation';
+        END IF;
+    """
+
+def upgrade():
+    op.create_table('plaid_transaction_ids',
+    sa.Column('plaid_transaction_id', sa.String(length=255), nullable=False),
+    sa.Column('transaction_id', sa.Integer(), nullable=False),
+    sa.Column('transaction_date', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('plaid_transaction_id')
+    )
+    op.create_index(op.f('ix_plaid_transaction_ids_transaction_id'), 'plaid_transaction_ids', ['transaction_id'], unique=False)
+    op.create_index(op.f('ix_plaid_transaction_ids_user_id'), 'plaid_transaction_ids', ['user_id'], unique=False)
+
+    # Ids stored twice before this (on different dates) stay with the first transaction;
+    # the later copies are left for the user to delete
+    op.execute("""
+        INSERT INTO plaid_transaction_ids (plaid_transaction_id, transaction_id, transaction_date, user_id)
+        SELECT DISTINCT ON (plaid_transaction_id) plaid_transaction_id, id, date, user_id
+        FROM transactions
+        WHERE plaid_transaction_id IS NOT NULL
+        ORDER BY plaid_transaction_id, id
+    """)
+
+    # Archived transactions give their ids up and take them back when restored. Partition
+    # maintenance deletes from the partitions directly, so a moved row keeps its id.
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION transactions_claim_plaid_ids()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                {_claim(_CLAIMED['INSERT'])}
+            ELSIF TG_OP = 'UPDATE' THEN
+                DELETE FROM plaid_transaction_ids AS p
+                USING new_rows AS n
+                JOIN old_rows AS o ON o.id = n.id
+                WHERE p.transaction_id = o.id AND p.plaid_transaction_id = o.plaid_transaction_id
+                  AND o.plaid_transaction_id IS DISTINCT FROM n.plaid_transaction_id;
+                {_claim(_CLAIMED['UPDATE'])}
+            ELSE
+                DELETE FROM plaid_transaction_ids AS p
+                USING old_rows AS o
+                WHERE p.plaid_transaction_id = o.plaid_transaction_id AND p.transaction_id = o.id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for event, referencing in TRIGGERS.items():
+        op.execute(f"""
+            CREATE TRIGGER trg_transactions_claim_plaid_ids_{event.lower()}
+            AFTER {event} ON transactions {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION transactions_claim_plaid_ids()
+        """)
+
+def downgrade():
+    for event in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS trg_transactions_claim_plaid_ids_{event.lower()} ON transactions")
+    op.execute("DROP FUNCTION IF EXISTS transactions_claim_plaid_ids()")
+    op.drop_index(op.f('ix_plaid_transaction_ids_user_id'), table_name='plaid_transaction_ids')
+    op.drop_index(op.f('ix_plaid_transaction_ids_transaction_id'), table_name='plaid_transaction_ids')
+    op.drop_table('plaid_transaction_ids')
@@ -58,7 +58,7 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
       }
 
       if (data?.access_token) {
-        apiClient.setToken(data.access_token)
+        apiClient.setToken(data.access_token, data.refresh_token)
         const userData = await apiClient.get<UserResponse>("/me")
         if (userData.error || userData.status !== 200 || !userData.data) {
           return { error: userData.error || "Failed to retrieve current user" }
@@ -93,7 +93,7 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
       })
       const authData = await apiClient.post<LoginResponse>(`/auth/login?${params.toString()}`)
       if (authData.data?.access_token){
-        apiClient.setToken(authData.data.access_token)
+        apiClient.setToken(authData.data.access_token, authData.data.refresh_token)
         setIsAuthenticated(true)
       }
 
@@ -109,6 +109,11 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   }
 
   const logout = () => {
+    const refreshToken = apiClient.getRefreshToken()
+    if (refreshToken) {
+      // Fire and forget - revoke the refresh token server-side
+      apiClient.post("/auth/logout", { refresh_token: refreshToken })
+    }
     apiClient.clearToken()
     setUser(null)
     setIsAuthenticated(false)
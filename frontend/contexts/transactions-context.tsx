@@ -43,14 +43,15 @@ export function TransactionsProvider({ children }: { children: React.ReactNode }
     setError(undefined)
 
     try {
-      const params = new URLSearchParams()
+      // Opt into the server's fast (orjson) response path
+      const params = new URLSearchParams({ fast: "true" })
       if (filters?.account_id) params.append("account_id", filters.account_id.toString())
       if (filters?.start_date) params.append("start_date", filters.start_date)
       if (filters?.end_date) params.append("end_date", filters.end_date)
       if (filters?.category_id) params.append("category_id", filters.category_id.toString())
       if (filters?.subcategory_id) params.append("subcategory_id", filters.subcategory_id.toString())
 
-      const endpoint = `/transactions/${params.toString() ? `?${params.toString()}` : ""}`
+      const endpoint = `/transactions/?${params.toString()}`
       const { data, error: apiError } = await apiClient.get<TransactionResponse[]>(endpoint)
 
       if (apiError) {
@@ -103,6 +104,30 @@ export function TransactionsProvider({ children }: { children: React.ReactNode }
     return true
   }
 
+  // Merge transactions pushed by the server instead of refetching
+  useEffect(() => {
+    if (!isAuthenticated) return
+    const upsert = (data: unknown) => {
+      // Events too large to push arrive without their data
+      if (data === null) {
+        fetchTransactions()
+        return
+      }
+      const transaction = data as TransactionResponse
+      setTransactions((current) =>
+        current.some((t) => t.id === transaction.id)
+          ? current.map((t) => (t.id === transaction.id ? transaction : t))
+          : [...current, transaction]
+      )
+    }
+    return apiClient.subscribe({
+      "transaction.created": upsert,
+      "transaction.updated": upsert,
+      // Sent on reconnect and when this client fell behind: pushed events were missed
+      resync: () => fetchTransactions(),
+    })
+  }, [isAuthenticated, fetchTransactions])
+
   // Clear transactions when user logs out
   useEffect(() => {
     if (!isAuthenticated) {
@@ -9,35 +9,85 @@ interface ApiResponse<T> {
 class ApiClient {
   private baseURL: string
   private token: string | null = null
+  private refreshToken: string | null = null
+  private refreshPromise: Promise<boolean> | null = null
 
   constructor(baseURL: string) {
     this.baseURL = baseURL
-    // Initialize token from localStorage if available
+    // Initialize tokens from localStorage if available
     if (typeof window !== "undefined") {
       const storedToken = localStorage.getItem("auth_token")
       if (storedToken) {
         this.token = storedToken
       }
+      const storedRefreshToken = localStorage.getItem("refresh_token")
+      if (storedRefreshToken) {
+        this.refreshToken = storedRefreshToken
+      }
     }
   }
 
-  setToken(token: string) {
+  setToken(token: string, refreshToken?: string) {
     this.token = token
+    if (refreshToken) {
+      this.refreshToken = refreshToken
+    }
     if (typeof window !== "undefined") {
       localStorage.setItem("auth_token", token)
+      if (refreshToken) {
+        localStorage.setItem("refresh_token", refreshToken)
+      }
     }
   }
 
+  getRefreshToken() {
+    return this.refreshToken
+  }
+
   clearToken() {
     this.token = null
+    this.refreshToken = null
     if (typeof window !== "undefined") {
       localStorage.removeItem("auth_token")
+      localStorage.removeItem("refresh_token")
     }
   }
 
+  // Exchange the refresh token for a new access token. Concurrent callers share one
+  // in-flight refresh so a burst of 401s only rotates the token once.
+  private async refreshAccessToken(): Promise<boolean> {
+    if (!this.refreshToken) {
+      return false
+    }
+    if (!this.refreshPromise) {
+      this.refreshPromise = (async () => {
+        try {
+          const response = await fetch(`${this.baseURL}/auth/refresh`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ refresh_token: this.refreshToken }),
+          })
+          if (!response.ok) {
+            this.clearToken()
+            return false
+          }
+          const json = await response.json()
+          this.setToken(json.access_token, json.refresh_token)
+          return true
+        } catch {
+          return false
+        } finally {
+          this.refreshPromise = null
+        }
+      })()
+    }
+    return this.refreshPromise
+  }
+
   private async request<T>(
     endpoint: string,
-    options: RequestInit = {}
+    options: RequestInit = {},
+    retryOnUnauthorized = true
   ): Promise<ApiResponse<T>> {
     const url = `${this.baseURL}${endpoint}`
     const headers: Record<string, string> = {
@@ -56,6 +106,10 @@ class ApiClient {
       })
 
       const status = response.status
+      if (status === 401 && retryOnUnauthorized && this.token && (await this.refreshAccessToken())) {
+        return this.request<T>(endpoint, options, false)
+      }
+
       let data: T | undefined
       let error: string | undefined
 
@@ -111,6 +165,19 @@ class ApiClient {
   async delete(endpoint: string): Promise<ApiResponse<void>> {
     return this.request<void>(endpoint, { method: "DELETE" })
   }
+
+  // Server-sent events for the current user. EventSource can't send headers, so the
+  // access token goes in the query string. Returns a function that closes the stream.
+  subscribe(handlers: Record<string, (data: unknown) => void>): () => void {
+    if (typeof window === "undefined" || !this.token) {
+      return () => {}
+    }
+    const source = new EventSource(`${this.baseURL}/events?access_token=${encodeURIComponent(this.token)}`)
+    for (const [type, handler] of Object.entries(handlers)) {
+      source.addEventListener(type, (event) => handler(JSON.parse((event as MessageEvent).data)))
+    }
+    return () => source.close()
+  }
 }
 
 export const apiClient = new ApiClient(API_BASE_URL)
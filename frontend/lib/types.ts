@@ -9,6 +9,7 @@ export interface UserResponse {
 
 export interface LoginResponse {
   access_token: string
+  refresh_token: string
   token_type: string
 }
 
@@ -101,18 +102,26 @@ export interface TransactionResponse {
   authorized_date?: string | null
   authorized_datetime?: string | null
   transaction_type?: string | null
+  merchant_id?: number | null
   merchant_entity_id?: string | null
   logo_url?: string | null
   website?: string | null
   custom_category_id?: number | null
   custom_subcategory_id?: number | null
+  effective_category_id?: number | null
   notes?: string | null
   tags?: string[] | null
+  split_amount?: string | null
   account?: AccountResponse | null
   custom_category?: CategoryResponse | null
   custom_subcategory?: SubcategoryResponse | null
 }
 
+export interface DuplicateClusterResponse {
+  exact: boolean
+  transactions: TransactionResponse[]
+}
+
 export interface TransactionCreate {
   amount: string | number
   date: string
@@ -123,9 +132,6 @@ export interface TransactionCreate {
   plaid_transaction_id?: string | null
   iso_currency_code?: string | null
   datetime?: string | null
-  merchant_entity_id?: string | null
-  logo_url?: string | null
-  website?: string | null
   authorized_date?: string | null
   authorized_datetime?: string | null
   transaction_type?: string | null
@@ -142,6 +148,28 @@ export interface TransactionUpdate {
   tags?: string[] | null
 }
 
+export interface TransactionSplitCreate {
+  amount: string | number
+  custom_category_id?: number | null
+  custom_subcategory_id?: number | null
+  notes?: string | null
+}
+
+export interface TransactionSplitsUpdate {
+  splits: TransactionSplitCreate[]
+}
+
+export interface TransactionSplitResponse {
+  id: number
+  transaction_id: number
+  amount: string
+  custom_category_id?: number | null
+  custom_subcategory_id?: number | null
+  effective_category_id?: number | null
+  notes?: string | null
+  created_at: string
+}
+
 // Budget types
 export interface BudgetTemplateEntryResponse {
   id: number
@@ -173,6 +201,7 @@ export interface BudgetTemplateResponse {
   month: number
   year: number
   total_budget: string
+  is_default?: boolean
   entries: BudgetTemplateEntryResponse[]
   created_at: string
   updated_at?: string | null
@@ -195,6 +224,7 @@ export interface UserBudgetSettingsResponse {
   user_id: number
   monthly_income: string
   monthly_savings_goal: string
+  alert_thresholds: number[]
   created_at: string
   updated_at?: string | null
 }
@@ -202,9 +232,54 @@ export interface UserBudgetSettingsResponse {
 export interface UserBudgetSettingsCreate {
   monthly_income: string | number
   monthly_savings_goal: string | number
+  alert_thresholds?: number[]
 }
 
 export interface UserBudgetSettingsUpdate {
   monthly_income?: string | number
   monthly_savings_goal?: string | number
+  alert_thresholds?: number[]
+}
+
+export interface BootstrapResponse {
+  year: number
+  month: number
+  user?: UserResponse
+  accounts?: AccountResponse[]
+  categories?: CategoryResponse[]
+  subcategories?: SubcategoryResponse[]
+  budget_settings?: UserBudgetSettingsResponse | null
+  budget?: BudgetTemplateResponse | null
+  transactions?: TransactionResponse[]
+}
+
+export interface SyncResponse {
+  seq: number
+  full: boolean
+  transactions: TransactionResponse[]
+  accounts: AccountResponse[]
+  categories: CategoryResponse[]
+  subcategories: SubcategoryResponse[]
+  budgets: BudgetTemplateResponse[]
+  budget_settings: UserBudgetSettingsResponse[]
+  deleted: {
+    transactions: number[]
+    accounts: number[]
+    categories: number[]
+    subcategories: number[]
+    budgets: number[]
+    budget_settings: number[]
+  }
+}
+
+export interface BudgetAlertResponse {
+  id: number
+  month: string
+  template_id?: number | null
+  category_id?: number | null
+  subcategory_id?: number | null
+  threshold: number
+  budgeted_amount: string
+  spent: string
+  created_at: string
 }
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Measure the cold-start import time of the API (`import main`).
+
+The repository keeps the package in api/app/ while the code imports it as `api`
+(the Dockerfile copies app/ to api/), so this script recreates that layout in a
+temporary directory with symlinks before importing.
+
+Usage:
+    python scripts/bench/import_time.py [--runs 5] [--max-ms 1500] [--top 15]
+
+Exits non-zero if the median import time exceeds --max-ms.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+API_DIR = os.path.join(REPO_ROOT, "api")
+
+def make_layout(tmp_dir):
+    """Symlink main.py and app/ (as api/) into tmp_dir, mirroring the Docker image"""
+    os.symlink(os.path.join(API_DIR, "main.py"), os.path.join(tmp_dir, "main.py"))
+    os.symlink(os.path.join(API_DIR, "app"), os.path.join(tmp_dir, "api"))
+
+def time_import(tmp_dir):
+    """Import main in a fresh interpreter and return the wall time in milliseconds"""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "import main"],
+        cwd=tmp_dir, check=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    return (time.perf_counter() - start) * 1000
+
+def top_imports(tmp_dir, top):
+    """Return the slowest modules by cumulative import time using -X importtime"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=tmp_dir, check=True, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), module.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median exceeds this")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules to list")
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        make_layout(tmp_dir)
+        # Warm-up run so the first measurement doesn't pay for compiling bytecode
+        time_import(tmp_dir)
+        timings = [time_import(tmp_dir) for _ in range(args.runs)]
+        slowest = top_imports(tmp_dir, args.top)
+    
+    median = statistics.median(timings)
+    print(f"import main: median {median:.0f} ms, min {min(timings):.0f} ms, max {max(timings):.0f} ms over {args.runs} runs")
+    print("\nSlowest imports (cumulative):")
+    for cumulative_us, module in slowest:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+    
+    if "plaid" in {module.split(".")[0] for _, module in slowest}:
+        print("\nWARNING: the plaid SDK is imported at startup; it should only load on first use")
+    
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\nFAIL: median import time {median:.0f} ms exceeds budget of {args.max_ms:.0f} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""Compare the default and fast (orjson) response paths for GET /transactions/.
+
+In-process mode (default) builds N synthetic transactions with an account, a
+category and a subcategory, then times:
+  - default: ORM objects -> from_attributes validation -> JSON mode dump -> json.dumps
+    (what FastAPI does for response_model=List[TransactionResponse])
+  - fast:    flat row mappings -> dicts -> orjson (api.serialization)
+
+HTTP mode (--url and --token) times a running API instead:
+    python scripts/bench/serialization.py --url http://localhost:8000 --token <JWT>
+
+Usage:
+    python scripts/bench/serialization.py [--rows 1000 5000 20000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone, timedelta
+from decimal import Decimal
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+def import_api():
+    """Make `api` importable from the repository layout (api/app is imported as api)"""
+    tmp_dir = tempfile.mkdtemp()
+    os.symlink(os.path.join(REPO_ROOT, "api", "app"), os.path.join(tmp_dir, "api"))
+    sys.path.insert(0, tmp_dir)
+
+def build_data(n):
+    """Return (orm_objects, row_mappings) describing the same n transactions"""
+    from api.models import Transaction, Account, Category, Subcategory
+    from api import serialization
+
+    now = datetime(2024, 6, 1, 12, 30, tzinfo=timezone.utc)
+    today = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    account = Account(id=1, name="Checking", official_name="Everyday Checking", type="depository",
+                      subtype="checking", mask="1234", balance_current=Decimal("1532.10"), created_at=now)
+    category = Category(id=1, name="Food", color="#FF6B6B", is_system=False, user_id=1, created_at=now)
+    subcategory = Subcategory(id=1, name="Groceries", category_id=1, is_system=False, user_id=1, created_at=now)
+    subcategory.category = category
+
+    transactions = []
+    for i in range(n):
+        transactions.append(Transaction(
+            id=i + 1, user_id=1, account_id=1, plaid_transaction_id=f"txn_{i}",
+            amount=Decimal(f"-{i % 500}.{i % 100:02d}"), iso_currency_code="USD",
+            date=today - timedelta(days=i % 700), name=f"Purchase #{i} at Store",
+            merchant_name="Store", pending=False, transaction_type="place",
+            custom_category_id=1, custom_subcategory_id=1, notes=None, tags=["weekly"],
+            account=account, custom_category=category, custom_subcategory=subcategory,
+        ))
+
+    def flatten(spec, obj):
+        return {label: getattr(obj, name) for name, label in spec.labels}
+
+    rows = []
+    for transaction in transactions:
+        mapping = flatten(serialization._TRANSACTION, transaction)
+        mapping.update(flatten(serialization._ACCOUNT, account))
+        mapping.update(flatten(serialization._CATEGORY, category))
+        mapping.update(flatten(serialization._SUBCATEGORY, subcategory))
+        mapping.update(flatten(serialization._SUBCATEGORY_CATEGORY, category))
+        rows.append(mapping)
+    return transactions, rows
+
+def bench_in_process(sizes, repeat):
+    import_api()
+    from typing import List
+    from pydantic import TypeAdapter
+    from fastapi.responses import JSONResponse
+    from api.schemas import TransactionResponse
+    from api.serialization import FastJSONResponse, transaction_row_to_dict
+
+    adapter = TypeAdapter(List[TransactionResponse])
+
+    def default_path(objects):
+        validated = adapter.validate_python(objects, from_attributes=True)
+        return JSONResponse(adapter.dump_python(validated, mode="json")).body
+
+    def fast_path(rows):
+        return FastJSONResponse([transaction_row_to_dict(row) for row in rows]).body
+
+    print(f"{'rows':>8} {'default ms':>12} {'fast ms':>10} {'speedup':>8} {'bytes':>10}")
+    for n in sizes:
+        objects, rows = build_data(n)
+        # Both paths must produce the same document
+        assert json.loads(default_path(objects)) == json.loads(fast_path(rows)), "paths disagree"
+        default_ms = timed(lambda: default_path(objects), repeat)
+        fast_ms = timed(lambda: fast_path(rows), repeat)
+        print(f"{n:>8} {default_ms:>12.1f} {fast_ms:>10.1f} {default_ms / fast_ms:>7.1f}x {len(fast_path(rows)):>10}")
+
+def bench_http(url, token, repeat):
+    def fetch(query):
+        request = urllib.request.Request(f"{url}/transactions/{query}", headers={"Authorization": f"Bearer {token}"})
+        with urllib.request.urlopen(request) as response:
+            return response.read()
+
+    size = len(fetch(""))
+    default_ms = timed(lambda: fetch(""), repeat)
+    fast_ms = timed(lambda: fetch("?fast=true"), repeat)
+    print(f"GET /transactions/ ({size} bytes): default {default_ms:.1f} ms, fast {fast_ms:.1f} ms, {default_ms / fast_ms:.1f}x")
+
+def timed(fn, repeat):
+    """Median wall time of fn in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", help="base URL of a running API (HTTP mode)")
+    parser.add_argument("--token", help="bearer token for HTTP mode")
+    args = parser.parse_args()
+
+    if args.url:
+        if not args.token:
+            parser.error("--token is required with --url")
+        bench_http(args.url.rstrip("/"), args.token, args.repeat)
+    else:
+        bench_in_process(args.rows, args.repeat)
+
+if __name__ == "__main__":
+    main()